@@ -23,6 +23,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "users",
     "materials",
@@ -109,6 +110,17 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10 MB
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5 * 1024 * 1024  # 5 MB
 
+# Загрузка файлов по частям: временный каталог, лимиты и срок хранения
+CHUNKED_UPLOAD_DIR = os.getenv("CHUNKED_UPLOAD_DIR") or os.path.join(
+    BASE_DIR, "chunked_uploads"
+)
+CHUNKED_UPLOAD_MAX_SIZES = {
+    "avatar": 2 * 1024 * 1024,  # 2 MB
+    "course_preview": 20 * 1024 * 1024,  # 20 MB
+    "lesson_preview": 20 * 1024 * 1024,  # 20 MB
+}
+CHUNKED_UPLOAD_EXPIRE_HOURS = 24
+
 
 # Для корректного отображения кириллицы в фикстурах
 DEFAULT_CHARSET = "utf-8"
@@ -129,14 +141,45 @@ REST_FRAMEWORK = {
     "PAGE_SIZE": [10],
 }
 
+# Время жизни кеша групп пользователя (проверки прав модераторов), секунды
+ROLE_CACHE_TIMEOUT = 60
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
 }
 
 # Stripe settings
-STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY", "sk_test_...")
+# Пустой ключ отключает фоновые запросы к Stripe (см. users.tasks)
+STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY", "")
 STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY", "pk_test_...")
+STRIPE_CURRENCY = os.getenv("STRIPE_CURRENCY", "rub")
+# Адрес API: для тестов можно указать локальную заглушку (stripe-mock)
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "https://api.stripe.com")
+# Таймауты подключения и чтения ответа, секунды
+STRIPE_CONNECT_TIMEOUT = float(os.getenv("STRIPE_CONNECT_TIMEOUT", 3))
+STRIPE_READ_TIMEOUT = float(os.getenv("STRIPE_READ_TIMEOUT", 15))
+# Повторы при сетевых ошибках и 409/429/5xx (с задержкой и разбросом)
+STRIPE_MAX_NETWORK_RETRIES = int(os.getenv("STRIPE_MAX_NETWORK_RETRIES", 2))
+# Размер пула постоянных соединений с API
+STRIPE_POOL_SIZE = int(os.getenv("STRIPE_POOL_SIZE", 10))
+# Блокировка создания цены по (курс или урок, сумма, валюта), секунды: должна
+# перекрывать запрос к Stripe со всеми повторами
+STRIPE_PRICE_LOCK_SECONDS = 120
+# Секрет подписи вебхука (Dashboard -> Webhooks -> Signing secret)
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET", "")
+# Сколько событий вебхука применяется к платежам за одну транзакцию
+STRIPE_EVENT_BATCH_SIZE = 500
+# Срок хранения обработанных событий: Stripe повторяет доставку до 3 дней,
+# дубликаты отсекаются по event_id, пока событие хранится
+STRIPE_EVENT_RETENTION_DAYS = 30
+# Через сколько секунд без вебхука статус ожидающего платежа запрашивается
+# у Stripe напрямую
+STRIPE_STATUS_FALLBACK_SECONDS = 900
+# Время жизни сессии оплаты (Stripe допускает от 30 минут до 24 часов)
+STRIPE_CHECKOUT_EXPIRE_MINUTES = int(os.getenv("STRIPE_CHECKOUT_EXPIRE_MINUTES", 60))
+# За сколько дней сверка ищет ожидающие платежи в списке сессий Stripe
+STRIPE_RECONCILE_MAX_DAYS = 7
 
 # DRF Spectacular settings
 SPECTACULAR_SETTINGS = {
@@ -175,11 +218,81 @@ CELERY_TASK_EAGER_PROPAGATES = True
 CELERY_WORKER_POOL = 'solo'  # Используем solo пул для Windows
 CELERY_WORKER_CONCURRENCY = 1
 
+# Сколько последних платежей вкладывается в профиль /users/me/
+PROFILE_RECENT_PAYMENTS = 5
+
+# Максимальное количество уроков в одном пакетном запросе
+LESSON_BULK_MAX_SIZE = 500
+
+# Размер пачки подписчиков в одной задаче рассылки (одно SMTP-соединение)
+COURSE_NOTIFICATION_CHUNK_SIZE = int(os.getenv("COURSE_NOTIFICATION_CHUNK_SIZE", 500))
+# Окно (в минутах), за которое изменения курса собираются в один дайджест
+COURSE_DIGEST_WINDOW_MINUTES = int(os.getenv("COURSE_DIGEST_WINDOW_MINUTES", 30))
+# Сколько строк за раз читается из серверного курсора при выгрузке курсов
+COURSE_EXPORT_CHUNK_SIZE = 2000
+# Запас (в секундах) при поиске платежей, измененных после прошлого
+# пересчета RevenueDaily: покрывает транзакции, закоммиченные позже
+REVENUE_REFRESH_OVERLAP_SECONDS = 300
+# Размер пачки при фоновом удалении курса (строк на транзакцию)
+COURSE_DELETE_BATCH_SIZE = 1000
+# Через сколько минут удаление в pending/failed ставится в очередь заново
+COURSE_DELETE_RESUME_MINUTES = 15
+
+# Дельта-синхронизация: запас по времени для параллельных транзакций и
+# срок хранения записей об удалении (старые токены получают полный снимок)
+COURSE_SYNC_OVERLAP_SECONDS = 5
+COURSE_SYNC_TOMBSTONE_DAYS = 30
+# Сколько курсов и сколько уроков отдает одна страница синхронизации
+COURSE_SYNC_PAGE_SIZE = 500
+# Ширины (px) уменьшенных копий превью курсов и уроков
+PREVIEW_VARIANT_WIDTHS = (320, 640, 1280)
+# Число строк-шардов, по которым расходятся дельты счетчиков одного курса
+COURSE_COUNTER_SHARDS = 8
+# Сколько секунд чтение без готового документа курса не ставит повторную
+# пересборку той же версии (основная постановка - при записи курса)
+COURSE_DOCUMENT_REBUILD_LOCK_SECONDS = 300
+
 CELERY_BEAT_SCHEDULE = {
     "deactivate-inactive-users-every-day": {
         "task": "users.tasks.deactivate_inactive_users",
         "schedule": crontab(hour=0, minute=0),  # каждый день в полночь
     },
+    "purge-stale-uploads-every-hour": {
+        "task": "users.tasks.purge_stale_uploads",
+        "schedule": crontab(minute=0),  # каждый час
+    },
+    "purge-tombstones-every-day": {
+        "task": "materials.tasks.purge_tombstones",
+        "schedule": crontab(hour=1, minute=0),  # каждый день в 01:00
+    },
+    "refresh-revenue-daily-every-10-minutes": {
+        "task": "users.tasks.refresh_revenue_daily",
+        "schedule": crontab(minute="*/10"),  # каждые 10 минут
+    },
+    "process-stripe-events-every-minute": {
+        "task": "users.tasks.process_stripe_events",
+        "schedule": crontab(),  # каждую минуту, если вебхук не запустил задачу
+    },
+    "reconcile-stripe-payments-every-30-minutes": {
+        "task": "users.tasks.reconcile_stripe_payments",
+        "schedule": crontab(minute="*/30"),  # каждые 30 минут
+    },
+    "purge-stripe-events-every-day": {
+        "task": "users.tasks.purge_stripe_events",
+        "schedule": crontab(hour=2, minute=0),  # каждый день в 02:00
+    },
+    "resume-course-deletions-every-10-minutes": {
+        "task": "materials.tasks.resume_course_deletions",
+        "schedule": crontab(minute="*/10"),  # каждые 10 минут
+    },
+    "send-overdue-digests-every-10-minutes": {
+        "task": "materials.tasks.send_overdue_digests",
+        "schedule": crontab(minute="*/10"),  # каждые 10 минут
+    },
+    "fold-course-counters-every-minute": {
+        "task": "materials.tasks.fold_course_counters",
+        "schedule": crontab(),  # каждую минуту
+    },
 }
 
 # Email settings
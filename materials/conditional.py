@@ -0,0 +1,146 @@
+import hashlib
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = "Объект был изменен другим запросом. Загрузите его заново."
+    default_code = "precondition_failed"
+
+
+def build_etag(*parts):
+    return quote_etag("-".join(str(part) for part in parts))
+
+
+def _timestamp(value):
+    return int(value.timestamp()) if value else None
+
+
+def _apply_stamp(response, etag, last_modified):
+    if etag:
+        response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+class ConditionalObjectMixin:
+    """
+    Условные запросы для detail-представлений моделей с полями version и
+    updated_at.
+
+    GET отдает ETag и Last-Modified и отвечает 304, если клиент прислал
+    актуальные If-None-Match/If-Modified-Since; версия читается одним
+    легким запросом, сериализатор при этом не запускается. PUT/PATCH
+    проверяют If-Match/If-Unmodified-Since (412 при расхождении), а само
+    сохранение выполняется только если версия в базе не изменилась с момента
+    чтения (compare-and-swap без блокировок строк).
+    """
+
+    # Поля, из которых собирается ETag; доступны и в values(), и у объекта
+    etag_fields = ("pk", "version")
+
+    def get_stamp_queryset(self):
+        return self.get_queryset()
+
+    def build_object_etag(self, source):
+        if isinstance(source, dict):
+            return build_etag(*(source[field] for field in self.etag_fields))
+        return build_etag(*(getattr(source, field) for field in self.etag_fields))
+
+    def get_object_stamp(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = (
+            self.get_stamp_queryset()
+            .filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+            .values(*self.etag_fields, "updated_at")
+            .first()
+        )
+        self.object_stamp = row
+        if row is None:
+            return None, None
+        return self.build_object_etag(row), _timestamp(row["updated_at"])
+
+    def retrieve(self, request, *args, **kwargs):
+        etag, last_modified = self.get_object_stamp()
+        if etag is not None:
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is not None:
+                return _apply_stamp(response, etag, last_modified)
+        response = super().retrieve(request, *args, **kwargs)
+        return _apply_stamp(response, etag, last_modified)
+
+    def update(self, request, *args, **kwargs):
+        etag, last_modified = self.get_object_stamp()
+        if etag is not None:
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is not None:
+                return response
+        response = super().update(request, *args, **kwargs)
+        instance = self.updated_instance
+        return _apply_stamp(
+            response,
+            self.build_object_etag(instance),
+            _timestamp(instance.updated_at),
+        )
+
+    def perform_update(self, serializer):
+        instance = serializer.instance
+        with transaction.atomic():
+            claimed = (
+                type(instance)
+                .objects.filter(pk=instance.pk, version=instance.version)
+                .update(version=F("version") + 1)
+            )
+            if not claimed:
+                raise PreconditionFailed()
+            self.updated_instance = serializer.save()
+
+
+class ConditionalListMixin:
+    """
+    ETag для списков. Отпечаток списка считается одним агрегирующим
+    запросом (количество, сумма версий, последнее изменение) и учитывает
+    параметры запроса, поэтому у каждой страницы свой ETag.
+
+    Last-Modified списку не выдается: Max(updated_at) не растет, когда
+    объект удаляют или он выпадает из фильтра, и If-Modified-Since вернул
+    бы устаревший 304. Удаление меняет количество, а значит и ETag.
+    """
+
+    def get_stamp_queryset(self):
+        return self.get_queryset()
+
+    def get_list_aggregates(self):
+        return {
+            "count": Count("pk"),
+            "versions": Sum("version"),
+            "last_modified": Max("updated_at"),
+        }
+
+    def get_list_stamp(self):
+        queryset = self.filter_queryset(self.get_stamp_queryset())
+        summary = queryset.order_by().aggregate(**self.get_list_aggregates())
+        fingerprint = "|".join(
+            [self.request.get_full_path()]
+            + [f"{key}={summary[key]}" for key in sorted(summary)]
+        )
+        return build_etag(hashlib.md5(fingerprint.encode()).hexdigest())
+
+    def list(self, request, *args, **kwargs):
+        etag = self.get_list_stamp()
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            return _apply_stamp(response, etag, None)
+        response = super().list(request, *args, **kwargs)
+        return _apply_stamp(response, etag, None)
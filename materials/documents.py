@@ -0,0 +1,126 @@
+import json
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+from .models import Course, CourseDocument
+from .serializers import CourseSerializer
+
+# Поля, которые меняются без подъема версии курса (свертка шардов) или
+# зависят от пользователя. В документ не попадают, а дописываются к нему
+# при каждом ответе из строки, которую уже прочитал ConditionalObjectMixin.
+DOCUMENT_VOLATILE_FIELDS = ("subscriber_count", "paid_revenue", "is_subscribed")
+
+# Стоит в документе на месте хоста перед относительными ссылками на медиафайлы.
+# JSONRenderer всегда экранирует управляющие символы в строках, поэтому
+# пользовательский текст получить этот байт не может.
+MEDIA_HOST_MARK = b"\x01"
+
+
+class _MarkingRequest:
+    """
+    Заглушка request для сериализатора: вместо хоста ставит перед
+    относительной ссылкой случайную метку, которую render_course_document
+    после сериализации заменяет на MEDIA_HOST_MARK.
+    """
+
+    def __init__(self, marker):
+        self.marker = marker
+
+    def build_absolute_uri(self, location):
+        if location.startswith("/"):
+            return self.marker + location
+        return location
+
+
+def render_course_document(course):
+    """
+    JSON курса с уроками в том же виде, что у CourseSerializer, без
+    DOCUMENT_VOLATILE_FIELDS. Собирается без запроса, поэтому вместо хоста в
+    ссылках на медиафайлы стоит MEDIA_HOST_MARK - хост подставляется при
+    отдаче.
+    """
+    marker = secrets.token_hex(16)
+    context = {"request": _MarkingRequest(marker)}
+    data = CourseSerializer(course, context=context).data
+    for field in DOCUMENT_VOLATILE_FIELDS:
+        data.pop(field, None)
+    return JSONRenderer().render(data).replace(marker.encode(), MEDIA_HOST_MARK)
+
+
+def build_course_document(course_id):
+    """Собирает и сохраняет документ курса; None, если курса нет"""
+    course = Course.objects.with_api_annotations(None).filter(pk=course_id).first()
+    if course is None:
+        return None
+    CourseDocument.objects.store(
+        course.pk, course.version, render_course_document(course)
+    )
+    return course.version
+
+
+def request_course_document(course_id, version):
+    """
+    Страховочная пересборка со стороны чтения, если задача из записи
+    потерялась. cache.add атомарен, поэтому поток промахов по одной версии
+    ставит не больше одной задачи за COURSE_DOCUMENT_REBUILD_LOCK_SECONDS.
+    """
+    from .tasks import build_course_document as build_task
+
+    key = f"course-document-build:{course_id}:{version}"
+    if cache.add(key, 1, settings.COURSE_DOCUMENT_REBUILD_LOCK_SECONDS):
+        build_task.delay(course_id)
+
+
+def complete_course_document(body, stamp, request):
+    """
+    Дописывает к сохраненному документу изменчивые поля и абсолютные ссылки.
+    Работа - замена байтов и склейка строк, без разбора JSON, поэтому время
+    ответа не зависит от числа уроков в курсе.
+    """
+    host = request.build_absolute_uri("/")[:-1]
+    body = body.replace(MEDIA_HOST_MARK, host.encode())
+    volatile = json.dumps(
+        {
+            "subscriber_count": stamp["subscriber_count"],
+            "paid_revenue": str(stamp["paid_revenue"]),
+            "is_subscribed": stamp["annotated_is_subscribed"],
+        },
+        separators=(",", ":"),
+    ).encode()
+    return body[:-1] + b"," + volatile[1:]
+
+
+class CourseDocumentMixin:
+    """
+    Отдает detail курса из CourseDocument, минуя сериализатор. Ставится в
+    MRO после ConditionalObjectMixin: тот уже прочитал версию и счетчики
+    курса в object_stamp. Устаревший или отсутствующий документ - обычный
+    ответ сериализатора; пересборку ставит запись курса, а чтение - только
+    страховочно и не чаще раза на версию (request_course_document).
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        stamp = getattr(self, "object_stamp", None)
+        if stamp is None or request.accepted_renderer.format != "json":
+            return super().retrieve(request, *args, **kwargs)
+
+        # Строка stamp выбрана из get_stamp_queryset, где уже отфильтрованы
+        # чужие курсы, поэтому отдельная проверка прав объекта не нужна
+        body = (
+            CourseDocument.objects.filter(
+                course_id=stamp["pk"], version=stamp["version"]
+            )
+            .values_list("body", flat=True)
+            .first()
+        )
+        if body is None:
+            request_course_document(stamp["pk"], stamp["version"])
+            return super().retrieve(request, *args, **kwargs)
+        return HttpResponse(
+            complete_course_document(bytes(body), stamp, request),
+            content_type="application/json",
+        )
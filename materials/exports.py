@@ -0,0 +1,86 @@
+import csv
+from itertools import groupby
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+COURSE_FIELDS = ("id", "name", "description", "lesson_count", "updated_at")
+LESSON_FIELDS = ("id", "name", "description", "video_url", "updated_at")
+
+# Сколько байт копить перед отдачей клиенту: меньше системных вызовов,
+# но ответ все равно уходит непрерывно
+FLUSH_SIZE = 64 * 1024
+
+
+def iter_course_rows(courses):
+    """
+    Курсы с уроками одним запросом (LEFT JOIN) через серверный курсор:
+    в памяти одновременно только пачка из COURSE_EXPORT_CHUNK_SIZE строк.
+    Возвращает пары (курс, список уроков), уроки курса идут подряд.
+    """
+    rows = (
+        courses.order_by("id", "lessons__name", "lessons__id")
+        .values_list(
+            *COURSE_FIELDS, *(f"lessons__{field}" for field in LESSON_FIELDS)
+        )
+        .iterator(chunk_size=settings.COURSE_EXPORT_CHUNK_SIZE)
+    )
+    course_size = len(COURSE_FIELDS)
+    for course_row, group in groupby(rows, key=lambda row: row[:course_size]):
+        course = dict(zip(COURSE_FIELDS, course_row))
+        lessons = [
+            dict(zip(LESSON_FIELDS, row[course_size:]))
+            for row in group
+            if row[course_size] is not None
+        ]
+        yield course, lessons
+
+
+def _buffered(chunks):
+    buffer, size = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= FLUSH_SIZE:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def stream_ndjson(courses):
+    """Одна строка JSON на курс, уроки вложены списком"""
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    return _buffered(
+        encoder.encode({**course, "lessons": lessons}) + "\n"
+        for course, lessons in iter_course_rows(courses)
+    )
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(courses):
+    """Одна строка CSV на урок; курс без уроков - строка с пустыми полями урока"""
+    writer = csv.writer(_Echo())
+    header = [f"course_{field}" for field in COURSE_FIELDS] + [
+        f"lesson_{field}" for field in LESSON_FIELDS
+    ]
+
+    def rows():
+        yield writer.writerow(header)
+        empty_lesson = [""] * len(LESSON_FIELDS)
+        for course, lessons in iter_course_rows(courses):
+            course_values = [course[field] for field in COURSE_FIELDS]
+            if not lessons:
+                yield writer.writerow(course_values + empty_lesson)
+            for lesson in lessons:
+                yield writer.writerow(
+                    course_values + [lesson[field] for field in LESSON_FIELDS]
+                )
+
+    return _buffered(rows())
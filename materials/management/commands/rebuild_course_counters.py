@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from materials.models import Course
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счетчики курсов (уроки, подписчики, выручка)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--course", type=int, nargs="*", help="ID курсов (по умолчанию все)"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Сколько курсов пересчитывать одним запросом",
+        )
+
+    def handle(self, *args, **options):
+        courses = Course.objects.order_by("pk")
+        if options["course"]:
+            courses = courses.filter(pk__in=options["course"])
+        course_ids = list(courses.values_list("pk", flat=True))
+
+        batch_size = options["batch_size"]
+        updated = 0
+        for start in range(0, len(course_ids), batch_size):
+            batch = course_ids[start : start + batch_size]
+            updated += Course.objects.filter(pk__in=batch).rebuild_counters()
+
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано курсов: {updated}"))
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0005_course_updated_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="course",
+            options={
+                "ordering": ["name", "id"],
+                "verbose_name": "Курс",
+                "verbose_name_plural": "Курсы",
+            },
+        ),
+        migrations.AlterModelOptions(
+            name="lesson",
+            options={
+                "ordering": ["name", "id"],
+                "verbose_name": "Урок",
+                "verbose_name_plural": "Уроки",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(
+                fields=["owner", "name", "id"], name="course_owner_name_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="lesson",
+            index=models.Index(
+                fields=["owner", "name", "id"], name="lesson_owner_name_id_idx"
+            ),
+        ),
+    ]
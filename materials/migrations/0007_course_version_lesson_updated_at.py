@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0006_alter_course_options_alter_lesson_options_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="version",
+            field=models.PositiveIntegerField(default=1, verbose_name="Версия"),
+        ),
+        migrations.AddField(
+            model_name="lesson",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, verbose_name="Время обновления"),
+        ),
+        migrations.AddField(
+            model_name="lesson",
+            name="version",
+            field=models.PositiveIntegerField(default=1, verbose_name="Версия"),
+        ),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0007_course_version_lesson_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CourseDigest",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("window_start", models.DateTimeField(verbose_name="Начало окна")),
+                (
+                    "sent_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Время отправки"
+                    ),
+                ),
+                (
+                    "course",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="digests",
+                        to="materials.course",
+                        verbose_name="Курс",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Дайджест обновлений",
+                "verbose_name_plural": "Дайджесты обновлений",
+            },
+        ),
+        migrations.CreateModel(
+            name="CourseChangeEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "material_type",
+                    models.CharField(
+                        choices=[("course", "Курс"), ("lesson", "Урок")],
+                        max_length=20,
+                        verbose_name="Тип материала",
+                    ),
+                ),
+                (
+                    "material_title",
+                    models.CharField(max_length=255, verbose_name="Материал"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Время изменения"
+                    ),
+                ),
+                (
+                    "digest",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="events",
+                        to="materials.coursedigest",
+                        verbose_name="Дайджест",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Изменение курса",
+                "verbose_name_plural": "Изменения курсов",
+                "ordering": ["created_at", "id"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="coursedigest",
+            constraint=models.UniqueConstraint(
+                fields=("course", "window_start"), name="unique_course_digest_window"
+            ),
+        ),
+    ]
@@ -0,0 +1,118 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:10
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Course = apps.get_model("materials", "Course")
+    Lesson = apps.get_model("materials", "Lesson")
+    Subscription = apps.get_model("materials", "Subscription")
+    Payment = apps.get_model("users", "Payment")
+
+    def total(queryset, aggregate, default=0):
+        return Coalesce(
+            Subquery(
+                queryset.filter(course=OuterRef("pk"))
+                .order_by()
+                .values("course")
+                .annotate(total=aggregate)
+                .values("total")
+            ),
+            Value(default),
+        )
+
+    Course.objects.update(
+        lesson_count=total(Lesson.objects, Count("pk")),
+        subscriber_count=total(Subscription.objects, Count("pk")),
+        paid_revenue=total(
+            Payment.objects.filter(payment_status="paid"),
+            Sum("amount"),
+            Decimal("0"),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0009_search_vector"),
+        ("users", "0004_payment_item_title"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="lesson_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Количество уроков"
+            ),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="paid_revenue",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=Decimal("0"),
+                max_digits=12,
+                verbose_name="Выручка по оплатам курса",
+            ),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="subscriber_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Количество подписчиков"
+            ),
+        ),
+        migrations.CreateModel(
+            name="CourseCounterShard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("shard", models.PositiveSmallIntegerField(verbose_name="Шард")),
+                (
+                    "subscribers",
+                    models.IntegerField(default=0, verbose_name="Подписчики"),
+                ),
+                (
+                    "revenue",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("0"),
+                        max_digits=12,
+                        verbose_name="Выручка",
+                    ),
+                ),
+                (
+                    "course",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="counter_shards",
+                        to="materials.course",
+                        verbose_name="Курс",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Шард счетчиков курса",
+                "verbose_name_plural": "Шарды счетчиков курсов",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("course", "shard"), name="unique_course_counter_shard"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0010_course_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="preview_variants",
+            field=models.JSONField(
+                blank=True, default=dict, verbose_name="Уменьшенные копии превью"
+            ),
+        ),
+        migrations.AddField(
+            model_name="lesson",
+            name="preview_variants",
+            field=models.JSONField(
+                blank=True, default=dict, verbose_name="Уменьшенные копии превью"
+            ),
+        ),
+    ]
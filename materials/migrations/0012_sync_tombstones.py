@@ -0,0 +1,80 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0011_preview_variants"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Tombstone",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "material_type",
+                    models.CharField(
+                        choices=[("course", "Курс"), ("lesson", "Урок")],
+                        max_length=20,
+                        verbose_name="Тип материала",
+                    ),
+                ),
+                (
+                    "object_id",
+                    models.PositiveBigIntegerField(verbose_name="ID материала"),
+                ),
+                (
+                    "deleted_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Время удаления"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Удаленный материал",
+                "verbose_name_plural": "Удаленные материалы",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(
+                fields=["owner", "updated_at"], name="course_owner_updated_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="lesson",
+            index=models.Index(
+                fields=["owner", "updated_at"], name="lesson_owner_updated_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="tombstone",
+            name="owner",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="tombstones",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Владелец",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tombstone",
+            index=models.Index(
+                fields=["owner", "deleted_at"], name="tombstone_owner_deleted_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0012_sync_tombstones"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CourseDocument",
+            fields=[
+                (
+                    "course",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="document",
+                        serialize=False,
+                        to="materials.course",
+                        verbose_name="Курс",
+                    ),
+                ),
+                ("version", models.PositiveIntegerField(verbose_name="Версия курса")),
+                ("body", models.BinaryField(verbose_name="JSON курса")),
+                (
+                    "built_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Время сборки"),
+                ),
+            ],
+            options={
+                "verbose_name": "Документ курса",
+                "verbose_name_plural": "Документы курсов",
+            },
+        ),
+    ]
@@ -0,0 +1,119 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0013_course_document"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="deleted_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Время удаления"
+            ),
+        ),
+        migrations.CreateModel(
+            name="CourseDeletion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("course_id", models.PositiveBigIntegerField(verbose_name="ID курса")),
+                (
+                    "course_name",
+                    models.CharField(max_length=255, verbose_name="Название курса"),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "В очереди"),
+                            ("running", "Выполняется"),
+                            ("done", "Завершено"),
+                            ("failed", "Ошибка"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "payments_total",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Платежей к отвязке"
+                    ),
+                ),
+                (
+                    "payments_done",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Отвязано платежей"
+                    ),
+                ),
+                (
+                    "subscriptions_total",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Подписок к удалению"
+                    ),
+                ),
+                (
+                    "subscriptions_done",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Удалено подписок"
+                    ),
+                ),
+                (
+                    "lessons_total",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Уроков к удалению"
+                    ),
+                ),
+                (
+                    "lessons_done",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Удалено уроков"
+                    ),
+                ),
+                ("error", models.TextField(blank=True, verbose_name="Ошибка")),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Время создания"
+                    ),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Время завершения"
+                    ),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="course_deletions",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Владелец",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Удаление курса",
+                "verbose_name_plural": "Удаления курсов",
+                "ordering": ["-created_at"],
+            },
+        ),
+    ]
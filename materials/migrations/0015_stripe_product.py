@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0014_course_deletion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="stripe_product_id",
+            field=models.CharField(
+                blank=True,
+                max_length=255,
+                null=True,
+                verbose_name="ID продукта в Stripe",
+            ),
+        ),
+        migrations.AddField(
+            model_name="lesson",
+            name="stripe_product_id",
+            field=models.CharField(
+                blank=True,
+                max_length=255,
+                null=True,
+                verbose_name="ID продукта в Stripe",
+            ),
+        ),
+    ]
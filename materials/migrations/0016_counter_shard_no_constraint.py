@@ -0,0 +1,25 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0015_stripe_product"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="coursecountershard",
+            name="course",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="counter_shards",
+                to="materials.course",
+                verbose_name="Курс",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def clear_documents(apps, schema_editor):
+    # Документы старого формата без MEDIA_HOST_MARK: при чтении отдается
+    # ответ сериализатора, а документ пересобирается заново
+    apps.get_model("materials", "CourseDocument").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0016_counter_shard_no_constraint"),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_documents, migrations.RunPython.noop),
+    ]
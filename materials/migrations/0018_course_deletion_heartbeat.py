@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0017_clear_course_documents"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="coursedeletion",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, verbose_name="Время обновления"),
+        ),
+    ]
@@ -1,13 +1,333 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
 from django.conf import \
     settings  # Используем settings для ссылки на модель пользователя
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, SearchVectorField)
+from django.db import connections, models, transaction
+from django.db.models import (Count, DecimalField, Exists, F, FloatField,
+                              OuterRef, Prefetch, Q, Subquery, Sum, Value)
+from django.db.models.functions import Cast, Coalesce
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+
+SEARCH_CONFIGS = ("russian", "english")
+
+
+def rebuild_course_documents(course_ids):
+    """После коммита ставит в очередь пересборку CourseDocument курсов"""
+    from .tasks import build_course_document
+
+    for course_id in sorted(set(course_ids)):
+        transaction.on_commit(
+            lambda course_id=course_id: build_course_document.delay(course_id)
+        )
+
+
+class SearchQuerySet(models.QuerySet):
+    def search(self, text):
+        """
+        Полнотекстовый поиск по search_vector (GIN-индекс) с аннотацией rank.
+
+        Запрос разбирается в синтаксисе websearch ("фразы", -исключения, or)
+        в каждой из SEARCH_CONFIGS. rank приводится к double precision, чтобы
+        значение в курсоре пагинации точно совпадало со значением в базе.
+        """
+        query = None
+        for config in SEARCH_CONFIGS:
+            config_query = SearchQuery(text, config=config, search_type="websearch")
+            query = config_query if query is None else query | config_query
+        return self.filter(search_vector=query).annotate(
+            rank=Cast(SearchRank(F("search_vector"), query), FloatField())
+        )
+
+
+class SearchManager(models.Manager.from_queryset(SearchQuerySet)):
+    def get_queryset(self):
+        # tsvector нужен только базе для поиска, в выборки его не тянем
+        return super().get_queryset().defer("search_vector")
+
+
+class CourseQuerySet(SearchQuerySet):
+    def with_subscription(self, user):
+        """Аннотирует курсы флагом annotated_is_subscribed для пользователя"""
+        if user is not None and user.is_authenticated:
+            is_subscribed = Exists(
+                Subscription.objects.filter(course=OuterRef("pk"), user=user)
+            )
+        else:
+            is_subscribed = Value(False)
+        return self.annotate(annotated_is_subscribed=is_subscribed)
+
+    def with_api_annotations(self, user):
+        """
+        Аннотирует курсы данными для CourseSerializer, чтобы страница курсов
+        загружалась фиксированным числом запросов: подписка пользователя
+        (Exists) и заранее загруженные уроки. Счетчики хранятся в самом курсе.
+        """
+        return self.with_subscription(user).prefetch_related(
+            Prefetch("lessons", queryset=Lesson.objects.order_by("name", "id"))
+        )
+
+    def touch(self, **deltas):
+        """
+        Поднимает версию курсов. Вызывается при изменении уроков, чтобы ETag
+        курса учитывал вложенные уроки. deltas - приращения счетчиков в том же
+        UPDATE, например touch(lesson_count=1).
+        """
+        counters = {field: F(field) + delta for field, delta in deltas.items()}
+        return self.update(
+            version=F("version") + 1, updated_at=timezone.now(), **counters
+        )
+
+    def touch_lessons(self, deltas):
+        """
+        Поднимает версию курсов и меняет lesson_count по словарю
+        {course_id: изменение числа уроков}. Курсы без изменения числа уроков
+        обновляются одним запросом, строки блокируются в порядке id.
+        """
+        unchanged = sorted(pk for pk, delta in deltas.items() if not delta)
+        if unchanged:
+            self.filter(pk__in=unchanged).touch()
+        for pk in sorted(pk for pk, delta in deltas.items() if delta):
+            self.filter(pk=pk).touch(lesson_count=deltas[pk])
+        rebuild_course_documents(deltas)
+
+    def rebuild_counters(self):
+        """
+        Пересчитывает счетчики курсов по исходным таблицам (ремонт расхождений).
+
+        Еще не свернутые дельты из CourseCounterShard вычитаются в том же
+        UPDATE: подписка/платеж и их дельта пишутся в одной транзакции, поэтому
+        в снимке одного запроса они видны либо вместе, либо никак, и пересчет
+        безопасен при параллельной нагрузке.
+        """
+        from users.models import Payment
+
+        def total(queryset, aggregate, output_field):
+            return Coalesce(
+                Subquery(
+                    queryset.order_by()
+                    .values("course")
+                    .annotate(total=aggregate)
+                    .values("total")
+                ),
+                Value(0),
+                output_field=output_field,
+            )
+
+        count_field = models.IntegerField()
+        money_field = DecimalField(max_digits=12, decimal_places=2)
+        shards = CourseCounterShard.objects.filter(course=OuterRef("pk"))
+        return self.update(
+            lesson_count=total(
+                Lesson.objects.filter(course=OuterRef("pk")), Count("pk"), count_field
+            ),
+            subscriber_count=total(
+                Subscription.objects.filter(course=OuterRef("pk")),
+                Count("pk"),
+                count_field,
+            )
+            - total(shards, Sum("subscribers"), count_field),
+            paid_revenue=total(
+                Payment.objects.filter(course=OuterRef("pk"), payment_status="paid"),
+                Sum("amount"),
+                money_field,
+            )
+            - total(shards, Sum("revenue"), money_field),
+        )
+
+
+class CourseManager(SearchManager.from_queryset(CourseQuerySet)):
+    def get_queryset(self):
+        # Курсы, поставленные в очередь на удаление, скрыты сразу
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+class LessonManager(SearchManager):
+    def get_queryset(self):
+        # Уроки скрытого курса скрываются вместе с ним
+        return super().get_queryset().filter(course__deleted_at__isnull=True)
+
+
+def search_vector_expression():
+    """
+    tsvector по названию (вес A) и описанию (вес B) во всех SEARCH_CONFIGS:
+    контент в основном русский, но встречаются английские термины.
+    """
+    vector = None
+    for config in SEARCH_CONFIGS:
+        config_vector = SearchVector(
+            "name", weight="A", config=config
+        ) + SearchVector("description", weight="B", config=config)
+        vector = config_vector if vector is None else vector + config_vector
+    return vector
+
+
+def refresh_payment_titles(**filters):
+    """Обновляет денормализованные названия в платежах после переименования"""
+    from users.models import Payment
+
+    Payment.objects.filter(**filters).refresh_item_titles()
+
+
+class NamedMaterialMixin:
+    """Отслеживает переименование, чтобы обновить item_title в платежах"""
+
+    payment_lookup = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_name = instance.__dict__.get("name")
+        return instance
+
+    def sync_payment_titles(self):
+        loaded_name = getattr(self, "_loaded_name", None)
+        if loaded_name is not None and loaded_name != self.name:
+            refresh_payment_titles(**{self.payment_lookup: self.pk})
+        self._loaded_name = self.name
+
+
+class PreviewVariantsMixin:
+    """
+    После загрузки нового превью сбрасывает preview_variants и после коммита
+    ставит в очередь generate_preview_variants: запрос загрузки не ждет
+    обработки изображения.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_preview = instance.__dict__.get("preview") or ""
+        return instance
+
+    def preview_changed(self):
+        if not self.preview._committed:
+            return True
+        return (self.preview.name or "") != getattr(self, "_loaded_preview", "")
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        changed = (
+            update_fields is None or "preview" in update_fields
+        ) and self.preview_changed()
+        if changed:
+            self.preview_variants = {}
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "preview_variants"}
+        with transaction.atomic():
+            old_variants = {}
+            if changed and not self._state.adding:
+                # Строка заблокирована до коммита, поэтому generate_preview_variants
+                # не успеет записать варианты старого превью после этого чтения
+                old_variants = (
+                    type(self)._base_manager.select_for_update()
+                    .filter(pk=self.pk)
+                    .values_list("preview_variants", flat=True)
+                    .first()
+                )
+            super().save(*args, **kwargs)
+        self._loaded_preview = self.preview.name or ""
+        from .tasks import generate_preview_variants, remove_preview_variants
+
+        if old_variants:
+            transaction.on_commit(lambda: remove_preview_variants.delay(old_variants))
+        if changed and self.preview:
+            task_args = (self._meta.label, self.pk, self.preview.name)
+            transaction.on_commit(
+                lambda: generate_preview_variants.delay(*task_args)
+            )
+
+    @classmethod
+    def store_preview_variants(cls, pk, source_name, variants):
+        """
+        Сохраняет готовые варианты, только если превью не успели заменить,
+        и поднимает версию, чтобы ETag учел новые ссылки.
+        """
+        with transaction.atomic():
+            updated = cls.objects.filter(pk=pk, preview=source_name).update(
+                preview_variants=variants,
+                version=F("version") + 1,
+                updated_at=timezone.now(),
+            )
+            if updated:
+                cls.preview_variants_stored(pk)
+        return updated
+
+    @classmethod
+    def preview_variants_stored(cls, pk):
+        pass
+
+
+class StripeProductMixin:
+    """
+    Держит продукт Stripe курса или урока в актуальном состоянии: после
+    создания или изменения названия/описания задача
+    provision_stripe_product создает или обновляет продукт в фоне, и
+    оформление оплаты не тратит на это запросы к Stripe.
+    """
+
+    stripe_fields = ("name", "description")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_stripe_fields = instance.get_stripe_fields()
+        return instance
+
+    def get_stripe_fields(self):
+        return tuple(self.__dict__.get(field) for field in self.stripe_fields)
 
+    @classmethod
+    def provision_stripe_products(cls, pks):
+        from users.tasks import provision_stripe_product
 
-class Course(models.Model):
+        for pk in pks:
+            transaction.on_commit(
+                lambda pk=pk: provision_stripe_product.delay(cls._meta.label, pk)
+            )
+
+    def save(self, *args, **kwargs):
+        loaded = getattr(self, "_loaded_stripe_fields", None)
+        super().save(*args, **kwargs)
+        current = self.get_stripe_fields()
+        if current != loaded:
+            self.provision_stripe_products([self.pk])
+        self._loaded_stripe_fields = current
+
+
+class VersionedModel(models.Model):
+    """Модель с версией, которая увеличивается при каждом сохранении"""
+
+    version = models.PositiveIntegerField(default=1, verbose_name="Версия")
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.version += 1
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "version"}
+        super().save(*args, **kwargs)
+
+
+class Course(
+    NamedMaterialMixin, PreviewVariantsMixin, StripeProductMixin, VersionedModel
+):
     name = models.CharField(max_length=255, verbose_name="Название")
     preview = models.ImageField(
         upload_to="course_previews/", null=True, blank=True, verbose_name="Превью"
     )
+    preview_variants = models.JSONField(
+        default=dict, blank=True, verbose_name="Уменьшенные копии превью"
+    )
     description = models.TextField(verbose_name="Описание")
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -17,22 +337,88 @@ class Course(models.Model):
         default=1,
     )
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Время обновления")
+    search_vector = models.GeneratedField(
+        expression=search_vector_expression(),
+        output_field=SearchVectorField(),
+        db_persist=True,
+        verbose_name="Поисковый вектор",
+    )
+    # Денормализованные счетчики. lesson_count меняется вместе с версией
+    # курса, подписчики и выручка копятся в CourseCounterShard и
+    # сворачиваются сюда периодической задачей fold_course_counters.
+    lesson_count = models.PositiveIntegerField(
+        default=0, verbose_name="Количество уроков"
+    )
+    subscriber_count = models.PositiveIntegerField(
+        default=0, verbose_name="Количество подписчиков"
+    )
+    paid_revenue = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal("0"),
+        verbose_name="Выручка по оплатам курса",
+    )
+    # Время постановки в очередь на удаление (CourseDeletion); такой курс
+    # скрыт из Course.objects, пока задача purge_course удаляет его части
+    deleted_at = models.DateTimeField(
+        null=True, blank=True, verbose_name="Время удаления"
+    )
+    stripe_product_id = models.CharField(
+        max_length=255, blank=True, null=True, verbose_name="ID продукта в Stripe"
+    )
+
+    objects = CourseManager()
+    all_objects = SearchManager.from_queryset(CourseQuerySet)()
+    payment_lookup = "course"
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.sync_payment_titles()
+            rebuild_course_documents([self.pk])
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            # Уроки удаляются каскадом, минуя Lesson.delete()
+            Tombstone.objects.record(
+                "lesson", self.lessons.values_list("pk", "owner_id")
+            )
+            Tombstone.objects.record("course", [(self.pk, self.owner_id)])
+            return super().delete(*args, **kwargs)
+
+    @classmethod
+    def preview_variants_stored(cls, pk):
+        rebuild_course_documents([pk])
+
     class Meta:
         verbose_name = "Курс"
         verbose_name_plural = "Курсы"
-        ordering = ["name"]
+        ordering = ["name", "id"]
+        indexes = [
+            models.Index(
+                fields=["owner", "name", "id"], name="course_owner_name_id_idx"
+            ),
+            models.Index(
+                fields=["owner", "updated_at"], name="course_owner_updated_idx"
+            ),
+            GinIndex(fields=["search_vector"], name="course_search_vector_idx"),
+        ]
 
 
-class Lesson(models.Model):
+class Lesson(
+    NamedMaterialMixin, PreviewVariantsMixin, StripeProductMixin, VersionedModel
+):
     name = models.CharField(max_length=255, verbose_name="Название")
     description = models.TextField(verbose_name="Описание")
     preview = models.ImageField(
         upload_to="lesson_previews/", null=True, blank=True, verbose_name="Превью"
     )
+    preview_variants = models.JSONField(
+        default=dict, blank=True, verbose_name="Уменьшенные копии превью"
+    )
     video_url = models.URLField(verbose_name="Ссылка на видео")
     course = models.ForeignKey(
         Course, on_delete=models.CASCADE, related_name="lessons", verbose_name="Курс"
@@ -43,14 +429,154 @@ class Lesson(models.Model):
         related_name="lessons",
         verbose_name="Владелец",
     )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Время обновления")
+    search_vector = models.GeneratedField(
+        expression=search_vector_expression(),
+        output_field=SearchVectorField(),
+        db_persist=True,
+        verbose_name="Поисковый вектор",
+    )
+    stripe_product_id = models.CharField(
+        max_length=255, blank=True, null=True, verbose_name="ID продукта в Stripe"
+    )
+
+    objects = LessonManager()
+    all_objects = SearchManager()
+    payment_lookup = "lesson"
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем исходный курс, чтобы при переносе урока обновить оба курса
+        instance._loaded_course_id = instance.__dict__.get("course_id")
+        return instance
+
+    def save(self, *args, **kwargs):
+        loaded_course_id = getattr(self, "_loaded_course_id", None)
+        if self._state.adding:
+            deltas = {self.course_id: 1}
+        elif loaded_course_id not in (None, self.course_id):
+            deltas = {loaded_course_id: -1, self.course_id: 1}
+        else:
+            deltas = {self.course_id: 0}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Course.objects.touch_lessons(deltas)
+            self.sync_payment_titles()
+        self._loaded_course_id = self.course_id
+
+    def delete(self, *args, **kwargs):
+        course_id = self.course_id
+        with transaction.atomic():
+            Tombstone.objects.record("lesson", [(self.pk, self.owner_id)])
+            result = super().delete(*args, **kwargs)
+            Course.objects.filter(pk=course_id).touch(lesson_count=-1)
+            rebuild_course_documents([course_id])
+        return result
+
+    @classmethod
+    def preview_variants_stored(cls, pk):
+        # Уроки вложены в ответ курса, поэтому ETag и документ курса тоже
+        # меняются
+        course_ids = Lesson.objects.filter(pk=pk).values_list("course_id", flat=True)
+        Course.objects.touch_lessons(dict.fromkeys(course_ids, 0))
+
     class Meta:
         verbose_name = "Урок"
         verbose_name_plural = "Уроки"
-        ordering = ["name"]
+        ordering = ["name", "id"]
+        indexes = [
+            models.Index(
+                fields=["owner", "name", "id"], name="lesson_owner_name_id_idx"
+            ),
+            models.Index(
+                fields=["owner", "updated_at"], name="lesson_owner_updated_idx"
+            ),
+            GinIndex(fields=["search_vector"], name="lesson_search_vector_idx"),
+        ]
+
+
+class SubscriptionQuerySet(models.QuerySet):
+    def toggle(self, user, course_id):
+        """
+        Переключает подписку одним SQL-запросом: DELETE ... RETURNING, а если
+        удалять было нечего - INSERT ... ON CONFLICT DO NOTHING. Параллельные
+        повторные нажатия не приводят к IntegrityError. Дельта счетчика
+        подписчиков пишется в шард в той же транзакции.
+
+        Возвращает "deleted", "created" или None, если курса не существует.
+        """
+        sql = f"""
+            WITH deleted AS (
+                DELETE FROM {Subscription._meta.db_table}
+                WHERE user_id = %(user_id)s AND course_id = %(course_id)s
+                RETURNING id
+            ), inserted AS (
+                INSERT INTO {Subscription._meta.db_table} (user_id, course_id, created_at)
+                SELECT %(user_id)s, course.id, NOW()
+                FROM {Course._meta.db_table} AS course
+                WHERE course.id = %(course_id)s
+                    AND course.deleted_at IS NULL
+                    AND NOT EXISTS (SELECT 1 FROM deleted)
+                ON CONFLICT (user_id, course_id) DO NOTHING
+                RETURNING id
+            )
+            SELECT (SELECT COUNT(*) FROM deleted), (SELECT COUNT(*) FROM inserted)
+        """
+        with transaction.atomic(using=self.db):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(sql, {"user_id": user.pk, "course_id": course_id})
+                deleted, inserted = cursor.fetchone()
+            if deleted or inserted:
+                CourseCounterShard.objects.using(self.db).add(
+                    [course_id], subscribers=1 if inserted else -1
+                )
+        if deleted:
+            return "deleted"
+        if inserted:
+            return "created"
+        # Подписку успел создать параллельный запрос, либо курса нет
+        if Course.objects.filter(pk=course_id).exists():
+            return "created"
+        return None
+
+    def subscribe_many(self, user, course_ids):
+        """Подписывает на все существующие курсы из списка, возвращает их id"""
+        existing = list(
+            Course.objects.filter(pk__in=course_ids).values_list("pk", flat=True)
+        )
+        sql = f"""
+            INSERT INTO {Subscription._meta.db_table} (user_id, course_id, created_at)
+            SELECT %(user_id)s, course.id, NOW()
+            FROM {Course._meta.db_table} AS course
+            WHERE course.id = ANY(%(course_ids)s::bigint[])
+                AND course.deleted_at IS NULL
+            ON CONFLICT (user_id, course_id) DO NOTHING
+            RETURNING course_id
+        """
+        with transaction.atomic(using=self.db):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(sql, {"user_id": user.pk, "course_ids": existing})
+                created = [row[0] for row in cursor.fetchall()]
+            CourseCounterShard.objects.using(self.db).add(created, subscribers=1)
+        return existing
+
+    def unsubscribe_many(self, user, course_ids):
+        """Удаляет подписки одним DELETE, возвращает количество удаленных"""
+        sql = f"""
+            DELETE FROM {Subscription._meta.db_table}
+            WHERE user_id = %(user_id)s AND course_id = ANY(%(course_ids)s::bigint[])
+            RETURNING course_id
+        """
+        with transaction.atomic(using=self.db):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(sql, {"user_id": user.pk, "course_ids": list(course_ids)})
+                deleted = [row[0] for row in cursor.fetchall()]
+            CourseCounterShard.objects.using(self.db).add(deleted, subscribers=-1)
+        return len(deleted)
 
 
 class Subscription(models.Model):
@@ -68,6 +594,8 @@ class Subscription(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата подписки")
 
+    objects = SubscriptionQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
@@ -78,3 +606,429 @@ class Subscription(models.Model):
 
     def __str__(self):
         return f"{self.user.email} - {self.course.name}"
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                CourseCounterShard.objects.add([self.course_id], subscribers=1)
+
+
+@receiver(post_delete, sender=Subscription)
+def forget_deleted_subscription(sender, instance, **kwargs):
+    """
+    Вычитает подписчика из счетчика курса. Сигнал приходит и при каскадном
+    удалении пользователя или удалении через queryset, где
+    Subscription.delete не вызывается. toggle и unsubscribe_many удаляют
+    подписки SQL-запросом и пишут дельту сами.
+    """
+    CourseCounterShard.objects.add([instance.course_id], subscribers=-1)
+
+
+class CourseCounterShardQuerySet(models.QuerySet):
+    def add(self, course_ids, subscribers=0, revenue=0):
+        """
+        Прибавляет дельты счетчиков курсов в случайный шард. Параллельные
+        подписки на популярный курс расходятся по COURSE_COUNTER_SHARDS
+        строкам вместо очереди на блокировку одной строки курса.
+        """
+        course_ids = sorted(set(course_ids))
+        if not course_ids:
+            return
+        table = CourseCounterShard._meta.db_table
+        sql = f"""
+            INSERT INTO {table} (course_id, shard, subscribers, revenue)
+            SELECT course_id, %(shard)s::smallint, %(subscribers)s::integer,
+                %(revenue)s::numeric
+            FROM unnest(%(course_ids)s::bigint[]) AS course_id
+            ON CONFLICT (course_id, shard) DO UPDATE SET
+                subscribers = {table}.subscribers + EXCLUDED.subscribers,
+                revenue = {table}.revenue + EXCLUDED.revenue
+        """
+        params = {
+            "course_ids": course_ids,
+            "shard": random.randrange(settings.COURSE_COUNTER_SHARDS),
+            "subscribers": subscribers,
+            "revenue": revenue,
+        }
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def fold(self):
+        """
+        Сворачивает накопленные дельты в счетчики курсов одним запросом
+        (DELETE ... RETURNING + UPDATE), возвращает число обновленных курсов.
+        """
+        table = CourseCounterShard._meta.db_table
+        sql = f"""
+            WITH drained AS (
+                DELETE FROM {table}
+                RETURNING course_id, subscribers, revenue
+            ), totals AS (
+                SELECT course_id, SUM(subscribers) AS subscribers,
+                    SUM(revenue) AS revenue
+                FROM drained
+                GROUP BY course_id
+            )
+            UPDATE {Course._meta.db_table} AS course SET
+                subscriber_count = course.subscriber_count + totals.subscribers,
+                paid_revenue = course.paid_revenue + totals.revenue,
+                updated_at = NOW()
+            FROM totals
+            WHERE course.id = totals.course_id
+        """
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql)
+            return cursor.rowcount
+
+
+class CourseCounterShard(models.Model):
+    """Несвернутые дельты счетчиков подписчиков и выручки курса"""
+
+    # Без ограничения в БД: дельты пишутся и при каскадном удалении курса
+    # вместе с подписками и платежами, fold() просто отбрасывает дельты
+    # уже удаленных курсов
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+        related_name="counter_shards",
+        verbose_name="Курс",
+    )
+    shard = models.PositiveSmallIntegerField(verbose_name="Шард")
+    subscribers = models.IntegerField(default=0, verbose_name="Подписчики")
+    revenue = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal("0"), verbose_name="Выручка"
+    )
+
+    objects = CourseCounterShardQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Шард счетчиков курса"
+        verbose_name_plural = "Шарды счетчиков курсов"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["course", "shard"], name="unique_course_counter_shard"
+            ),
+        ]
+
+
+class CourseDigest(models.Model):
+    """Окно агрегации уведомлений по курсу: не больше одной рассылки на окно"""
+
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        related_name="digests",
+        verbose_name="Курс",
+    )
+    window_start = models.DateTimeField(verbose_name="Начало окна")
+    sent_at = models.DateTimeField(
+        null=True, blank=True, verbose_name="Время отправки"
+    )
+
+    class Meta:
+        verbose_name = "Дайджест обновлений"
+        verbose_name_plural = "Дайджесты обновлений"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["course", "window_start"], name="unique_course_digest_window"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.course_id} - {self.window_start}"
+
+
+class CourseChangeEvent(models.Model):
+    MATERIAL_TYPES = [
+        ("course", "Курс"),
+        ("lesson", "Урок"),
+    ]
+
+    digest = models.ForeignKey(
+        CourseDigest,
+        on_delete=models.CASCADE,
+        related_name="events",
+        verbose_name="Дайджест",
+    )
+    material_type = models.CharField(
+        max_length=20, choices=MATERIAL_TYPES, verbose_name="Тип материала"
+    )
+    material_title = models.CharField(max_length=255, verbose_name="Материал")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Время изменения")
+
+    class Meta:
+        verbose_name = "Изменение курса"
+        verbose_name_plural = "Изменения курсов"
+        ordering = ["created_at", "id"]
+
+    def __str__(self):
+        return f"{self.get_material_type_display()}: {self.material_title}"
+
+
+class TombstoneQuerySet(models.QuerySet):
+    def record(self, material_type, rows):
+        """Запоминает удаление материалов (пары id, owner_id) для синхронизации"""
+        return self.bulk_create(
+            Tombstone(material_type=material_type, object_id=pk, owner_id=owner_id)
+            for pk, owner_id in rows
+        )
+
+
+class Tombstone(models.Model):
+    """Запись об удаленном курсе или уроке для /api/sync/"""
+
+    MATERIAL_TYPES = CourseChangeEvent.MATERIAL_TYPES
+
+    material_type = models.CharField(
+        max_length=20, choices=MATERIAL_TYPES, verbose_name="Тип материала"
+    )
+    object_id = models.PositiveBigIntegerField(verbose_name="ID материала")
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="tombstones",
+        verbose_name="Владелец",
+    )
+    deleted_at = models.DateTimeField(auto_now_add=True, verbose_name="Время удаления")
+
+    objects = TombstoneQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Удаленный материал"
+        verbose_name_plural = "Удаленные материалы"
+        indexes = [
+            models.Index(
+                fields=["owner", "deleted_at"], name="tombstone_owner_deleted_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_material_type_display()} #{self.object_id}"
+
+
+class CourseDocumentQuerySet(models.QuerySet):
+    def store(self, course_id, version, body):
+        """
+        Сохраняет документ курса, если он новее сохраненного: задачи сборки
+        могут завершиться не в порядке постановки, и более старая версия не
+        должна затереть свежую.
+        """
+        table = CourseDocument._meta.db_table
+        sql = f"""
+            INSERT INTO {table} (course_id, version, body, built_at)
+            VALUES (%(course_id)s, %(version)s, %(body)s, NOW())
+            ON CONFLICT (course_id) DO UPDATE
+            SET version = EXCLUDED.version, body = EXCLUDED.body,
+                built_at = EXCLUDED.built_at
+            WHERE {table}.version < EXCLUDED.version
+        """
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                sql, {"course_id": course_id, "version": version, "body": body}
+            )
+            return cursor.rowcount
+
+
+class CourseDocument(models.Model):
+    """
+    Готовый JSON курса с уроками для detail-запроса. Собирается задачей
+    build_course_document после изменения курса или его уроков; актуален,
+    пока version совпадает с версией курса.
+    """
+
+    course = models.OneToOneField(
+        Course,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="document",
+        verbose_name="Курс",
+    )
+    version = models.PositiveIntegerField(verbose_name="Версия курса")
+    body = models.BinaryField(verbose_name="JSON курса")
+    built_at = models.DateTimeField(auto_now=True, verbose_name="Время сборки")
+
+    objects = CourseDocumentQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Документ курса"
+        verbose_name_plural = "Документы курсов"
+
+    def __str__(self):
+        return f"{self.course_id} v{self.version}"
+
+
+class CourseDeletionQuerySet(models.QuerySet):
+    def schedule(self, course):
+        """
+        Скрывает курс и ставит в очередь purge_course. Сам запрос только
+        меняет одну строку курса, поэтому не зависит от размера курса.
+        """
+        from .tasks import purge_course
+
+        with transaction.atomic():
+            Course.all_objects.filter(pk=course.pk).update(deleted_at=timezone.now())
+            Tombstone.objects.record("course", [(course.pk, course.owner_id)])
+            deletion = self.create(
+                course_id=course.pk, course_name=course.name, owner_id=course.owner_id
+            )
+            transaction.on_commit(lambda: purge_course.delay(deletion.pk))
+        return deletion
+
+    def stalled(self):
+        """
+        Незавершенные удаления без пульса дольше COURSE_DELETE_RESUME_MINUTES:
+        задача потерялась, исчерпала повторы или воркер умер посреди пачки
+        """
+        resume_after = timedelta(minutes=settings.COURSE_DELETE_RESUME_MINUTES)
+        return self.filter(
+            status__in=["pending", "running", "failed"],
+            updated_at__lt=timezone.now() - resume_after,
+        )
+
+    def claim(self, pk):
+        """
+        Переводит удаление в running, если его можно запускать: в очереди,
+        после ошибки или зависшее (stalled). Из параллельных запусков
+        True получает только один.
+        """
+        return bool(
+            self.filter(
+                Q(status__in=["pending", "failed"]) | Q(pk__in=self.stalled()),
+                pk=pk,
+            ).update(status="running", updated_at=timezone.now())
+        )
+
+
+class CourseDeletion(models.Model):
+    """
+    Фоновое удаление скрытого курса. Платежи отвязываются, подписки и уроки
+    удаляются пачками по COURSE_DELETE_BATCH_SIZE строк, каждая пачка - в
+    своей короткой транзакции. Счетчики *_done показывают прогресс.
+    """
+
+    STATUSES = [
+        ("pending", "В очереди"),
+        ("running", "Выполняется"),
+        ("done", "Завершено"),
+        ("failed", "Ошибка"),
+    ]
+
+    course_id = models.PositiveBigIntegerField(verbose_name="ID курса")
+    course_name = models.CharField(max_length=255, verbose_name="Название курса")
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="course_deletions",
+        verbose_name="Владелец",
+    )
+    status = models.CharField(
+        max_length=20, choices=STATUSES, default="pending", verbose_name="Статус"
+    )
+    payments_total = models.PositiveIntegerField(
+        default=0, verbose_name="Платежей к отвязке"
+    )
+    payments_done = models.PositiveIntegerField(
+        default=0, verbose_name="Отвязано платежей"
+    )
+    subscriptions_total = models.PositiveIntegerField(
+        default=0, verbose_name="Подписок к удалению"
+    )
+    subscriptions_done = models.PositiveIntegerField(
+        default=0, verbose_name="Удалено подписок"
+    )
+    lessons_total = models.PositiveIntegerField(
+        default=0, verbose_name="Уроков к удалению"
+    )
+    lessons_done = models.PositiveIntegerField(default=0, verbose_name="Удалено уроков")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Время создания")
+    # Пульс: обновляется после каждой пачки, по нему видно зависшее удаление
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Время обновления")
+    finished_at = models.DateTimeField(
+        null=True, blank=True, verbose_name="Время завершения"
+    )
+
+    objects = CourseDeletionQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Удаление курса"
+        verbose_name_plural = "Удаления курсов"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.course_name}: {self.get_status_display()}"
+
+    def _batches(self, queryset, *fields):
+        """
+        Строки пачками по COURSE_DELETE_BATCH_SIZE. Выборка повторяется после
+        каждой пачки, поэтому обработанные строки в нее больше не попадают.
+        """
+        batch_size = settings.COURSE_DELETE_BATCH_SIZE
+        rows = queryset.values_list(*fields, flat=len(fields) == 1)
+        while batch := list(rows[:batch_size]):
+            yield batch
+
+    def _progress(self, field, count):
+        type(self).objects.filter(pk=self.pk).update(
+            **{field: F(field) + count}, updated_at=timezone.now()
+        )
+
+    def purge(self):
+        """
+        Удаляет части курса пачками и сам курс. Повторный запуск продолжает
+        с того места, где остановился предыдущий.
+        """
+        from users.models import Payment
+
+        course_payments = Payment.objects.filter(course_id=self.course_id)
+        lesson_payments = Payment.objects.filter(lesson__course_id=self.course_id)
+        subscriptions = Subscription.objects.filter(course_id=self.course_id)
+        lessons = Lesson.all_objects.filter(course_id=self.course_id)
+        # Итог - уже обработанное плюс оставшееся: так он верен и при
+        # продолжении после ошибки или смерти воркера
+        self.payments_total = (
+            self.payments_done + course_payments.count() + lesson_payments.count()
+        )
+        self.subscriptions_total = self.subscriptions_done + subscriptions.count()
+        self.lessons_total = self.lessons_done + lessons.count()
+        self.status = "running"
+        self.save(
+            update_fields=[
+                "status",
+                "payments_total",
+                "subscriptions_total",
+                "lessons_total",
+                "updated_at",
+            ]
+        )
+
+        # Отвязка UPDATE-ом вместо SET_NULL при каскаде: сохраненный в платеже
+        # item_title остается, выручка удаляемого курса больше не считается
+        for ids in self._batches(course_payments, "pk"):
+            detached = Payment.objects.filter(pk__in=ids).update(
+                course=None, updated_at=timezone.now()
+            )
+            self._progress("payments_done", detached)
+        for ids in self._batches(lesson_payments, "pk"):
+            detached = Payment.objects.filter(pk__in=ids).update(
+                lesson=None, updated_at=timezone.now()
+            )
+            self._progress("payments_done", detached)
+        for ids in self._batches(subscriptions, "pk"):
+            deleted, _ = Subscription.objects.filter(pk__in=ids).delete()
+            self._progress("subscriptions_done", deleted)
+        for rows in self._batches(lessons, "pk", "owner_id"):
+            with transaction.atomic():
+                Tombstone.objects.record("lesson", rows)
+                Lesson.all_objects.filter(pk__in=[pk for pk, _ in rows]).delete()
+                self._progress("lessons_done", len(rows))
+
+        # Остались только строки, связанные с курсом один к одному или
+        # немногочисленные (шарды счетчиков, дайджесты, документ)
+        Course.all_objects.filter(pk=self.course_id).delete()
+        self.status = "done"
+        self.finished_at = timezone.now()
+        self.save(update_fields=["status", "finished_at", "updated_at"])
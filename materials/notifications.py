@@ -0,0 +1,70 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import CourseChangeEvent, CourseDigest
+from .tasks import send_course_digest
+
+
+def get_digest_window():
+    return timedelta(minutes=settings.COURSE_DIGEST_WINDOW_MINUTES)
+
+
+def get_window_start(moment, window):
+    """Начало окна агрегации, в которое попадает момент времени"""
+    seconds = window.total_seconds()
+    timestamp = moment.timestamp()
+    return datetime.fromtimestamp(timestamp - timestamp % seconds, tz=dt_timezone.utc)
+
+
+def record_course_change(course_id, material_type, material_title):
+    """
+    Регистрирует изменение материала курса в текущем окне агрегации.
+
+    Первое изменение в окне создает CourseDigest и планирует его отправку на
+    конец окна; остальные только добавляют события. Строка дайджеста
+    блокируется на время записи, поэтому событие не может потеряться между
+    проверкой sent_at и отправкой: если окно уже разослано, событие попадает
+    в следующее.
+    """
+    return record_course_changes(course_id, material_type, [material_title])
+
+
+def record_course_changes(course_id, material_type, material_titles):
+    """Пакетный вариант record_course_change: события пишутся одним INSERT"""
+    window = get_digest_window()
+    window_start = get_window_start(timezone.now(), window)
+    with transaction.atomic():
+        while True:
+            digest, created = CourseDigest.objects.select_for_update().get_or_create(
+                course_id=course_id, window_start=window_start
+            )
+            if digest.sent_at is None:
+                break
+            window_start += window
+        CourseChangeEvent.objects.bulk_create(
+            CourseChangeEvent(
+                digest=digest, material_type=material_type, material_title=title
+            )
+            for title in material_titles
+        )
+        if created:
+            transaction.on_commit(
+                lambda: send_course_digest.apply_async(
+                    (digest.pk,), eta=window_start + window
+                )
+            )
+    return digest
+
+
+def record_lesson_changes(lessons):
+    """Регистрирует изменения уроков, группируя их по курсам"""
+    titles_by_course = defaultdict(list)
+    for lesson in lessons:
+        titles_by_course[lesson.course_id].append(lesson.name)
+    for course_id, titles in titles_by_course.items():
+        record_course_changes(course_id, "lesson", titles)
@@ -1,4 +1,5 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import (BasePagination, CursorPagination,
+                                       PageNumberPagination)
 
 
 class CoursePagination(PageNumberPagination):
@@ -11,3 +12,96 @@ class LessonPagination(PageNumberPagination):
     page_size = 15
     page_size_query_param = "page_size"
     max_page_size = 100
+
+
+class CourseCursorPagination(CursorPagination):
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 50
+    ordering = ("name", "id")
+
+
+class LessonCursorPagination(CursorPagination):
+    page_size = 15
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("name", "id")
+
+
+class SearchCursorPagination(CursorPagination):
+    """Keyset-пагинация результатов поиска: по убыванию rank, затем по id"""
+
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("-rank", "id")
+
+
+class HybridPagination(BasePagination):
+    """
+    Пагинация с выбором режима на каждый запрос.
+
+    По умолчанию работает постраничная пагинация (page/page_size) со счетчиком
+    count. Курсорный (keyset) режим без OFFSET и COUNT(*) включается параметром
+    ?pagination=cursor или передачей параметра cursor из ссылок next/previous.
+    """
+
+    page_number_class = PageNumberPagination
+    cursor_class = CursorPagination
+    mode_query_param = "pagination"
+    cursor_mode = "cursor"
+
+    def __init__(self):
+        self.paginator = None
+
+    def get_paginator(self, request):
+        cursor_requested = (
+            request.query_params.get(self.mode_query_param) == self.cursor_mode
+            or self.cursor_class.cursor_query_param in request.query_params
+        )
+        if cursor_requested:
+            return self.cursor_class()
+        return self.page_number_class()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginator = self.get_paginator(request)
+        page = self.paginator.paginate_queryset(queryset, request, view=view)
+        self.display_page_controls = self.paginator.display_page_controls
+        return page
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.page_number_class().get_paginated_response_schema(schema)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    def get_results(self, data):
+        return data["results"]
+
+    def get_schema_operation_parameters(self, view):
+        mode_parameter = {
+            "name": self.mode_query_param,
+            "required": False,
+            "in": "query",
+            "description": "Режим пагинации: page (по умолчанию) или cursor",
+            "schema": {"type": "string", "enum": ["page", self.cursor_mode]},
+        }
+        parameters = self.page_number_class().get_schema_operation_parameters(view)
+        names = {parameter["name"] for parameter in parameters}
+        for parameter in self.cursor_class().get_schema_operation_parameters(view):
+            if parameter["name"] not in names:
+                parameters.append(parameter)
+        return parameters + [mode_parameter]
+
+
+class CourseHybridPagination(HybridPagination):
+    page_number_class = CoursePagination
+    cursor_class = CourseCursorPagination
+
+
+class LessonHybridPagination(HybridPagination):
+    page_number_class = LessonPagination
+    cursor_class = LessonCursorPagination
@@ -1,11 +1,13 @@
 from rest_framework.permissions import BasePermission
 
+from users.roles import is_moderator
+
 
 class IsOwnerOrModerator(BasePermission):
     def has_object_permission(self, request, view, obj):
-        # Разрешаем доступ владельцу объекта
-        if obj.owner == request.user:
+        # Разрешаем доступ владельцу объекта (сравниваем id, без загрузки owner)
+        if obj.owner_id == request.user.pk:
             return True
 
-        # Разрешаем доступ модераторам
-        return request.user.groups.filter(name="moderators").exists()
+        # Разрешаем доступ модераторам (группы кешируются, см. users.roles)
+        return is_moderator(request.user)
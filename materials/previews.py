@@ -0,0 +1,72 @@
+import hashlib
+import posixpath
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# Формат варианта -> (формат Pillow, расширение, параметры кодирования)
+PREVIEW_FORMATS = {
+    "webp": ("WEBP", "webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def get_variant_widths(original_width):
+    """Ширины вариантов без увеличения картинки"""
+    widths = [
+        width for width in settings.PREVIEW_VARIANT_WIDTHS if width < original_width
+    ]
+    if len(widths) < len(settings.PREVIEW_VARIANT_WIDTHS):
+        # Вместо ширин больше исходника - один вариант исходного размера
+        widths.append(original_width)
+    return widths
+
+
+def variant_name(source_name, width, extension, content):
+    """
+    Имя файла варианта с хешем содержимого: одинаковые картинки дают одно
+    имя, а новая картинка - новый URL, который можно кешировать навсегда.
+    """
+    directory, filename = posixpath.split(source_name)
+    stem = posixpath.splitext(filename)[0]
+    digest = hashlib.sha256(content).hexdigest()[:16]
+    return posixpath.join(directory, "variants", f"{stem}-{width}w-{digest}.{extension}")
+
+
+def build_preview_variants(source_name, storage=default_storage):
+    """
+    Строит уменьшенные копии превью во всех PREVIEW_FORMATS и ширинах
+    PREVIEW_VARIANT_WIDTHS, сохраняет их в хранилище и возвращает
+    {"webp": {"320": имя файла, ...}, "jpeg": {...}}.
+    """
+    with storage.open(source_name, "rb") as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image = image.convert("RGB")
+
+    variants = {key: {} for key in PREVIEW_FORMATS}
+    for width in get_variant_widths(image.width):
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.Resampling.LANCZOS)
+        for key, (pillow_format, extension, options) in PREVIEW_FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, format=pillow_format, **options)
+            content = buffer.getvalue()
+            name = variant_name(source_name, width, extension, content)
+            if not storage.exists(name):
+                name = storage.save(name, ContentFile(content))
+            variants[key][str(width)] = name
+    return variants
+
+
+def get_variant_names(variants):
+    """Имена файлов всех вариантов из preview_variants"""
+    return [name for widths in variants.values() for name in widths.values()]
+
+
+def delete_preview_variants(variants, storage=default_storage):
+    """Удаляет из хранилища файлы вариантов замененного превью"""
+    for name in get_variant_names(variants):
+        storage.delete(name)
@@ -1,10 +1,131 @@
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 
-from .models import Course, Lesson, Subscription
+from .models import (Course, CourseDeletion, Lesson, Subscription,
+                     refresh_payment_titles)
 from .validators import VideoURLValidator, validate_video_url
 
 
+class CourseRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Поле курса урока. При пакетной загрузке берет курс из словаря, который
+    LessonListSerializer загружает одним запросом на всю пачку.
+    """
+
+    def to_internal_value(self, data):
+        course_cache = self.context.get("course_cache")
+        if course_cache is None:
+            return super().to_internal_value(data)
+        try:
+            return course_cache[int(data)]
+        except KeyError:
+            self.fail("does_not_exist", pk_value=data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+
+
+@extend_schema_field(OpenApiTypes.OBJECT)
+class PreviewVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии превью: {"webp": {"320": url}, ...}"""
+
+    def to_representation(self, value):
+        request = self.context.get("request")
+        variants = {}
+        for variant_format, names in value.items():
+            variants[variant_format] = {}
+            for width, name in names.items():
+                url = default_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                variants[variant_format][width] = url
+        return variants
+
+
+class LessonListSerializer(serializers.ListSerializer):
+    """
+    Пакетное создание и обновление уроков: валидация всей пачки за один
+    проход, сохранение через bulk_create/bulk_update в одной транзакции.
+    Ошибки возвращаются списком, по одному элементу на каждый урок.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            course_ids = set()
+            for item in data:
+                try:
+                    course_ids.add(int(item.get("course")))
+                except (AttributeError, TypeError, ValueError):
+                    continue
+            self.context["course_cache"] = Course.objects.in_bulk(course_ids)
+        if self.instance is not None:
+            self.instance_map = {lesson.pk: lesson for lesson in self.instance}
+        return super().to_internal_value(data)
+
+    def run_child_validation(self, data):
+        if self.instance is not None:
+            lesson_id = data.get("id") if isinstance(data, dict) else None
+            if lesson_id not in self.instance_map:
+                raise serializers.ValidationError({"id": ["Урок не найден"]})
+            self.child.instance = self.instance_map[lesson_id]
+        return super().run_child_validation(data)
+
+    def create(self, validated_data):
+        lessons = [Lesson(**attrs) for attrs in validated_data]
+        with transaction.atomic():
+            Lesson.objects.bulk_create(lessons)
+            Course.objects.touch_lessons(
+                Counter(lesson.course_id for lesson in lessons)
+            )
+        Lesson.provision_stripe_products(lesson.pk for lesson in lessons)
+        for lesson in lessons:
+            lesson._loaded_course_id = lesson.course_id
+            lesson._loaded_stripe_fields = lesson.get_stripe_fields()
+        return lessons
+
+    def update(self, instance, validated_data):
+        now = timezone.now()
+        lessons, fields, deltas = [], {"updated_at", "version"}, Counter()
+        for item, attrs in zip(self.initial_data, validated_data):
+            lesson = self.instance_map[item["id"]]
+            deltas[lesson.course_id] -= 1
+            for field, value in attrs.items():
+                setattr(lesson, field, value)
+            lesson.updated_at = now
+            lesson.version += 1
+            fields.update(attrs)
+            deltas[lesson.course_id] += 1
+            lessons.append(lesson)
+        renamed_ids = [
+            lesson.pk for lesson in lessons if lesson._loaded_name != lesson.name
+        ]
+        stripe_changed_ids = [
+            lesson.pk
+            for lesson in lessons
+            if lesson._loaded_stripe_fields != lesson.get_stripe_fields()
+        ]
+        with transaction.atomic():
+            Lesson.objects.bulk_update(lessons, sorted(fields))
+            Course.objects.touch_lessons(deltas)
+            if renamed_ids:
+                refresh_payment_titles(lesson__in=renamed_ids)
+            Lesson.provision_stripe_products(stripe_changed_ids)
+        for lesson in lessons:
+            lesson._loaded_name = lesson.name
+            lesson._loaded_course_id = lesson.course_id
+            lesson._loaded_stripe_fields = lesson.get_stripe_fields()
+        return lessons
+
+
 class LessonSerializer(serializers.ModelSerializer):
+    course = CourseRelatedField(queryset=Course.objects.all())
+    preview_variants = PreviewVariantsField()
+
     class Meta:
         model = Lesson
         fields = [
@@ -12,17 +133,19 @@ class LessonSerializer(serializers.ModelSerializer):
             "name",
             "description",
             "preview",
+            "preview_variants",
             "video_url",
             "course",
             "owner",
         ]
         read_only_fields = ["owner"]
         validators = [VideoURLValidator(field="video_url")]
+        list_serializer_class = LessonListSerializer
 
 
 class CourseSerializer(serializers.ModelSerializer):
-    lesson_count = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField()
+    preview_variants = PreviewVariantsField()
     lessons = LessonSerializer(many=True, read_only=True)  # Связанные уроки
 
     class Meta:
@@ -31,23 +154,102 @@ class CourseSerializer(serializers.ModelSerializer):
             "id",
             "name",
             "description",
+            "preview",
+            "preview_variants",
             "lesson_count",
+            "subscriber_count",
+            "paid_revenue",
             "is_subscribed",
             "lessons",
         ]
-
-    def get_lesson_count(self, obj):
-        return obj.lessons.count()
+        read_only_fields = ["lesson_count", "subscriber_count", "paid_revenue"]
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, "annotated_is_subscribed"):
+            return obj.annotated_is_subscribed
         request = self.context.get("request")
         if request and request.user.is_authenticated:
             return obj.subscriptions.filter(user=request.user).exists()
         return False
 
 
+class CourseSyncSerializer(serializers.ModelSerializer):
+    preview_variants = PreviewVariantsField()
+
+    class Meta:
+        model = Course
+        fields = [
+            "id",
+            "name",
+            "description",
+            "preview",
+            "preview_variants",
+            "lesson_count",
+            "subscriber_count",
+            "paid_revenue",
+            "version",
+            "updated_at",
+        ]
+        read_only_fields = fields
+
+
+class LessonSyncSerializer(LessonSerializer):
+    class Meta(LessonSerializer.Meta):
+        fields = LessonSerializer.Meta.fields + ["version", "updated_at"]
+        read_only_fields = fields
+
+
+class CourseDeletionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CourseDeletion
+        fields = [
+            "id",
+            "course_id",
+            "course_name",
+            "status",
+            "payments_total",
+            "payments_done",
+            "subscriptions_total",
+            "subscriptions_done",
+            "lessons_total",
+            "lessons_done",
+            "error",
+            "created_at",
+            "finished_at",
+        ]
+        read_only_fields = fields
+
+
+class CourseSearchSerializer(serializers.ModelSerializer):
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Course
+        fields = ["id", "name", "description", "rank"]
+
+
+class LessonSearchSerializer(serializers.ModelSerializer):
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Lesson
+        fields = ["id", "name", "description", "course", "rank"]
+
+
 class SubscriptionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Subscription
         fields = ["id", "user", "course", "created_at"]
         read_only_fields = ["user", "created_at"]
+
+
+class SubscriptionBatchSerializer(serializers.Serializer):
+    ACTIONS = [
+        ("subscribe", "Подписаться"),
+        ("unsubscribe", "Отписаться"),
+    ]
+
+    course_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=1000
+    )
+    action = serializers.ChoiceField(choices=ACTIONS)
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+
+SYNC_TOKEN_SALT = "materials.sync"
+
+
+def build_sync_token(moment):
+    """Непрозрачный подписанный токен с моментом синхронизации"""
+    return signing.dumps(moment.timestamp(), salt=SYNC_TOKEN_SALT, compress=True)
+
+
+def build_page_token(since, started, course_after, lesson_after):
+    """
+    Токен следующей страницы незавершенной синхронизации: исходный момент
+    (None - полный снимок), момент первой страницы и последние отданные id
+    курсов и уроков
+    """
+    return signing.dumps(
+        {
+            "since": since.timestamp() if since else None,
+            "started": started.timestamp(),
+            "courses": course_after,
+            "lessons": lesson_after,
+        },
+        salt=SYNC_TOKEN_SALT,
+        compress=True,
+    )
+
+
+def _from_timestamp(timestamp):
+    return datetime.fromtimestamp(float(timestamp), tz=dt_timezone.utc)
+
+
+def parse_sync_token(token):
+    """
+    Курсор синхронизации из токена: since, started (None на первой
+    странице), courses и lessons (id, после которых продолжать).
+    BadSignature/KeyError/TypeError/ValueError - токен испорчен.
+    """
+    payload = signing.loads(token, salt=SYNC_TOKEN_SALT)
+    if not isinstance(payload, dict):
+        return {
+            "since": _from_timestamp(payload),
+            "started": None,
+            "courses": 0,
+            "lessons": 0,
+        }
+    since = payload["since"]
+    return {
+        "since": _from_timestamp(since) if since is not None else None,
+        "started": _from_timestamp(payload["started"]),
+        "courses": int(payload["courses"]),
+        "lessons": int(payload["lessons"]),
+    }
+
+
+def get_changes_since(moment):
+    """
+    Нижняя граница выборки изменений. Запас COURSE_SYNC_OVERLAP_SECONDS
+    покрывает транзакции, которые поставили updated_at до выдачи прошлого
+    токена, а закоммитились после: клиент может получить объект повторно,
+    но не пропустит его.
+    """
+    return moment - timedelta(seconds=settings.COURSE_SYNC_OVERLAP_SECONDS)
+
+
+def get_tombstone_horizon(now):
+    """Токены старше срока хранения Tombstone требуют полной синхронизации"""
+    return now - timedelta(days=settings.COURSE_SYNC_TOMBSTONE_DAYS)
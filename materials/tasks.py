@@ -1,11 +1,43 @@
 from celery import shared_task
-from django.core.mail import send_mail
+from django.apps import apps
+from django.core.mail import EmailMessage, get_connection, send_mail
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta
+from itertools import islice
 import logging
 
+from . import documents
+from .models import (CourseCounterShard, CourseDeletion, CourseDigest,
+                     Subscription, Tombstone)
+from .previews import build_preview_variants, delete_preview_variants
+from .sync import get_tombstone_horizon
+
 logger = logging.getLogger(__name__)
 
 
+def _course_update_message(course_name, material_title):
+    return (
+        f"Обновление в курсе {course_name}",
+        f'В курсе "{course_name}" появился новый материал: {material_title}',
+    )
+
+
+def _course_digest_message(course_name, materials):
+    lines = "\n".join(f"- {material_type}: {title}" for material_type, title in materials)
+    return (
+        f"Обновления в курсе {course_name}",
+        f'В курсе "{course_name}" обновлены материалы:\n{lines}',
+    )
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
 @shared_task
 def simple_test_task():
     """Простая тестовая задача без email"""
@@ -21,9 +53,10 @@ def send_course_update_email(user_email, course_name, material_title):
             logger.error(error_msg)
             return error_msg
         
+        subject, message = _course_update_message(course_name, material_title)
         send_mail(
-            subject=f'Обновление в курсе {course_name}',
-            message=f'В курсе "{course_name}" появился новый материал: {material_title}',
+            subject=subject,
+            message=message,
             from_email=settings.DEFAULT_FROM_EMAIL,
             recipient_list=[user_email],
         )
@@ -34,6 +67,202 @@ def send_course_update_email(user_email, course_name, material_title):
         return error_msg
 
 
+def dispatch_to_subscribers(course_id, subject, message):
+    """
+    Читает email подписчиков курса потоково (values_list + iterator) и ставит
+    по одной задаче отправки на каждую пачку адресов. Внутри транзакции
+    задачи ставятся после коммита: при откате писем не будет.
+    Возвращает количество поставленных задач.
+    """
+    chunk_size = settings.COURSE_NOTIFICATION_CHUNK_SIZE
+    emails = (
+        Subscription.objects.filter(course_id=course_id)
+        .order_by("pk")
+        .values_list("user__email", flat=True)
+        .iterator(chunk_size=chunk_size)
+    )
+    batches = 0
+    for chunk in _chunks(emails, chunk_size):
+        transaction.on_commit(
+            lambda chunk=chunk: send_course_update_emails.delay(chunk, subject, message)
+        )
+        batches += 1
+    return batches
+
+
+@shared_task(
+    autoretry_for=(Exception,),
+    retry_backoff=30,
+    retry_backoff_max=900,
+    retry_kwargs={"max_retries": 5},
+)
+def send_course_digest(digest_id):
+    """
+    Отправляет подписчикам один дайджест со всеми материалами, измененными за
+    окно. Строка дайджеста заблокирована до конца транзакции, а sent_at
+    ставится в ней же после постановки рассылки: если рассылка упадет или
+    воркер умрет, дайджест останется неотправленным для повтора задачи или
+    send_overdue_digests. Письма уходят только после коммита, поэтому
+    повторный или параллельный запуск их не дублирует.
+    """
+    with transaction.atomic():
+        digest = (
+            CourseDigest.objects.select_for_update(of=("self",))
+            .select_related("course")
+            .filter(pk=digest_id)
+            .first()
+        )
+        if digest is None or digest.sent_at is not None:
+            return "Дайджест уже отправлен"
+
+        events = digest.events.order_by("created_at", "id")
+        materials = list(
+            dict.fromkeys(
+                (event.get_material_type_display(), event.material_title)
+                for event in events
+            )
+        )
+        subject, message = _course_digest_message(digest.course.name, materials)
+        batches = dispatch_to_subscribers(digest.course_id, subject, message)
+        digest.events.all().delete()
+        digest.sent_at = timezone.now()
+        digest.save(update_fields=["sent_at"])
+    return f"Поставлено пачек рассылки: {batches}"
+
+
+@shared_task
+def send_overdue_digests():
+    """
+    Заново ставит в очередь дайджесты, не отправленные через окно после
+    конца своего окна: задача потерялась или исчерпала повторы
+    """
+    window = timedelta(minutes=settings.COURSE_DIGEST_WINDOW_MINUTES)
+    digest_ids = list(
+        CourseDigest.objects.filter(
+            sent_at__isnull=True, window_start__lt=timezone.now() - 2 * window
+        ).values_list("pk", flat=True)
+    )
+    for digest_id in digest_ids:
+        send_course_digest.delay(digest_id)
+    return f"Повторно поставлено дайджестов: {len(digest_ids)}"
+
+
+@shared_task
+def fold_course_counters():
+    """Переносит накопленные в шардах дельты в счетчики курсов"""
+    folded = CourseCounterShard.objects.fold()
+    logger.info(f"Счетчики свернуты для {folded} курсов")
+    return folded
+
+
+@shared_task
+def purge_tombstones():
+    """Удаляет записи об удалении старше срока хранения"""
+    deleted, _ = Tombstone.objects.filter(
+        deleted_at__lt=get_tombstone_horizon(timezone.now())
+    ).delete()
+    return deleted
+
+
+@shared_task
+def build_course_document(course_id):
+    """Пересобирает готовый JSON курса для detail-запросов"""
+    return documents.build_course_document(course_id)
+
+
+@shared_task(
+    autoretry_for=(Exception,),
+    retry_backoff=30,
+    retry_backoff_max=900,
+    retry_kwargs={"max_retries": 5},
+)
+def purge_course(deletion_id):
+    """
+    Удаляет скрытый курс пачками, прогресс пишется в CourseDeletion. После
+    ошибки задача повторяется с растущей задержкой и продолжает с места
+    остановки; исчерпавшие повторы и зависшие после смерти воркера удаления
+    подхватывает resume_course_deletions.
+    """
+    # Повтор и resume_course_deletions могут прийти одновременно: курс
+    # удаляет только тот, кто перевел удаление в running
+    if not CourseDeletion.objects.claim(deletion_id):
+        if CourseDeletion.objects.filter(pk=deletion_id, status="running").exists():
+            return "Удаление уже выполняется"
+        return "Удаление уже выполнено"
+    deletion = CourseDeletion.objects.get(pk=deletion_id)
+    try:
+        deletion.purge()
+    except Exception as e:
+        CourseDeletion.objects.filter(pk=deletion_id).update(
+            status="failed", error=str(e), updated_at=timezone.now()
+        )
+        logger.error(f"Ошибка удаления курса {deletion.course_id}: {e}")
+        raise
+    return f"Курс {deletion.course_id} удален"
+
+
+@shared_task
+def resume_course_deletions():
+    """
+    Заново ставит в очередь удаления, которые дольше
+    COURSE_DELETE_RESUME_MINUTES стоят в pending (сообщение о задаче
+    потерялось), в failed или в running без пульса (воркер умер).
+    """
+    deletion_ids = list(CourseDeletion.objects.stalled().values_list("pk", flat=True))
+    for deletion_id in deletion_ids:
+        purge_course.delay(deletion_id)
+    return f"Возобновлено удалений: {len(deletion_ids)}"
+
+
+@shared_task
+def generate_preview_variants(model_label, pk, source_name):
+    """Строит уменьшенные копии загруженного превью курса или урока"""
+    model = apps.get_model(model_label)
+    variants = build_preview_variants(source_name)
+    if not model.store_preview_variants(pk, source_name, variants):
+        # Варианты никуда не записаны - файлы больше никому не нужны
+        delete_preview_variants(variants)
+        return "Превью уже заменено или объект удален"
+    return variants
+
+
+@shared_task
+def remove_preview_variants(variants):
+    """Удаляет файлы вариантов превью, которое заменили новым"""
+    delete_preview_variants(variants)
+
+
+@shared_task
+def send_course_update_emails(recipients, subject, message):
+    """Отправляет пачку писем через одно SMTP-соединение"""
+    try:
+        if not settings.EMAIL_HOST_USER or not settings.EMAIL_HOST_PASSWORD:
+            error_msg = (
+                f"Email настройки неполные: EMAIL_HOST_USER={bool(settings.EMAIL_HOST_USER)}, "
+                f"EMAIL_HOST_PASSWORD={bool(settings.EMAIL_HOST_PASSWORD)}"
+            )
+            logger.error(error_msg)
+            return error_msg
+
+        with get_connection() as connection:
+            messages = [
+                EmailMessage(
+                    subject=subject,
+                    body=message,
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    to=[email],
+                    connection=connection,
+                )
+                for email in recipients
+            ]
+            sent = connection.send_messages(messages)
+        return f"Отправлено писем: {sent} из {len(recipients)}"
+    except Exception as e:
+        error_msg = f"Ошибка отправки email: {str(e)}"
+        logger.error(error_msg)
+        return error_msg
+
+
 @shared_task
 def test_email_task():
     """Тестовая задача для проверки работы Celery и отправки email"""
@@ -1,3 +1,597 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from users.models import Payment, User
+
+from .models import (Course, CourseCounterShard, CourseDeletion, CourseDigest,
+                     CourseDocument, Lesson, Subscription, Tombstone)
+from .documents import build_course_document
+from .notifications import record_course_change, record_lesson_changes
+from .previews import delete_preview_variants, get_variant_names
+from .tasks import (generate_preview_variants, purge_course,
+                    remove_preview_variants, resume_course_deletions,
+                    send_course_digest, send_overdue_digests)
+
+
+class CourseCountersTest(APITestCase):
+    """Дельты счетчиков пишутся в шарды и сворачиваются в курс"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="pass"
+        )
+        self.user = User.objects.create_user(email="user@example.com", password="pass")
+        self.course = Course.objects.create(
+            name="Курс", description="Описание", owner=self.owner
+        )
+
+    def toggle(self, user):
+        self.client.force_authenticate(user)
+        return self.client.post(
+            reverse("subscription"), {"course_id": self.course.pk}, format="json"
+        )
+
+    def assertCounters(self, subscribers, revenue):
+        CourseCounterShard.objects.fold()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.subscriber_count, subscribers)
+        self.assertEqual(self.course.paid_revenue, Decimal(revenue))
+        self.assertFalse(CourseCounterShard.objects.exists())
+
+    def test_subscribe_pay_unsubscribe_fold(self):
+        self.assertEqual(self.toggle(self.user).status_code, 201)
+        self.assertEqual(self.toggle(self.owner).status_code, 201)
+        Payment.objects.create(
+            user=self.user,
+            course=self.course,
+            amount=Decimal("100.00"),
+            payment_status="paid",
+        )
+        payment = Payment.objects.create(
+            user=self.owner, course=self.course, amount=Decimal("30.00")
+        )
+        self.assertCounters(2, "100.00")
+
+        payment.payment_status = "paid"
+        payment.save()
+        self.assertEqual(self.toggle(self.owner).status_code, 204)
+        self.assertCounters(1, "130.00")
+
+    def test_cascade_delete_updates_counters(self):
+        self.toggle(self.user)
+        Subscription.objects.create(user=self.owner, course=self.course)
+        Payment.objects.create(
+            user=self.user,
+            course=self.course,
+            amount=Decimal("100.00"),
+            payment_status="paid",
+        )
+        self.assertCounters(2, "100.00")
+
+        # Подписка и платеж удаляются каскадом, минуя Model.delete
+        self.user.delete()
+        self.assertCounters(1, "0.00")
+        Subscription.objects.filter(course=self.course).delete()
+        self.assertCounters(0, "0.00")
+
+
+class SubscriptionApiTest(APITestCase):
+    """Переключение подписки и пакетная подписка без дублей"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com", password="pass")
+        self.client.force_authenticate(self.user)
+        self.courses = [
+            Course.objects.create(name=name, description="Описание", owner=self.user)
+            for name in ("Первый", "Второй")
+        ]
+
+    def subscribed(self):
+        return set(
+            Subscription.objects.filter(user=self.user).values_list(
+                "course_id", flat=True
+            )
+        )
+
+    def test_toggle(self):
+        course = self.courses[0]
+        url = reverse("subscription")
+        for expected in (201, 204, 201):
+            response = self.client.post(url, {"course_id": course.pk}, format="json")
+            self.assertEqual(response.status_code, expected)
+        self.assertEqual(self.subscribed(), {course.pk})
+        self.assertEqual(
+            self.client.post(url, {"course_id": 0}, format="json").status_code, 404
+        )
+        self.assertEqual(
+            self.client.post(url, {"course_id": "x"}, format="json").status_code, 404
+        )
+
+        CourseCounterShard.objects.fold()
+        course.refresh_from_db()
+        self.assertEqual(course.subscriber_count, 1)
+
+    def test_batch(self):
+        url = reverse("subscription-batch")
+        ids = [course.pk for course in self.courses]
+        missing = ids[-1] + 100
+        Subscription.objects.create(user=self.user, course=self.courses[0])
+
+        response = self.client.post(
+            url, {"course_ids": ids + [missing], "action": "subscribe"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"subscribed": ids, "not_found": [missing]})
+        self.assertEqual(self.subscribed(), set(ids))
+
+        response = self.client.post(
+            url, {"course_ids": ids, "action": "unsubscribe"}, format="json"
+        )
+        self.assertEqual(response.data, {"unsubscribed": 2})
+        self.assertEqual(self.subscribed(), set())
+
+        CourseCounterShard.objects.fold()
+        for course in self.courses:
+            course.refresh_from_db()
+            self.assertEqual(course.subscriber_count, 0)
+
+
+class CourseListQueriesTest(APITestCase):
+    """Число запросов на страницу списка курсов не зависит от ее размера"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com", password="pass")
+        self.client.force_authenticate(self.user)
+
+    def create_courses(self, count):
+        for number in range(count):
+            course = Course.objects.create(
+                name=f"Курс {number}", description="Описание", owner=self.user
+            )
+            Subscription.objects.create(user=self.user, course=course)
+            for lesson_number in range(2):
+                Lesson.objects.create(
+                    name=f"Урок {lesson_number}",
+                    description="Описание",
+                    video_url="https://youtube.com/watch?v=1",
+                    course=course,
+                    owner=self.user,
+                )
+
+    def test_course_list_query_count(self):
+        for count, total in ((1, 1), (5, 6)):
+            self.create_courses(count)
+            with self.subTest(courses=total):
+                # Отпечаток ETag, COUNT, курсы с аннотациями и уроки одним
+                # prefetch-запросом
+                with self.assertNumQueries(4):
+                    response = self.client.get(reverse("course-list"))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data["results"]), total)
+
+
+@override_settings(COURSE_SYNC_PAGE_SIZE=2)
+class SyncPagingTest(APITestCase):
+    """Полный снимок и изменения отдаются страницами по токену"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com", password="pass")
+        self.client.force_authenticate(self.user)
+        self.courses = [
+            Course.objects.create(
+                name=f"Курс {number}", description="Описание", owner=self.user
+            )
+            for number in range(3)
+        ]
+        Lesson.objects.create(
+            name="Урок",
+            description="Описание",
+            video_url="https://youtube.com/watch?v=1",
+            course=self.courses[0],
+            owner=self.user,
+        )
+
+    def sync(self, token=None):
+        params = {"token": token} if token else {}
+        response = self.client.get(reverse("sync"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_snapshot_is_paged(self):
+        first = self.sync()
+        self.assertTrue(first["reset"])
+        self.assertTrue(first["has_more"])
+        self.assertEqual(len(first["courses"]), 2)
+        self.assertEqual(len(first["lessons"]), 1)
+
+        second = self.sync(first["token"])
+        self.assertFalse(second["reset"])
+        self.assertFalse(second["has_more"])
+        self.assertEqual(
+            [course["id"] for course in second["courses"]], [self.courses[2].pk]
+        )
+        self.assertEqual(second["lessons"], [])
+
+        # Токен последней страницы - обычный токен следующей синхронизации
+        deleted_pk = self.courses[1].pk
+        self.courses[1].delete()
+        delta = self.sync(second["token"])
+        self.assertFalse(delta["reset"])
+        self.assertIn(deleted_pk, delta["deleted"]["courses"])
+
+    def test_invalid_token(self):
+        response = self.client.get(reverse("sync"), {"token": "junk"})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(COURSE_DELETE_BATCH_SIZE=1)
+class CourseDeletionTest(APITestCase):
+    """Курс скрывается сразу, а удаляется задачей пачками с повторами"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com", password="pass")
+        self.client.force_authenticate(self.user)
+        self.course = Course.objects.create(
+            name="Курс", description="Описание", owner=self.user
+        )
+        for number in range(2):
+            Lesson.objects.create(
+                name=f"Урок {number}",
+                description="Описание",
+                video_url="https://youtube.com/watch?v=1",
+                course=self.course,
+                owner=self.user,
+            )
+        Subscription.objects.create(user=self.user, course=self.course)
+        self.payment = Payment.objects.create(
+            user=self.user, course=self.course, amount=Decimal("100.00")
+        )
+
+    def schedule(self):
+        response = self.client.delete(reverse("course-detail", args=[self.course.pk]))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["status"], "pending")
+        self.assertFalse(Course.objects.filter(pk=self.course.pk).exists())
+        return CourseDeletion.objects.get(pk=response.data["id"])
+
+    def test_purge_in_batches(self):
+        deletion = self.schedule()
+        purge_course(deletion.pk)
+
+        deletion.refresh_from_db()
+        self.assertEqual(deletion.status, "done")
+        done = (
+            deletion.payments_done,
+            deletion.subscriptions_done,
+            deletion.lessons_done,
+        )
+        self.assertEqual(done, (1, 1, 2))
+        self.assertFalse(Course.all_objects.filter(pk=self.course.pk).exists())
+        self.assertFalse(Lesson.all_objects.filter(course_id=self.course.pk).exists())
+        self.assertEqual(Tombstone.objects.filter(material_type="lesson").count(), 2)
+        self.payment.refresh_from_db()
+        self.assertIsNone(self.payment.course_id)
+        self.assertEqual(purge_course(deletion.pk), "Удаление уже выполнено")
+
+    def test_failed_purge_is_resumed(self):
+        deletion = self.schedule()
+        with mock.patch.object(
+            CourseDeletion, "purge", side_effect=RuntimeError("нет соединения")
+        ):
+            with self.assertRaises(RuntimeError):
+                purge_course(deletion.pk)
+        deletion.refresh_from_db()
+        self.assertEqual(deletion.status, "failed")
+        self.assertEqual(deletion.error, "нет соединения")
+
+        # Свежие ошибки ждут автоповтора, давние подхватывает периодическая задача
+        with mock.patch("materials.tasks.purge_course.delay") as delay:
+            resume_course_deletions()
+            delay.assert_not_called()
+            CourseDeletion.objects.update(
+                updated_at=timezone.now() - timedelta(hours=1)
+            )
+            resume_course_deletions()
+            delay.assert_called_once_with(deletion.pk)
+
+        purge_course(deletion.pk)
+        deletion.refresh_from_db()
+        self.assertEqual(deletion.status, "done")
+        self.assertEqual(deletion.lessons_done, 2)
+
+    def test_stuck_running_is_resumed(self):
+        deletion = self.schedule()
+        # Воркер удалил одну пачку уроков и умер, не сменив статус
+        first = Lesson.all_objects.filter(course=self.course).order_by("pk").first()
+        Tombstone.objects.record("lesson", [(first.pk, self.user.pk)])
+        first.delete()
+        CourseDeletion.objects.filter(pk=deletion.pk).update(
+            status="running", lessons_total=2, lessons_done=1
+        )
+        self.assertEqual(purge_course(deletion.pk), "Удаление уже выполняется")
+
+        with mock.patch("materials.tasks.purge_course.delay") as delay:
+            resume_course_deletions()
+            delay.assert_not_called()
+            CourseDeletion.objects.update(
+                updated_at=timezone.now() - timedelta(hours=1)
+            )
+            resume_course_deletions()
+            delay.assert_called_once_with(deletion.pk)
+
+        purge_course(deletion.pk)
+        deletion.refresh_from_db()
+        self.assertEqual(deletion.status, "done")
+        self.assertEqual((deletion.lessons_done, deletion.lessons_total), (2, 2))
+        self.assertFalse(Course.all_objects.filter(pk=self.course.pk).exists())
+
+
+class CourseDocumentTest(APITestCase):
+    """Готовый документ курса отдается так же, как ответ сериализатора"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com", password="pass")
+        self.client.force_authenticate(self.user)
+        # Пользовательский текст, похожий на ссылку, не должен стать ссылкой
+        self.course = Course.objects.create(
+            name="/media/secret", description="/media/x", owner=self.user
+        )
+        Lesson.objects.create(
+            name="Урок",
+            description="/media/y",
+            video_url="https://youtube.com/watch?v=1",
+            course=self.course,
+            owner=self.user,
+        )
+        Course.objects.filter(pk=self.course.pk).update(
+            preview="courses/preview.jpg",
+            preview_variants={"webp": {"320": "variants/preview-320.webp"}},
+        )
+
+    @mock.patch("materials.tasks.build_course_document.delay")
+    def test_document_matches_serializer(self, delay):
+        url = reverse("course-detail", args=[self.course.pk])
+        expected = self.client.get(url)
+        self.assertEqual(expected.status_code, 200)
+        delay.assert_called_once_with(self.course.pk)
+
+        build_course_document(self.course.pk)
+        self.assertTrue(CourseDocument.objects.filter(course=self.course).exists())
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(hasattr(response, "data"))
+        self.assertEqual(response.json(), expected.json())
+
+        data = response.json()
+        self.assertEqual(data["name"], "/media/secret")
+        self.assertEqual(data["description"], "/media/x")
+        self.assertEqual(data["lessons"][0]["description"], "/media/y")
+        self.assertEqual(data["preview"], "http://testserver/media/courses/preview.jpg")
+        self.assertEqual(
+            data["preview_variants"],
+            {"webp": {"320": "http://testserver/media/variants/preview-320.webp"}},
+        )
+
+
+@mock.patch("materials.tasks.send_course_update_emails.delay")
+class CourseDigestTest(APITestCase):
+    """Изменения курса за окно уходят подписчикам одним письмом ровно раз"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com", password="pass")
+        self.course = Course.objects.create(
+            name="Курс", description="Описание", owner=self.user
+        )
+        Subscription.objects.create(user=self.user, course=self.course)
+
+    def send(self, digest):
+        with self.captureOnCommitCallbacks(execute=True):
+            return send_course_digest(digest.pk)
+
+    def test_materials_deduplicated(self, send_emails):
+        digest = record_course_change(self.course.pk, "course", "Курс")
+        lesson = Lesson(name="Урок", course=self.course)
+        record_lesson_changes([lesson, lesson])
+        record_course_change(self.course.pk, "course", "Курс")
+        self.assertEqual(digest.events.count(), 4)
+
+        self.send(digest)
+        send_emails.assert_called_once()
+        recipients, subject, message = send_emails.call_args.args
+        self.assertEqual(recipients, ["user@example.com"])
+        self.assertEqual(message.count("Курс: Курс"), 1)
+        self.assertEqual(message.count("Урок: Урок"), 1)
+        self.assertFalse(digest.events.exists())
+
+    def test_sent_once(self, send_emails):
+        digest = record_course_change(self.course.pk, "course", "Курс")
+        self.send(digest)
+        self.assertEqual(self.send(digest), "Дайджест уже отправлен")
+        send_emails.assert_called_once()
+
+    def test_window_rollover(self, send_emails):
+        digest = record_course_change(self.course.pk, "course", "Курс")
+        self.send(digest)
+        # Окно уже разослано: новое изменение попадает в следующее
+        late = record_course_change(self.course.pk, "lesson", "Урок")
+        self.assertNotEqual(late.pk, digest.pk)
+        self.assertEqual(
+            late.window_start - digest.window_start,
+            timedelta(minutes=settings.COURSE_DIGEST_WINDOW_MINUTES),
+        )
+        self.assertEqual(late.events.count(), 1)
+
+    def test_failed_dispatch_keeps_digest(self, send_emails):
+        digest = record_course_change(self.course.pk, "course", "Курс")
+        with mock.patch(
+            "materials.tasks.dispatch_to_subscribers", side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                self.send(digest)
+        digest.refresh_from_db()
+        self.assertIsNone(digest.sent_at)
+        self.assertEqual(digest.events.count(), 1)
+        send_emails.assert_not_called()
+
+        # Потерянный дайджест после конца окна подхватывает периодическая задача
+        with mock.patch("materials.tasks.send_course_digest.delay") as delay:
+            send_overdue_digests()
+            delay.assert_not_called()
+            CourseDigest.objects.update(window_start=timezone.now() - timedelta(days=1))
+            send_overdue_digests()
+            delay.assert_called_once_with(digest.pk)
+
+
+@mock.patch("materials.tasks.build_course_document.delay")
+class ConditionalRequestsTest(APITestCase):
+    """ETag: 304 для неизменных данных и 412 для устаревшего If-Match"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com", password="pass")
+        self.client.force_authenticate(self.user)
+        self.course = Course.objects.create(
+            name="Курс", description="Описание", owner=self.user
+        )
+        self.lesson = Lesson.objects.create(
+            name="Урок",
+            description="Описание",
+            video_url="https://youtube.com/watch?v=1",
+            course=self.course,
+            owner=self.user,
+        )
+        self.course_url = reverse("course-detail", args=[self.course.pk])
+        self.lesson_url = reverse("lesson-detail", args=[self.lesson.pk])
+
+    def test_detail_not_modified(self, delay):
+        response = self.client.get(self.course_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header("Last-Modified"))
+        etag = response["ETag"]
+        response = self.client.get(self.course_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_lesson_edit_changes_course_etag(self, delay):
+        etag = self.client.get(self.course_url)["ETag"]
+        response = self.client.patch(self.lesson_url, {"name": "Новый урок"})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.course_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_list_not_modified(self, delay):
+        for url in (reverse("course-list"), reverse("lesson-list-create")):
+            with self.subTest(url=url):
+                etag = self.client.get(url)["ETag"]
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                # У другой страницы свой ETag
+                response = self.client.get(
+                    url, {"page_size": 1}, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 200)
+
+        etag = self.client.get(reverse("lesson-list-create"))["ETag"]
+        self.lesson.delete()
+        response = self.client.get(
+            reverse("lesson-list-create"), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_stale_if_match_rejected(self, delay):
+        etag = self.client.get(self.course_url)["ETag"]
+        response = self.client.patch(
+            self.course_url, {"name": "Первая правка"}, HTTP_IF_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        fresh = response["ETag"]
+        self.assertNotEqual(fresh, etag)
+
+        response = self.client.patch(
+            self.course_url, {"name": "Вторая правка"}, HTTP_IF_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 412)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.name, "Первая правка")
+        response = self.client.get(self.course_url, HTTP_IF_NONE_MATCH=fresh)
+        self.assertEqual(response.status_code, 304)
+
+
+def png_upload(name, color):
+    buffer = BytesIO()
+    Image.new("RGB", (800, 400), color).save(buffer, format="PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+
+@mock.patch("materials.tasks.build_course_document.delay")
+@mock.patch(
+    "materials.tasks.remove_preview_variants.delay",
+    side_effect=remove_preview_variants,
+)
+@mock.patch(
+    "materials.tasks.generate_preview_variants.delay",
+    side_effect=generate_preview_variants,
+)
+class PreviewVariantsTest(APITestCase):
+    """Файлы вариантов замененного превью удаляются из хранилища"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(email="user@example.com", password="pass")
+
+    def save_preview(self, course, name, color):
+        course.preview = png_upload(name, color)
+        with self.captureOnCommitCallbacks(execute=True):
+            course.save()
+        course.refresh_from_db()
+        return get_variant_names(course.preview_variants)
+
+    def test_replaced_variants_are_deleted(self, *mocks):
+        course = Course(name="Курс", description="Описание", owner=self.user)
+        old_names = self.save_preview(course, "old.png", "red")
+        self.assertEqual(len(old_names), 6)
+        self.assertTrue(all(default_storage.exists(name) for name in old_names))
+
+        new_names = self.save_preview(course, "new.png", "blue")
+        self.assertEqual(len(new_names), 6)
+        self.assertTrue(all(default_storage.exists(name) for name in new_names))
+        self.assertFalse(any(default_storage.exists(name) for name in old_names))
+
+    def test_late_variants_are_deleted(self, generate_delay, *mocks):
+        course = Course(name="Курс", description="Описание", owner=self.user)
+        self.save_preview(course, "old.png", "red")
+        source_name = course.preview.name
+        self.save_preview(course, "new.png", "blue")
+
+        # Задача по старому превью закончилась уже после замены
+        with mock.patch(
+            "materials.tasks.delete_preview_variants",
+            wraps=delete_preview_variants,
+        ) as delete:
+            result = generate_preview_variants(
+                course._meta.label, course.pk, source_name
+            )
+        self.assertEqual(result, "Превью уже заменено или объект удален")
+        late_names = get_variant_names(delete.call_args.args[0])
+        self.assertEqual(len(late_names), 6)
+        self.assertFalse(any(default_storage.exists(name) for name in late_names))
+        course.refresh_from_db()
+        current = get_variant_names(course.preview_variants)
+        self.assertTrue(all(default_storage.exists(name) for name in current))
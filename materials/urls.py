@@ -1,8 +1,9 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 
-from .views import (CourseViewSet, LessonDetailView, LessonListCreateView,
-                    SubscriptionView)
+from .views import (CourseDeletionView, CourseSearchView, CourseViewSet,
+                    LessonDetailView, LessonListCreateView, LessonSearchView,
+                    SubscriptionBatchView, SubscriptionView, SyncView)
 
 router = DefaultRouter()
 router.register(r"courses", CourseViewSet)
@@ -12,4 +13,17 @@ urlpatterns = [
     path("lessons/", LessonListCreateView.as_view(), name="lesson-list-create"),
     path("lessons/<int:pk>/", LessonDetailView.as_view(), name="lesson-detail"),
     path("subscriptions/", SubscriptionView.as_view(), name="subscription"),
+    path(
+        "subscriptions/batch/",
+        SubscriptionBatchView.as_view(),
+        name="subscription-batch",
+    ),
+    path(
+        "course-deletions/<int:pk>/",
+        CourseDeletionView.as_view(),
+        name="course-deletion",
+    ),
+    path("sync/", SyncView.as_view(), name="sync"),
+    path("search/courses/", CourseSearchView.as_view(), name="course-search"),
+    path("search/lessons/", LessonSearchView.as_view(), name="lesson-search"),
 ] + router.urls
@@ -1,21 +1,38 @@
-from datetime import timedelta
-
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.core import signing
+from django.db.models import Count, Q, Sum
+from django.http import Http404, StreamingHttpResponse
 from django.utils import timezone
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import (OpenApiExample, OpenApiParameter,
                                    extend_schema, extend_schema_view)
-from rest_framework import generics, viewsets
+from rest_framework import generics, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import Course, Lesson, Subscription
-from .paginators import CoursePagination, LessonPagination
+from .conditional import ConditionalListMixin, ConditionalObjectMixin
+from .documents import CourseDocumentMixin
+from .exports import stream_csv, stream_ndjson
+from .models import Course, CourseDeletion, Lesson, Subscription, Tombstone
+from .notifications import record_course_change, record_lesson_changes
+from .paginators import (CourseHybridPagination, LessonHybridPagination,
+                         SearchCursorPagination)
 from .permissions import IsOwnerOrModerator
-from .serializers import (CourseSerializer, LessonSerializer,
-                          SubscriptionSerializer)
-from .tasks import send_course_update_email
+from .serializers import (CourseDeletionSerializer, CourseSearchSerializer,
+                          CourseSerializer, CourseSyncSerializer, LessonSearchSerializer,
+                          LessonSerializer, LessonSyncSerializer,
+                          SubscriptionBatchSerializer, SubscriptionSerializer)
+from .sync import (build_page_token, build_sync_token, get_changes_since,
+                   get_tombstone_horizon, parse_sync_token)
+
+
+EXPORT_FORMATS = {
+    "ndjson": (stream_ndjson, "application/x-ndjson; charset=utf-8", "ndjson"),
+    "csv": (stream_csv, "text/csv; charset=utf-8", "csv"),
+}
 
 
 @extend_schema_view(
@@ -41,14 +58,32 @@ from .tasks import send_course_update_email
         tags=["Курсы"],
     ),
     destroy=extend_schema(
-        summary="Удалить курс", description="Удалить курс", tags=["Курсы"]
+        summary="Удалить курс",
+        description=(
+            "Курс сразу скрывается, уроки, подписки и связи с платежами "
+            "удаляются в фоне. Ход удаления - GET /api/course-deletions/{id}/"
+        ),
+        tags=["Курсы"],
+        responses={202: CourseDeletionSerializer},
     ),
 )
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(
+    ConditionalListMixin,
+    ConditionalObjectMixin,
+    CourseDocumentMixin,
+    viewsets.ModelViewSet,
+):
     serializer_class = CourseSerializer
     permission_classes = [IsAuthenticated]
     queryset = Course.objects.none()
-    pagination_class = CoursePagination
+    pagination_class = CourseHybridPagination
+    etag_fields = (
+        "pk",
+        "version",
+        "subscriber_count",
+        "paid_revenue",
+        "annotated_is_subscribed",
+    )
 
     def get_permissions(self):
         if self.action == "create":
@@ -60,35 +95,69 @@ class CourseViewSet(viewsets.ModelViewSet):
         return super().get_permissions()
 
     def get_queryset(self):
-        return Course.objects.filter(owner=self.request.user)
+        return Course.objects.filter(owner=self.request.user).with_api_annotations(
+            self.request.user
+        )
+
+    def get_stamp_queryset(self):
+        return Course.objects.filter(owner=self.request.user).with_subscription(
+            self.request.user
+        )
+
+    def get_list_aggregates(self):
+        aggregates = super().get_list_aggregates()
+        aggregates["subscribed"] = Count(
+            "pk", filter=Q(annotated_is_subscribed=True)
+        )
+        # Свертка шардов меняет счетчики без подъема версии курса
+        aggregates["subscribers"] = Sum("subscriber_count")
+        aggregates["revenue"] = Sum("paid_revenue")
+        return aggregates
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
-    def update(self, request, *args, **kwargs):
-        instance = self.get_object()
-        last_updated = instance.updated_at
-        response = super().update(request, *args, **kwargs)
-        instance.refresh_from_db()
-        if timezone.now() - last_updated > timedelta(hours=4):
-            material_title = getattr(instance, "name", "материал")
-            for sub in instance.subscriptions.all():
-                send_course_update_email.delay(
-                    sub.user.email, instance.name, material_title
-                )
-        return response
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        course = serializer.instance
+        record_course_change(course.pk, "course", course.name)
 
-    def partial_update(self, request, *args, **kwargs):
-        instance = self.get_object()
-        last_updated = instance.updated_at
-        response = super().partial_update(request, *args, **kwargs)
-        instance.refresh_from_db()
-        if timezone.now() - last_updated > timedelta(hours=4):
-            material_title = getattr(instance, "name", "материал")
-            for sub in instance.subscriptions.all():
-                send_course_update_email.delay(
-                    sub.user.email, instance.name, material_title
-                )
+    def destroy(self, request, *args, **kwargs):
+        deletion = CourseDeletion.objects.schedule(self.get_object())
+        return Response(
+            CourseDeletionSerializer(deletion).data, status=status.HTTP_202_ACCEPTED
+        )
+
+    @extend_schema(
+        summary="Выгрузка курсов",
+        description=(
+            "Потоковая выгрузка всех курсов пользователя с уроками: NDJSON "
+            "(курс на строку, уроки вложены) или CSV (урок на строку)"
+        ),
+        tags=["Курсы"],
+        parameters=[
+            OpenApiParameter(
+                name="export_format",
+                type=OpenApiTypes.STR,
+                enum=list(EXPORT_FORMATS),
+                description="Формат выгрузки (по умолчанию ndjson)",
+            )
+        ],
+        responses={(200, "application/x-ndjson"): OpenApiTypes.STR},
+    )
+    @action(detail=False, methods=["get"])
+    def export(self, request, *args, **kwargs):
+        export_format = request.query_params.get("export_format", "ndjson")
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError(
+                {"export_format": [f"Допустимые значения: {', '.join(EXPORT_FORMATS)}"]}
+            )
+        stream, content_type, extension = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(
+            stream(Course.objects.filter(owner=request.user)),
+            content_type=content_type,
+        )
+        response["Content-Disposition"] = f'attachment; filename="courses.{extension}"'
         return response
 
 
@@ -99,20 +168,67 @@ class CourseViewSet(viewsets.ModelViewSet):
         tags=["Уроки"],
     ),
     post=extend_schema(
-        summary="Создать урок", description="Создать новый урок", tags=["Уроки"]
+        summary="Создать урок",
+        description="Создать новый урок или, если передан список, пачку уроков",
+        tags=["Уроки"],
+    ),
+    put=extend_schema(
+        summary="Пакетно обновить уроки",
+        description="Полностью обновить список уроков (у каждого обязателен id)",
+        tags=["Уроки"],
+        request=LessonSerializer(many=True),
+        responses=LessonSerializer(many=True),
+    ),
+    patch=extend_schema(
+        summary="Пакетно частично обновить уроки",
+        description="Частично обновить список уроков (у каждого обязателен id)",
+        tags=["Уроки"],
+        request=LessonSerializer(many=True),
+        responses=LessonSerializer(many=True),
     ),
 )
-class LessonListCreateView(generics.ListCreateAPIView):
+class LessonListCreateView(ConditionalListMixin, generics.ListCreateAPIView):
     serializer_class = LessonSerializer
     permission_classes = [IsAuthenticated]
     queryset = Lesson.objects.none()
-    pagination_class = LessonPagination
+    pagination_class = LessonHybridPagination
 
     def get_queryset(self):
         return Lesson.objects.filter(owner=self.request.user)
 
+    def get_serializer(self, *args, **kwargs):
+        # Список в теле запроса включает пакетный режим
+        if isinstance(kwargs.get("data"), list):
+            kwargs["many"] = True
+            kwargs["max_length"] = settings.LESSON_BULK_MAX_SIZE
+        return super().get_serializer(*args, **kwargs)
+
     def perform_create(self, serializer):
-        serializer.save(owner=self.request.user)
+        lessons = serializer.save(owner=self.request.user)
+        record_lesson_changes(lessons if isinstance(lessons, list) else [lessons])
+
+    def put(self, request, *args, **kwargs):
+        return self.bulk_update(request, partial=False)
+
+    def patch(self, request, *args, **kwargs):
+        return self.bulk_update(request, partial=True)
+
+    def bulk_update(self, request, partial):
+        if not isinstance(request.data, list):
+            return Response(
+                {"non_field_errors": ["Ожидается список уроков"]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        lesson_ids = [
+            item["id"]
+            for item in request.data
+            if isinstance(item, dict) and isinstance(item.get("id"), int)
+        ]
+        lessons = list(self.get_queryset().filter(pk__in=lesson_ids))
+        serializer = self.get_serializer(lessons, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        record_lesson_changes(serializer.save())
+        return Response(serializer.data)
 
 
 @extend_schema(
@@ -144,18 +260,62 @@ class SubscriptionView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
-        user = request.user
-        course_id = request.data.get("course_id")
-        course = get_object_or_404(Course, id=course_id)
+        try:
+            course_id = int(request.data.get("course_id"))
+        except (TypeError, ValueError):
+            raise Http404
 
-        subscription = Subscription.objects.filter(user=user, course=course)
+        result = Subscription.objects.toggle(request.user, course_id)
 
-        if subscription.exists():
-            subscription.delete()
+        if result is None:
+            raise Http404
+        if result == "deleted":
             return Response(status=204)  # No Content - подписка удалена
-        else:
-            Subscription.objects.create(user=user, course=course)
-            return Response(status=201)  # Created - подписка создана
+        return Response(status=201)  # Created - подписка создана
+
+
+@extend_schema(
+    summary="Пакетное управление подписками",
+    description="Подписать или отписать пользователя сразу от нескольких курсов",
+    tags=["Подписки"],
+    request=SubscriptionBatchSerializer,
+    responses={
+        200: {
+            "description": "Результат операции",
+            "type": "object",
+            "properties": {
+                "subscribed": {"type": "array", "items": {"type": "integer"}},
+                "not_found": {"type": "array", "items": {"type": "integer"}},
+                "unsubscribed": {"type": "integer"},
+            },
+        },
+    },
+    examples=[
+        OpenApiExample(
+            "Подписка на несколько курсов",
+            value={"course_ids": [1, 2, 3], "action": "subscribe"},
+        )
+    ],
+)
+class SubscriptionBatchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = SubscriptionBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        course_ids = set(serializer.validated_data["course_ids"])
+
+        if serializer.validated_data["action"] == "unsubscribe":
+            deleted = Subscription.objects.unsubscribe_many(request.user, course_ids)
+            return Response({"unsubscribed": deleted})
+
+        subscribed = Subscription.objects.subscribe_many(request.user, course_ids)
+        return Response(
+            {
+                "subscribed": sorted(subscribed),
+                "not_found": sorted(course_ids - set(subscribed)),
+            }
+        )
 
 
 @extend_schema_view(
@@ -176,7 +336,7 @@ class SubscriptionView(APIView):
         summary="Удалить урок", description="Удалить урок", tags=["Уроки"]
     ),
 )
-class LessonDetailView(generics.RetrieveUpdateDestroyAPIView):
+class LessonDetailView(ConditionalObjectMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = LessonSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrModerator]
     queryset = Lesson.objects.none()
@@ -184,30 +344,186 @@ class LessonDetailView(generics.RetrieveUpdateDestroyAPIView):
     def get_queryset(self):
         return Lesson.objects.filter(owner=self.request.user)
 
-    def update(self, request, *args, **kwargs):
-        instance = self.get_object()
-        course = instance.course
-        last_updated = course.updated_at
-        response = super().update(request, *args, **kwargs)
-        course.refresh_from_db()
-        if timezone.now() - last_updated > timedelta(hours=4):
-            material_title = getattr(instance, "name", "материал")
-            for sub in course.subscriptions.all():
-                send_course_update_email.delay(
-                    sub.user.email, course.name, material_title
-                )
-        return response
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        lesson = serializer.instance
+        record_course_change(lesson.course_id, "lesson", lesson.name)
 
-    def partial_update(self, request, *args, **kwargs):
-        instance = self.get_object()
-        course = instance.course
-        last_updated = course.updated_at
-        response = super().partial_update(request, *args, **kwargs)
-        course.refresh_from_db()
-        if timezone.now() - last_updated > timedelta(hours=4):
-            material_title = getattr(instance, "name", "материал")
-            for sub in course.subscriptions.all():
-                send_course_update_email.delay(
-                    sub.user.email, course.name, material_title
-                )
-        return response
+
+SEARCH_PARAMETERS = [
+    OpenApiParameter(
+        "q",
+        OpenApiTypes.STR,
+        required=True,
+        description='Поисковый запрос: слова, "фраза", -исключение, or',
+    ),
+]
+
+
+class SearchView(generics.ListAPIView):
+    """
+    Поиск по материалам пользователя. Результаты отсортированы по
+    релевантности и отдаются курсорными страницами.
+    """
+
+    permission_classes = [IsAuthenticated]
+    pagination_class = SearchCursorPagination
+    search_query_param = "q"
+    model = None
+
+    def get_search_text(self):
+        text = self.request.query_params.get(self.search_query_param, "").strip()
+        if not text:
+            raise ValidationError(
+                {self.search_query_param: ["Укажите поисковый запрос"]}
+            )
+        return text
+
+    def get_queryset(self):
+        return self.model.objects.filter(owner=self.request.user).search(
+            self.get_search_text()
+        )
+
+
+@extend_schema(
+    summary="Поиск курсов",
+    description="Полнотекстовый поиск по названию и описанию курсов пользователя",
+    tags=["Поиск"],
+    parameters=SEARCH_PARAMETERS,
+)
+class CourseSearchView(SearchView):
+    serializer_class = CourseSearchSerializer
+    queryset = Course.objects.none()
+    model = Course
+
+
+@extend_schema(
+    summary="Поиск уроков",
+    description="Полнотекстовый поиск по названию и описанию уроков пользователя",
+    tags=["Поиск"],
+    parameters=SEARCH_PARAMETERS,
+)
+class LessonSearchView(SearchView):
+    serializer_class = LessonSearchSerializer
+    queryset = Lesson.objects.none()
+    model = Lesson
+
+
+@extend_schema(
+    summary="Синхронизация изменений",
+    description=(
+        "Курсы и уроки пользователя, созданные, измененные или удаленные с "
+        "момента выдачи token. Без token (или со слишком старым token) "
+        "возвращается полный снимок, первая страница которого помечена "
+        "reset=true. Ответ содержит не больше COURSE_SYNC_PAGE_SIZE курсов и "
+        "уроков; при has_more=true следующая страница запрашивается с token "
+        "из ответа. Token последней страницы передается в следующую "
+        "синхронизацию"
+    ),
+    tags=["Синхронизация"],
+    parameters=[
+        OpenApiParameter(
+            name="token",
+            type=OpenApiTypes.STR,
+            description="Токен из предыдущего ответа синхронизации",
+        )
+    ],
+    responses={
+        200: {
+            "type": "object",
+            "properties": {
+                "token": {"type": "string"},
+                "reset": {"type": "boolean"},
+                "has_more": {"type": "boolean"},
+                "courses": {"type": "array", "items": {"type": "object"}},
+                "lessons": {"type": "array", "items": {"type": "object"}},
+                "deleted": {
+                    "type": "object",
+                    "properties": {
+                        "courses": {"type": "array", "items": {"type": "integer"}},
+                        "lessons": {"type": "array", "items": {"type": "integer"}},
+                    },
+                },
+            },
+        }
+    },
+)
+class SyncView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        now = timezone.now()
+        cursor = {"since": None, "started": None, "courses": 0, "lessons": 0}
+        token = request.query_params.get("token")
+        if token:
+            try:
+                cursor = parse_sync_token(token)
+            except (signing.BadSignature, KeyError, TypeError, ValueError):
+                raise ValidationError({"token": ["Недействительный токен синхронизации"]})
+
+        # Все страницы одной синхронизации считаются от момента первой:
+        # изменения во время обхода придут со следующим токеном
+        first_page = cursor["started"] is None
+        started = cursor["started"] or now
+        since = cursor["since"]
+        full = since is None or since < get_tombstone_horizon(started)
+
+        courses = Course.objects.filter(owner=request.user).order_by("id")
+        lessons = Lesson.objects.filter(owner=request.user).order_by("id")
+        deleted = {"courses": [], "lessons": []}
+        if not full:
+            changed_after = get_changes_since(since)
+            courses = courses.filter(updated_at__gt=changed_after)
+            lessons = lessons.filter(updated_at__gt=changed_after)
+            if first_page:
+                tombstones = Tombstone.objects.filter(
+                    owner=request.user, deleted_at__gt=changed_after
+                ).values_list("material_type", "object_id")
+                for material_type, object_id in tombstones:
+                    deleted[f"{material_type}s"].append(object_id)
+
+        # Страница по id: лишняя строка показывает, что выборка не закончилась
+        size = settings.COURSE_SYNC_PAGE_SIZE
+        courses = list(courses.filter(id__gt=cursor["courses"])[: size + 1])
+        lessons = list(lessons.filter(id__gt=cursor["lessons"])[: size + 1])
+        has_more = len(courses) > size or len(lessons) > size
+        courses, lessons = courses[:size], lessons[:size]
+        if has_more:
+            next_token = build_page_token(
+                None if full else since,
+                started,
+                courses[-1].id if courses else cursor["courses"],
+                lessons[-1].id if lessons else cursor["lessons"],
+            )
+        else:
+            next_token = build_sync_token(started)
+
+        context = {"request": request}
+        return Response(
+            {
+                "token": next_token,
+                "reset": full and first_page,
+                "has_more": has_more,
+                "courses": CourseSyncSerializer(
+                    courses, many=True, context=context
+                ).data,
+                "lessons": LessonSyncSerializer(
+                    lessons, many=True, context=context
+                ).data,
+                "deleted": deleted,
+            }
+        )
+
+
+@extend_schema(
+    summary="Ход удаления курса",
+    description="Статус фонового удаления курса и количество обработанных строк",
+    tags=["Курсы"],
+)
+class CourseDeletionView(generics.RetrieveAPIView):
+    serializer_class = CourseDeletionSerializer
+    permission_classes = [IsAuthenticated]
+    queryset = CourseDeletion.objects.none()
+
+    def get_queryset(self):
+        return CourseDeletion.objects.filter(owner=self.request.user)
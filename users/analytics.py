@@ -0,0 +1,135 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import AnalyticsWatermark, Payment, RevenueDaily, RevenueDirtyDay
+
+REVENUE_WATERMARK = "revenue_daily"
+
+# Группировка ряда выручки: period -> выражение от поля day
+REVENUE_PERIODS = {
+    "day": F,
+    "week": TruncWeek,
+    "month": TruncMonth,
+}
+
+FUNNEL_STATUSES = [value for value, _ in Payment.PAYMENT_STATUSES]
+
+
+def get_changed_days(since):
+    """Дни платежей, измененных после since (None - все дни)"""
+    payments = Payment.objects.all()
+    if since is not None:
+        payments = payments.filter(updated_at__gte=since)
+    return set(
+        payments.annotate(day=TruncDate("payment_date"))
+        .order_by()
+        .values_list("day", flat=True)
+        .distinct()
+    )
+
+
+def recompute_day(day):
+    """Заменяет строки RevenueDaily за день агрегатом по платежам этого дня"""
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(day, time.min), tz)
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min), tz)
+    buckets = (
+        Payment.objects.filter(payment_date__gte=start, payment_date__lt=end)
+        .order_by()
+        .values("course_id", "payment_method", "payment_status")
+        .annotate(count=Count("pk"), amount=Sum("amount"))
+    )
+    RevenueDaily.objects.filter(day=day).delete()
+    RevenueDaily.objects.bulk_create(RevenueDaily(day=day, **row) for row in buckets)
+
+
+def refresh_revenue_daily():
+    """
+    Пересчитывает RevenueDaily только за дни, в которых что-то изменилось с
+    прошлого запуска: по Payment.updated_at после отметки и по дням удаленных
+    платежей. Отметка сдвигается назад на REVENUE_REFRESH_OVERLAP_SECONDS,
+    чтобы учесть транзакции, закоммиченные после прошлого запуска со старым
+    updated_at. Первый запуск пересчитывает все дни.
+    """
+    started = timezone.now()
+    with transaction.atomic():
+        watermark = (
+            AnalyticsWatermark.objects.select_for_update()
+            .filter(name=REVENUE_WATERMARK)
+            .first()
+        )
+        since = None
+        if watermark is not None:
+            since = watermark.value - timedelta(
+                seconds=settings.REVENUE_REFRESH_OVERLAP_SECONDS
+            )
+        days = get_changed_days(since) | RevenueDirtyDay.objects.claim()
+        for day in sorted(days):
+            recompute_day(day)
+        AnalyticsWatermark.objects.update_or_create(
+            name=REVENUE_WATERMARK, defaults={"value": started}
+        )
+    return len(days)
+
+
+def _totals():
+    return {"count": Sum("count"), "amount": Sum("amount")}
+
+
+def _course_names(course_ids):
+    from materials.models import Course
+
+    return dict(Course.all_objects.filter(pk__in=course_ids).values_list("pk", "name"))
+
+
+def build_revenue_report(period="day", date_from=None, date_to=None):
+    """
+    Отчет по выручке из RevenueDaily: ряд по периодам с воронкой статусов,
+    оплаченная выручка по курсам и способам оплаты, итоги по статусам.
+    """
+    rows = RevenueDaily.objects.order_by()
+    if date_from:
+        rows = rows.filter(day__gte=date_from)
+    if date_to:
+        rows = rows.filter(day__lte=date_to)
+    paid = rows.filter(payment_status="paid")
+
+    funnel_columns = {}
+    for status in FUNNEL_STATUSES:
+        status_filter = Q(payment_status=status)
+        funnel_columns[f"{status}_count"] = Sum(
+            "count", filter=status_filter, default=0
+        )
+        funnel_columns[f"{status}_amount"] = Sum(
+            "amount", filter=status_filter, default=0
+        )
+
+    series = (
+        rows.annotate(period=REVENUE_PERIODS[period]("day"))
+        .values("period")
+        .annotate(**funnel_columns)
+        .order_by("period")
+    )
+    by_course = list(paid.values("course_id").annotate(**_totals()).order_by("-amount"))
+    names = _course_names([row["course_id"] for row in by_course])
+    for row in by_course:
+        row["course_name"] = names.get(row["course_id"], "")
+
+    funnel = {status: {"count": 0, "amount": 0} for status in FUNNEL_STATUSES}
+    for row in rows.values("payment_status").annotate(**_totals()):
+        funnel[row["payment_status"]] = {"count": row["count"], "amount": row["amount"]}
+
+    return {
+        "period": period,
+        "series": list(series),
+        "by_course": by_course,
+        "by_method": list(
+            paid.values("payment_method").annotate(**_totals()).order_by("-amount")
+        ),
+        "funnel": funnel,
+    }
@@ -1,7 +1,6 @@
 import django_filters
-from django.db.models import Q
 
-from .models import Payment
+from .models import Payment, PaymentRollup
 
 
 class PaymentFilter(django_filters.FilterSet):
@@ -13,10 +12,18 @@ class PaymentFilter(django_filters.FilterSet):
     search = django_filters.CharFilter(method="custom_search")
 
     def custom_search(self, queryset, name, value):
-        return queryset.filter(
-            Q(course__name__icontains=value) | Q(lesson__name__icontains=value)
-        )
+        return queryset.search(value)
 
     class Meta:
         model = Payment
         fields = ["course", "lesson", "payment_method"]
+
+
+class PaymentRollupFilter(django_filters.FilterSet):
+    payment_status = django_filters.ChoiceFilter(choices=Payment.PAYMENT_STATUSES)
+    date_from = django_filters.DateFilter(field_name="day", lookup_expr="gte")
+    date_to = django_filters.DateFilter(field_name="day", lookup_expr="lte")
+
+    class Meta:
+        model = PaymentRollup
+        fields = ["payment_status", "date_from", "date_to"]
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from users.models import PaymentRollup, User
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает сводки платежей (PaymentRollup) по таблице платежей"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", type=int, nargs="*", help="ID пользователей (по умолчанию все)"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Сколько пользователей пересчитывать в одной транзакции",
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by("pk")
+        if options["user"]:
+            users = users.filter(pk__in=options["user"])
+        user_ids = list(users.values_list("pk", flat=True))
+
+        batch_size = options["batch_size"]
+        created = 0
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start : start + batch_size]
+            created += PaymentRollup.objects.rebuild(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Пересчитано пользователей: {len(user_ids)}, сводок: {created}"
+            )
+        )
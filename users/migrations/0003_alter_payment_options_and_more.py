@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0006_alter_course_options_alter_lesson_options_and_more"),
+        ("users", "0002_payment_payment_status_and_more"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="payment",
+            options={
+                "ordering": ["-payment_date", "id"],
+                "verbose_name": "Платеж",
+                "verbose_name_plural": "Платежи",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["user", "-payment_date", "id"], name="payment_user_date_id_idx"
+            ),
+        ),
+    ]
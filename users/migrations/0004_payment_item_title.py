@@ -0,0 +1,54 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:06
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_item_titles(apps, schema_editor):
+    Payment = apps.get_model("users", "Payment")
+    Course = apps.get_model("materials", "Course")
+    Lesson = apps.get_model("materials", "Lesson")
+    Payment.objects.update(
+        item_title=Coalesce(
+            Subquery(Course.objects.filter(pk=OuterRef("course_id")).values("name")[:1]),
+            Subquery(Lesson.objects.filter(pk=OuterRef("lesson_id")).values("name")[:1]),
+            Value(""),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0009_search_vector"),
+        ("users", "0003_alter_payment_options_and_more"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name="payment",
+            name="item_title",
+            field=models.CharField(
+                blank=True,
+                default="",
+                max_length=255,
+                verbose_name="Название оплаченного материала",
+            ),
+        ),
+        migrations.RunPython(fill_item_titles, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="payment",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("item_title"),
+                    name="gin_trgm_ops",
+                ),
+                name="payment_item_title_trgm_idx",
+            ),
+        ),
+    ]
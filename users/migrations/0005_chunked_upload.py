@@ -0,0 +1,97 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:15
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0004_payment_item_title"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChunkedUpload",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "target",
+                    models.CharField(
+                        choices=[
+                            ("avatar", "Аватар пользователя"),
+                            ("course_preview", "Превью курса"),
+                            ("lesson_preview", "Превью урока"),
+                        ],
+                        max_length=20,
+                        verbose_name="Назначение",
+                    ),
+                ),
+                (
+                    "object_id",
+                    models.PositiveBigIntegerField(
+                        blank=True, null=True, verbose_name="ID курса или урока"
+                    ),
+                ),
+                (
+                    "filename",
+                    models.CharField(max_length=255, verbose_name="Имя файла"),
+                ),
+                ("size", models.PositiveBigIntegerField(verbose_name="Размер файла")),
+                (
+                    "offset",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Принято байт"
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("uploading", "Загружается"),
+                            ("complete", "Завершена"),
+                        ],
+                        default="uploading",
+                        max_length=20,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Создана"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Обновлена"),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="chunked_uploads",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Загрузка по частям",
+                "verbose_name_plural": "Загрузки по частям",
+                "indexes": [
+                    models.Index(
+                        fields=["updated_at"], name="chunked_upload_updated_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:27
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_rollups(apps, schema_editor):
+    Payment = apps.get_model("users", "Payment")
+    PaymentRollup = apps.get_model("users", "PaymentRollup")
+    buckets = (
+        Payment.objects.annotate(day=TruncDate("payment_date"))
+        .order_by()
+        .values("user_id", "payment_method", "payment_status", "day")
+        .annotate(count=Count("pk"), amount=Sum("amount"))
+    )
+    PaymentRollup.objects.bulk_create(
+        (PaymentRollup(**bucket) for bucket in buckets.iterator()), batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0005_chunked_upload"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "payment_method",
+                    models.CharField(
+                        choices=[
+                            ("cash", "Наличные"),
+                            ("transfer", "Перевод на счет"),
+                            ("stripe", "Stripe"),
+                        ],
+                        max_length=20,
+                        verbose_name="Способ оплаты",
+                    ),
+                ),
+                (
+                    "payment_status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Ожидает оплаты"),
+                            ("paid", "Оплачен"),
+                            ("failed", "Ошибка оплаты"),
+                            ("cancelled", "Отменен"),
+                        ],
+                        max_length=20,
+                        verbose_name="Статус платежа",
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="День")),
+                (
+                    "count",
+                    models.IntegerField(
+                        default=0, verbose_name="Количество платежей"
+                    ),
+                ),
+                (
+                    "amount",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("0"),
+                        max_digits=14,
+                        verbose_name="Сумма платежей",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="payment_rollups",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Сводка платежей",
+                "verbose_name_plural": "Сводки платежей",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "payment_method", "payment_status", "day"),
+                        name="unique_payment_rollup",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,131 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0014_course_deletion"),
+        ("users", "0006_payment_rollup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AnalyticsWatermark",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        max_length=50, unique=True, verbose_name="Агрегат"
+                    ),
+                ),
+                ("value", models.DateTimeField(verbose_name="Учтено до")),
+            ],
+            options={
+                "verbose_name": "Отметка обновления аналитики",
+                "verbose_name_plural": "Отметки обновления аналитики",
+            },
+        ),
+        migrations.CreateModel(
+            name="RevenueDaily",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="День")),
+                (
+                    "course_id",
+                    models.PositiveBigIntegerField(
+                        blank=True, null=True, verbose_name="ID курса"
+                    ),
+                ),
+                (
+                    "payment_method",
+                    models.CharField(
+                        choices=[
+                            ("cash", "Наличные"),
+                            ("transfer", "Перевод на счет"),
+                            ("stripe", "Stripe"),
+                        ],
+                        max_length=20,
+                        verbose_name="Способ оплаты",
+                    ),
+                ),
+                (
+                    "payment_status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Ожидает оплаты"),
+                            ("paid", "Оплачен"),
+                            ("failed", "Ошибка оплаты"),
+                            ("cancelled", "Отменен"),
+                        ],
+                        max_length=20,
+                        verbose_name="Статус платежа",
+                    ),
+                ),
+                (
+                    "count",
+                    models.PositiveIntegerField(verbose_name="Количество платежей"),
+                ),
+                (
+                    "amount",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=14, verbose_name="Сумма платежей"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Выручка за день",
+                "verbose_name_plural": "Выручка по дням",
+            },
+        ),
+        migrations.CreateModel(
+            name="RevenueDirtyDay",
+            fields=[
+                (
+                    "day",
+                    models.DateField(
+                        primary_key=True, serialize=False, verbose_name="День"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "День для пересчета выручки",
+                "verbose_name_plural": "Дни для пересчета выручки",
+            },
+        ),
+        migrations.AddField(
+            model_name="payment",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, verbose_name="Время обновления"),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(fields=["payment_date"], name="payment_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(fields=["updated_at"], name="payment_updated_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="revenuedaily",
+            index=models.Index(fields=["day"], name="revenue_daily_day_idx"),
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0015_stripe_product"),
+        ("users", "0007_revenue_daily"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StripePrice",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "amount",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=10, verbose_name="Сумма"
+                    ),
+                ),
+                ("currency", models.CharField(max_length=3, verbose_name="Валюта")),
+                (
+                    "stripe_product_id",
+                    models.CharField(
+                        max_length=255, verbose_name="ID продукта в Stripe"
+                    ),
+                ),
+                (
+                    "stripe_price_id",
+                    models.CharField(max_length=255, verbose_name="ID цены в Stripe"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Создана"),
+                ),
+                (
+                    "course",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stripe_prices",
+                        to="materials.course",
+                        verbose_name="Курс",
+                    ),
+                ),
+                (
+                    "lesson",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stripe_prices",
+                        to="materials.lesson",
+                        verbose_name="Урок",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Цена в Stripe",
+                "verbose_name_plural": "Цены в Stripe",
+                "constraints": [
+                    models.UniqueConstraint(
+                        condition=models.Q(("course__isnull", False)),
+                        fields=("course", "amount", "currency"),
+                        name="unique_course_stripe_price",
+                    ),
+                    models.UniqueConstraint(
+                        condition=models.Q(("lesson__isnull", False)),
+                        fields=("lesson", "amount", "currency"),
+                        name="unique_lesson_stripe_price",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0015_stripe_product"),
+        ("users", "0008_stripe_price"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StripeEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "event_id",
+                    models.CharField(
+                        max_length=255, unique=True, verbose_name="ID события"
+                    ),
+                ),
+                ("type", models.CharField(max_length=100, verbose_name="Тип события")),
+                (
+                    "session_id",
+                    models.CharField(max_length=255, verbose_name="ID сессии в Stripe"),
+                ),
+                (
+                    "session_payment_status",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        max_length=30,
+                        verbose_name="Статус оплаты сессии",
+                    ),
+                ),
+                (
+                    "payment_intent",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        max_length=255,
+                        verbose_name="ID платежа в Stripe",
+                    ),
+                ),
+                ("created", models.DateTimeField(verbose_name="Создано в Stripe")),
+                (
+                    "received_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Получено"),
+                ),
+                (
+                    "processed_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Обработано"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Событие Stripe",
+                "verbose_name_plural": "События Stripe",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["stripe_session_id"], name="payment_stripe_session_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stripeevent",
+            index=models.Index(
+                condition=models.Q(("processed_at__isnull", True)),
+                fields=["created", "id"],
+                name="stripe_event_pending_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stripeevent",
+            index=models.Index(
+                fields=["processed_at"], name="stripe_event_processed_idx"
+            ),
+        ),
+    ]
@@ -1,5 +1,16 @@
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser, BaseUserManager
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db import connections, models, transaction
+from django.db.models import (Count, F, OuterRef, Prefetch, Subquery, Sum,
+                              Value)
+from django.db.models.functions import Coalesce, TruncDate, Upper
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
@@ -58,6 +69,108 @@ class User(AbstractUser):
         ordering = ["email"]  # Добавьте эту строку
 
 
+class PaymentQuerySet(models.QuerySet):
+    def refresh_item_titles(self):
+        """
+        Пересчитывает item_title одним UPDATE. Вызывается при переименовании
+        курса или урока (Course.save, Lesson.save, пакетное обновление уроков).
+        """
+        from materials.models import Course, Lesson
+
+        return self.update(
+            item_title=Coalesce(
+                Subquery(
+                    Course.all_objects.filter(pk=OuterRef("course_id")).values(
+                        "name"
+                    )[:1]
+                ),
+                Subquery(
+                    Lesson.all_objects.filter(pk=OuterRef("lesson_id")).values(
+                        "name"
+                    )[:1]
+                ),
+                Value(""),
+            )
+        )
+
+    def with_titles(self):
+        """
+        Платежи для списков PaymentSerializer: названия курса и урока
+        приходят в том же запросе через LEFT JOIN, из таблицы платежей
+        читаются только выводимые колонки.
+        """
+        return self.annotate(
+            course_title=F("course__name"), lesson_title=F("lesson__name")
+        ).only(
+            "id",
+            "user",
+            "payment_date",
+            "amount",
+            "payment_method",
+            "payment_status",
+            "course_id",
+            "lesson_id",
+            "stripe_session_id",
+        )
+
+    def apply_stripe_statuses(self, changes):
+        """
+        Применяет статусы из событий Stripe пачкой: changes - словарь
+        {stripe_session_id: (статус, payment_intent)}. Платежи блокируются
+        и читаются одним запросом, сохраняются одним bulk_update; выручка
+        курсов и сводки PaymentRollup правятся суммарными дельтами, а
+        updated_at обновляется для пересчета RevenueDaily. Недопустимые
+        переходы (например, из paid обратно в failed) пропускаются.
+        Возвращает число измененных платежей.
+        """
+        from materials.models import CourseCounterShard
+
+        payments = (
+            self.select_for_update()
+            .filter(stripe_session_id__in=list(changes))
+            .order_by("pk")
+        )
+        now = timezone.now()
+        changed, revenue, rollups = [], {}, {}
+        for payment in payments:
+            new_status, payment_intent = changes[payment.stripe_session_id]
+            allowed = Payment.STATUS_TRANSITIONS.get(new_status, ())
+            if payment.payment_status not in allowed:
+                continue
+            old_revenue = payment._loaded_revenue
+            old_rollup = payment._loaded_rollup
+            payment.payment_status = new_status
+            payment.stripe_payment_intent_id = (
+                payment_intent or payment.stripe_payment_intent_id
+            )
+            payment.updated_at = now
+            payment._loaded_revenue = payment.get_revenue_share()
+            payment._loaded_rollup = payment.get_rollup_share()
+            for share, sign in ((old_revenue, -1), (payment._loaded_revenue, 1)):
+                if share is not None:
+                    revenue[share[0]] = revenue.get(share[0], 0) + sign * share[1]
+            add_rollup_deltas(rollups, old_rollup, payment._loaded_rollup)
+            changed.append(payment)
+
+        if changed:
+            self.bulk_update(
+                changed,
+                ["payment_status", "stripe_payment_intent_id", "updated_at"],
+            )
+            for course_id in sorted(revenue):
+                if revenue[course_id]:
+                    CourseCounterShard.objects.add(
+                        [course_id], revenue=revenue[course_id]
+                    )
+            PaymentRollup.objects.apply(rollups)
+        return len(changed)
+
+    def search(self, value):
+        # icontains строит UPPER(item_title) LIKE UPPER(...), что обслуживает
+        # триграммный индекс payment_item_title_trgm_idx
+        return self.filter(item_title__icontains=value)
+
+
 class Payment(models.Model):
     PAYMENT_METHODS = [
         ("cash", "Наличные"),
@@ -72,6 +185,13 @@ class Payment(models.Model):
         ("cancelled", "Отменен"),
     ]
 
+    # Статус из события Stripe -> статусы, из которых в него можно перейти
+    STATUS_TRANSITIONS = {
+        "paid": {"pending", "failed", "cancelled"},
+        "failed": {"pending"},
+        "cancelled": {"pending"},
+    }
+
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -79,6 +199,8 @@ class Payment(models.Model):
         verbose_name="Пользователь",
     )
     payment_date = models.DateTimeField(auto_now_add=True, verbose_name="Дата оплаты")
+    # По времени изменения refresh_revenue_daily находит дни для пересчета
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Время обновления")
     course = models.ForeignKey(
         "materials.Course",  # Строковая ссылка
         on_delete=models.SET_NULL,
@@ -93,6 +215,13 @@ class Payment(models.Model):
         blank=True,
         verbose_name="Оплаченный урок",
     )
+    # Денормализованное название курса/урока для поиска без JOIN
+    item_title = models.CharField(
+        max_length=255,
+        blank=True,
+        default="",
+        verbose_name="Название оплаченного материала",
+    )
     amount = models.DecimalField(
         max_digits=10, decimal_places=2, verbose_name="Сумма оплаты"
     )
@@ -122,10 +251,494 @@ class Payment(models.Model):
         max_length=255, blank=True, null=True, verbose_name="ID платежа в Stripe"
     )
 
+    objects = PaymentQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.user} - {self.amount} ({self.payment_date})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем вклад платежа в выручку курса, чтобы при смене статуса
+        # или суммы поправить Course.paid_revenue на разницу
+        instance._loaded_revenue = instance.get_revenue_share()
+        instance._loaded_rollup = instance.get_rollup_share()
+        return instance
+
+    def get_item_title(self):
+        item = self.course or self.lesson
+        return item.name if item else ""
+
+    def get_revenue_share(self):
+        """(course_id, amount) для оплаченного платежа за курс, иначе None"""
+        fields = self.__dict__
+        if fields.get("payment_status") != "paid" or not fields.get("course_id"):
+            return None
+        return fields["course_id"], Decimal(str(fields.get("amount")))
+
+    def get_rollup_share(self):
+        """
+        (ключ PaymentRollup, сумма): ключ - (user_id, способ, статус, день).
+        None, если платеж еще не сохранен или загружен не полностью.
+        """
+        fields = self.__dict__
+        keys = ("user_id", "payment_method", "payment_status", "payment_date")
+        if any(fields.get(key) is None for key in keys) or fields.get("amount") is None:
+            return None
+        day = timezone.localdate(fields["payment_date"])
+        key = (
+            fields["user_id"],
+            fields["payment_method"],
+            fields["payment_status"],
+            day,
+        )
+        return key, Decimal(str(fields["amount"]))
+
+    def update_rollups(self, old_share, new_share):
+        PaymentRollup.objects.apply(add_rollup_deltas({}, old_share, new_share))
+
+    def update_course_revenue(self, old_share, new_share):
+        from materials.models import CourseCounterShard
+
+        if old_share == new_share:
+            return
+        if old_share is not None:
+            CourseCounterShard.objects.add([old_share[0]], revenue=-old_share[1])
+        if new_share is not None:
+            CourseCounterShard.objects.add([new_share[0]], revenue=new_share[1])
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            update_fields = kwargs["update_fields"] = {*update_fields, "updated_at"}
+        if update_fields is None or {"course", "lesson"} & update_fields:
+            self.item_title = self.get_item_title()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "item_title"}
+        old_share = getattr(self, "_loaded_revenue", None)
+        old_rollup = getattr(self, "_loaded_rollup", None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self._loaded_revenue = self.get_revenue_share()
+            self.update_course_revenue(old_share, self._loaded_revenue)
+            self._loaded_rollup = self.get_rollup_share()
+            self.update_rollups(old_rollup, self._loaded_rollup)
+
     class Meta:
         verbose_name = "Платеж"
         verbose_name_plural = "Платежи"
-        ordering = ["-payment_date"]
+        ordering = ["-payment_date", "id"]
+        indexes = [
+            models.Index(
+                fields=["user", "-payment_date", "id"], name="payment_user_date_id_idx"
+            ),
+            models.Index(fields=["payment_date"], name="payment_date_idx"),
+            models.Index(fields=["updated_at"], name="payment_updated_idx"),
+            # Поиск платежа по сессии при обработке событий Stripe
+            models.Index(
+                fields=["stripe_session_id"], name="payment_stripe_session_idx"
+            ),
+            GinIndex(
+                OpClass(Upper("item_title"), name="gin_trgm_ops"),
+                name="payment_item_title_trgm_idx",
+            ),
+        ]
+
+
+@receiver(post_delete, sender=Payment)
+def forget_deleted_payment(sender, instance, origin=None, **kwargs):
+    """
+    Убирает удаленный платеж из выручки курса, сводок PaymentRollup и
+    RevenueDaily. Сигнал приходит и при каскадном удалении пользователя,
+    и при удалении через queryset/админку, где Payment.delete не вызывается.
+    """
+    instance.update_course_revenue(getattr(instance, "_loaded_revenue", None), None)
+    # Платеж каскадно удаляется только вместе со своим пользователем, а его
+    # сводки удаляются тем же каскадом: дельта создала бы строку без владельца
+    origin_model = getattr(origin, "model", None) or type(origin)
+    if origin_model is not User:
+        instance.update_rollups(getattr(instance, "_loaded_rollup", None), None)
+    if instance.payment_date is not None:
+        RevenueDirtyDay.objects.mark(timezone.localdate(instance.payment_date))
+
+
+def prefetch_recent_payments(limit=None, to_attr="recent_payments"):
+    """
+    Prefetch последних платежей каждого пользователя для вложения в ответ.
+    Срез в Prefetch Django выполняет одним запросом с ROW_NUMBER() OVER
+    (PARTITION BY user_id), поэтому читается не больше limit строк на
+    пользователя, названия курса и урока приходят в том же запросе.
+    """
+    limit = limit or settings.PROFILE_RECENT_PAYMENTS
+    return Prefetch(
+        "payments",
+        queryset=Payment.objects.with_titles().order_by("-payment_date", "id")[:limit],
+        to_attr=to_attr,
+    )
+
+
+def add_rollup_deltas(deltas, old_share, new_share):
+    """
+    Копит в deltas изменения (count, amount) корзин PaymentRollup при
+    переходе платежа от old_share к new_share (см. get_rollup_share).
+    """
+    if old_share == new_share:
+        return deltas
+    if old_share is not None:
+        count, amount = deltas.get(old_share[0], (0, 0))
+        deltas[old_share[0]] = (count - 1, amount - old_share[1])
+    if new_share is not None:
+        count, amount = deltas.get(new_share[0], (0, 0))
+        deltas[new_share[0]] = (count + 1, amount + new_share[1])
+    return deltas
+
+
+class PaymentRollupQuerySet(models.QuerySet):
+    def add(self, key, count, amount):
+        """Прибавляет количество и сумму к корзине (user, способ, статус, день)"""
+        table = PaymentRollup._meta.db_table
+        sql = f"""
+            INSERT INTO {table}
+                (user_id, payment_method, payment_status, day, count, amount)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (user_id, payment_method, payment_status, day) DO UPDATE SET
+                count = {table}.count + EXCLUDED.count,
+                amount = {table}.amount + EXCLUDED.amount
+        """
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, [*key, count, amount])
+
+    def apply(self, deltas):
+        """Применяет накопленные add_rollup_deltas изменения"""
+        # Ключи по порядку, чтобы параллельные платежи блокировали строки
+        # в одной последовательности
+        for key in sorted(deltas):
+            if deltas[key] != (0, 0):
+                self.add(key, *deltas[key])
+
+    def rebuild(self, user_ids):
+        """
+        Пересчитывает корзины пользователей по таблице платежей. Платежи
+        блокируются от записи (SHARE) до конца транзакции, чтобы дельты
+        параллельных сохранений не потерялись и не посчитались дважды.
+        """
+        with transaction.atomic(using=self.db):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {Payment._meta.db_table} IN SHARE MODE")
+            self.filter(user_id__in=user_ids).delete()
+            # TruncDate берет текущий часовой пояс, как timezone.localdate
+            # в Payment.get_rollup_share
+            buckets = (
+                Payment.objects.filter(user_id__in=user_ids)
+                .annotate(day=TruncDate("payment_date"))
+                .order_by()
+                .values("user_id", "payment_method", "payment_status", "day")
+                .annotate(count=Count("pk"), amount=Sum("amount"))
+            )
+            rollups = self.bulk_create(
+                (PaymentRollup(**bucket) for bucket in buckets), batch_size=1000
+            )
+            return len(rollups)
+
+
+class PaymentRollup(models.Model):
+    """
+    Количество и сумма платежей пользователя по способу, статусу и дню.
+    Обновляется в одной транзакции с Payment.save/delete, поэтому статистика
+    читается за O(число корзин), а не O(число платежей).
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="payment_rollups",
+        verbose_name="Пользователь",
+    )
+    payment_method = models.CharField(
+        max_length=20, choices=Payment.PAYMENT_METHODS, verbose_name="Способ оплаты"
+    )
+    payment_status = models.CharField(
+        max_length=20, choices=Payment.PAYMENT_STATUSES, verbose_name="Статус платежа"
+    )
+    day = models.DateField(verbose_name="День")
+    # Не Positive: CHECK проверяется и для строки INSERT с отрицательной
+    # дельтой, даже если она уйдет в ON CONFLICT DO UPDATE
+    count = models.IntegerField(default=0, verbose_name="Количество платежей")
+    amount = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal("0"),
+        verbose_name="Сумма платежей",
+    )
+
+    objects = PaymentRollupQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Сводка платежей"
+        verbose_name_plural = "Сводки платежей"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "payment_method", "payment_status", "day"],
+                name="unique_payment_rollup",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.day} {self.payment_method}/{self.payment_status}"
+
+
+class RevenueDaily(models.Model):
+    """
+    Платежи всей платформы за день по курсу, способу и статусу. Таблицу
+    пересчитывает по измененным дням задача refresh_revenue_daily, отчеты
+    для финансов читают только ее.
+    """
+
+    day = models.DateField(verbose_name="День")
+    # Без внешнего ключа: строки за прошлые дни остаются и после удаления курса
+    course_id = models.PositiveBigIntegerField(
+        null=True, blank=True, verbose_name="ID курса"
+    )
+    payment_method = models.CharField(
+        max_length=20, choices=Payment.PAYMENT_METHODS, verbose_name="Способ оплаты"
+    )
+    payment_status = models.CharField(
+        max_length=20, choices=Payment.PAYMENT_STATUSES, verbose_name="Статус платежа"
+    )
+    count = models.PositiveIntegerField(verbose_name="Количество платежей")
+    amount = models.DecimalField(
+        max_digits=14, decimal_places=2, verbose_name="Сумма платежей"
+    )
+
+    class Meta:
+        verbose_name = "Выручка за день"
+        verbose_name_plural = "Выручка по дням"
+        indexes = [
+            models.Index(fields=["day"], name="revenue_daily_day_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.payment_method}/{self.payment_status}: {self.amount}"
+
+
+class RevenueDirtyDayQuerySet(models.QuerySet):
+    def mark(self, day):
+        """Отмечает день для пересчета (удаление платежа не видно по updated_at)"""
+        table = RevenueDirtyDay._meta.db_table
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (day) VALUES (%s) ON CONFLICT DO NOTHING", [day]
+            )
+
+    def claim(self):
+        """Забирает отмеченные дни одним DELETE ... RETURNING"""
+        table = RevenueDirtyDay._meta.db_table
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table} RETURNING day")
+            return {row[0] for row in cursor.fetchall()}
+
+
+class RevenueDirtyDay(models.Model):
+    day = models.DateField(primary_key=True, verbose_name="День")
+
+    objects = RevenueDirtyDayQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "День для пересчета выручки"
+        verbose_name_plural = "Дни для пересчета выручки"
+
+    def __str__(self):
+        return str(self.day)
+
+
+class AnalyticsWatermark(models.Model):
+    """Момент, до которого изменения уже учтены в агрегатах"""
+
+    name = models.CharField(max_length=50, unique=True, verbose_name="Агрегат")
+    value = models.DateTimeField(verbose_name="Учтено до")
+
+    class Meta:
+        verbose_name = "Отметка обновления аналитики"
+        verbose_name_plural = "Отметки обновления аналитики"
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class ChunkedUpload(models.Model):
+    """
+    Загрузка файла по частям. Части дописываются в файл во временном
+    каталоге CHUNKED_UPLOAD_DIR, offset хранит количество принятых байт,
+    поэтому после обрыва соединения загрузку можно продолжить с него.
+    """
+
+    TARGETS = [
+        ("avatar", "Аватар пользователя"),
+        ("course_preview", "Превью курса"),
+        ("lesson_preview", "Превью урока"),
+    ]
+
+    STATUSES = [
+        ("uploading", "Загружается"),
+        ("complete", "Завершена"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="chunked_uploads",
+        verbose_name="Пользователь",
+    )
+    target = models.CharField(max_length=20, choices=TARGETS, verbose_name="Назначение")
+    object_id = models.PositiveBigIntegerField(
+        null=True, blank=True, verbose_name="ID курса или урока"
+    )
+    filename = models.CharField(max_length=255, verbose_name="Имя файла")
+    size = models.PositiveBigIntegerField(verbose_name="Размер файла")
+    offset = models.PositiveBigIntegerField(default=0, verbose_name="Принято байт")
+    status = models.CharField(
+        max_length=20, choices=STATUSES, default="uploading", verbose_name="Статус"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создана")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлена")
+
+    def __str__(self):
+        return f"{self.user} - {self.filename} ({self.offset}/{self.size})"
+
+    class Meta:
+        verbose_name = "Загрузка по частям"
+        verbose_name_plural = "Загрузки по частям"
+        indexes = [
+            models.Index(fields=["updated_at"], name="chunked_upload_updated_idx"),
+        ]
+
+
+class StripePriceQuerySet(models.QuerySet):
+    def for_item(self, item):
+        """Цены продукта, который сейчас привязан к курсу или уроку"""
+        field = item._meta.model_name
+        return self.filter(**{field: item}, stripe_product_id=item.stripe_product_id)
+
+    def invalidate(self, item):
+        """Удаляет цены продуктов, которые больше не привязаны к объекту"""
+        field = item._meta.model_name
+        return (
+            self.filter(**{field: item})
+            .exclude(stripe_product_id=item.stripe_product_id)
+            .delete()
+        )
+
+    def lookup(self, item, amount, currency):
+        """ID закешированной цены или None, если ее еще нет"""
+        if not item.stripe_product_id:
+            return None
+        return (
+            self.for_item(item)
+            .filter(amount=amount, currency=currency)
+            .values_list("stripe_price_id", flat=True)
+            .first()
+        )
+
+
+class StripePrice(models.Model):
+    """
+    Кеш цен Stripe по (курс или урок, сумма, валюта). Цена привязана к
+    продукту, поэтому при замене продукта старые цены удаляются.
+    """
+
+    course = models.ForeignKey(
+        "materials.Course",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="stripe_prices",
+        verbose_name="Курс",
+    )
+    lesson = models.ForeignKey(
+        "materials.Lesson",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="stripe_prices",
+        verbose_name="Урок",
+    )
+    amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Сумма")
+    currency = models.CharField(max_length=3, verbose_name="Валюта")
+    stripe_product_id = models.CharField(
+        max_length=255, verbose_name="ID продукта в Stripe"
+    )
+    stripe_price_id = models.CharField(max_length=255, verbose_name="ID цены в Stripe")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создана")
+
+    objects = StripePriceQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.course or self.lesson} - {self.amount} {self.currency}"
+
+    class Meta:
+        verbose_name = "Цена в Stripe"
+        verbose_name_plural = "Цены в Stripe"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["course", "amount", "currency"],
+                condition=models.Q(course__isnull=False),
+                name="unique_course_stripe_price",
+            ),
+            models.UniqueConstraint(
+                fields=["lesson", "amount", "currency"],
+                condition=models.Q(lesson__isnull=False),
+                name="unique_lesson_stripe_price",
+            ),
+        ]
+
+
+class StripeEventQuerySet(models.QuerySet):
+    def record(self, events):
+        """
+        Сохраняет события вебхука; повторная доставка того же event_id
+        игнорируется уникальным индексом (ON CONFLICT DO NOTHING).
+        """
+        return self.bulk_create(events, ignore_conflicts=True)
+
+    def pending(self):
+        return self.filter(processed_at__isnull=True)
+
+
+class StripeEvent(models.Model):
+    """
+    Событие вебхука Stripe о сессии оплаты. Вебхук только записывает его,
+    статусы платежей применяет задача process_stripe_events.
+    """
+
+    event_id = models.CharField(max_length=255, unique=True, verbose_name="ID события")
+    type = models.CharField(max_length=100, verbose_name="Тип события")
+    session_id = models.CharField(max_length=255, verbose_name="ID сессии в Stripe")
+    session_payment_status = models.CharField(
+        max_length=30, blank=True, default="", verbose_name="Статус оплаты сессии"
+    )
+    payment_intent = models.CharField(
+        max_length=255, blank=True, default="", verbose_name="ID платежа в Stripe"
+    )
+    created = models.DateTimeField(verbose_name="Создано в Stripe")
+    received_at = models.DateTimeField(auto_now_add=True, verbose_name="Получено")
+    processed_at = models.DateTimeField(
+        null=True, blank=True, verbose_name="Обработано"
+    )
+
+    objects = StripeEventQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.type} ({self.event_id})"
+
+    class Meta:
+        verbose_name = "Событие Stripe"
+        verbose_name_plural = "События Stripe"
+        indexes = [
+            models.Index(
+                fields=["created", "id"],
+                condition=models.Q(processed_at__isnull=True),
+                name="stripe_event_pending_idx",
+            ),
+            models.Index(fields=["processed_at"], name="stripe_event_processed_idx"),
+        ]
@@ -0,0 +1,17 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+from materials.paginators import HybridPagination
+
+
+class PaymentPagination(PageNumberPagination):
+    page_size = 10
+
+
+class PaymentCursorPagination(CursorPagination):
+    page_size = 10
+    ordering = ("-payment_date", "id")
+
+
+class PaymentHybridPagination(HybridPagination):
+    page_number_class = PaymentPagination
+    cursor_class = PaymentCursorPagination
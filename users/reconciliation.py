@@ -0,0 +1,94 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import Payment
+from .services import StripeService
+
+# Запас перед самым старым ожидающим платежом: сессия создается сразу после
+# платежа, но часы Stripe и сервера могут расходиться
+SESSION_CREATED_MARGIN = timedelta(minutes=5)
+
+
+def get_session_change(session):
+    """Статус платежа по сессии из списка Stripe или None, если он не меняется"""
+    if session["payment_status"] in ("paid", "no_payment_required"):
+        return "paid"
+    if session["status"] == "expired":
+        return "cancelled"
+    return None
+
+
+def get_pending_payments(now):
+    """Ожидающие платежи Stripe не старше STRIPE_RECONCILE_MAX_DAYS"""
+    return Payment.objects.filter(
+        payment_status="pending",
+        stripe_session_id__isnull=False,
+        payment_date__gte=now - timedelta(days=settings.STRIPE_RECONCILE_MAX_DAYS),
+    )
+
+
+def expire_abandoned_sessions(pending, session_ids):
+    """
+    Завершает в Stripe открытые сессии, по которым у нас ждет платеж, и
+    возвращает их изменения для apply_stripe_statuses. Сессии с expires_at
+    истекают сами, сюда попадают только созданные без него.
+    """
+    changes = {}
+    local_ids = pending.filter(stripe_session_id__in=session_ids).values_list(
+        "stripe_session_id", flat=True
+    )
+    for session_id in local_ids:
+        try:
+            session = StripeService.expire_checkout_session(session_id)
+        except ValidationError:
+            # Сессию успели оплатить или завершить: итог придет вебхуком
+            continue
+        changes[session_id] = ("cancelled", session["payment_intent"])
+    return changes
+
+
+def reconcile_pending_payments(now=None):
+    """
+    Сверяет ожидающие платежи со списком сессий Stripe. Сессии читаются
+    страницами по 100 начиная с момента создания самого старого ожидающего
+    платежа, поэтому число запросов к API - число страниц, а не платежей.
+    Изменения каждой страницы применяются одним apply_stripe_statuses
+    (bulk_update). Открытые сессии старше STRIPE_CHECKOUT_EXPIRE_MINUTES
+    принудительно завершаются. Возвращает (страниц, изменено платежей).
+    """
+    now = now or timezone.now()
+    pending = get_pending_payments(now)
+    oldest = pending.aggregate(oldest=Min("payment_date"))["oldest"]
+    if oldest is None:
+        return 0, 0
+
+    created_gte = int((oldest - SESSION_CREATED_MARGIN).timestamp())
+    abandoned_before = now - timedelta(minutes=settings.STRIPE_CHECKOUT_EXPIRE_MINUTES)
+    pages = changed = 0
+    starting_after = None
+    while True:
+        page = StripeService.list_checkout_sessions(created_gte, starting_after)
+        pages += 1
+        changes, abandoned = {}, []
+        for session in page["data"]:
+            new_status = get_session_change(session)
+            if new_status is not None:
+                changes[session["id"]] = (new_status, session["payment_intent"])
+            elif session["status"] == "open" and (
+                session["created"] < abandoned_before.timestamp()
+            ):
+                abandoned.append(session["id"])
+        if abandoned:
+            changes.update(expire_abandoned_sessions(pending, abandoned))
+        if changes:
+            with transaction.atomic():
+                changed += Payment.objects.apply_stripe_statuses(changes)
+
+        if not page["has_more"] or not page["data"]:
+            return pages, changed
+        starting_after = page["data"][-1]["id"]
@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+
+User = get_user_model()
+
+MODERATORS_GROUP = "moderators"
+
+
+def _cache_key(user_id):
+    return f"user-groups:{user_id}"
+
+
+def get_user_groups(user):
+    """
+    Названия групп пользователя.
+
+    Группы загружаются не чаще одного раза за запрос (результат хранится на
+    объекте request.user) и кешируются на ROLE_CACHE_TIMEOUT секунд, так что
+    повторные проверки прав не обращаются к базе.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    groups = getattr(user, "_group_names", None)
+    if groups is None:
+        groups = cache.get(_cache_key(user.pk))
+        if groups is None:
+            groups = frozenset(user.groups.values_list("name", flat=True))
+            cache.set(_cache_key(user.pk), groups, settings.ROLE_CACHE_TIMEOUT)
+        user._group_names = groups
+    return groups
+
+
+def is_moderator(user):
+    return MODERATORS_GROUP in get_user_groups(user)
+
+
+def invalidate_user_groups(*user_ids):
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def reset_groups_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear", "pre_clear"):
+        return
+    if reverse:
+        # group.user_set.add(...): изменились группы пользователей из pk_set
+        user_ids = pk_set or instance.user_set.values_list("pk", flat=True)
+        invalidate_user_groups(*user_ids)
+    else:
+        instance.__dict__.pop("_group_names", None)
+        invalidate_user_groups(instance.pk)
+
+
+def invalidate_group_users(group):
+    """
+    Сбрасывает кеш групп всех участников группы сейчас и еще раз после
+    коммита: иначе запрос, прочитавший старые данные до коммита, успел бы
+    снова положить их в кеш.
+    """
+    user_ids = list(group.user_set.values_list("pk", flat=True))
+    if user_ids:
+        invalidate_user_groups(*user_ids)
+        transaction.on_commit(lambda: invalidate_user_groups(*user_ids))
+
+
+@receiver(post_save, sender=Group)
+def reset_renamed_group_cache(sender, instance, created, **kwargs):
+    # В кеше лежат названия групп, поэтому переименование их устаревает
+    if not created:
+        invalidate_group_users(instance)
+
+
+@receiver(pre_delete, sender=Group)
+def reset_deleted_group_cache(sender, instance, **kwargs):
+    # Связи с пользователями удаляются каскадом, без m2m_changed
+    invalidate_group_users(instance)
@@ -1,11 +1,14 @@
 import os
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from .models import Payment
+from .analytics import REVENUE_PERIODS
+from .models import ChunkedUpload, Payment
+from .uploads import get_allowed_extensions, get_target_object
 
 User = get_user_model()
 
@@ -22,11 +25,26 @@ class UserSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class ChoiceDisplayField(serializers.ReadOnlyField):
+    """Название значения из choices по словарю, без get_FOO_display()"""
+
+    def __init__(self, choices, **kwargs):
+        self.labels = dict(choices)
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return self.labels.get(value, value)
+
+
 class PaymentSerializer(serializers.ModelSerializer):
     course_title = serializers.SerializerMethodField()
     lesson_title = serializers.SerializerMethodField()
-    payment_method_display = serializers.SerializerMethodField()
-    payment_status_display = serializers.SerializerMethodField()
+    payment_method_display = ChoiceDisplayField(
+        Payment.PAYMENT_METHODS, source="payment_method"
+    )
+    payment_status_display = ChoiceDisplayField(
+        Payment.PAYMENT_STATUSES, source="payment_status"
+    )
 
     class Meta:
         model = Payment
@@ -50,18 +68,18 @@ class PaymentSerializer(serializers.ModelSerializer):
             "stripe_session_id": {"read_only": True},
         }
 
+    # Списки берут названия из аннотаций Payment.objects.with_titles(),
+    # отдельный платеж (например, только что созданный) - из связей
     def get_course_title(self, obj):
+        if hasattr(obj, "course_title"):
+            return obj.course_title
         return obj.course.name if obj.course else None
 
     def get_lesson_title(self, obj):
+        if hasattr(obj, "lesson_title"):
+            return obj.lesson_title
         return obj.lesson.name if obj.lesson else None
 
-    def get_payment_method_display(self, obj):
-        return obj.get_payment_method_display()
-
-    def get_payment_status_display(self, obj):
-        return obj.get_payment_status_display()
-
 
 class PublicProfileSerializer(serializers.ModelSerializer):
     class Meta:
@@ -108,5 +126,47 @@ class UserProfileWithPaymentsSerializer(serializers.ModelSerializer):
         }
 
     def get_payments(self, obj):
-        payments = obj.payments.all().order_by("-payment_date")[:5]
+        # Обычно платежи загружены заранее через prefetch_recent_payments()
+        payments = getattr(obj, "recent_payments", None)
+        if payments is None:
+            payments = Payment.objects.filter(user=obj).with_titles()[
+                : settings.PROFILE_RECENT_PAYMENTS
+            ]
         return PaymentSerializer(payments, many=True).data
+
+
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChunkedUpload
+        fields = ["id", "target", "object_id", "filename", "size", "offset", "status"]
+        read_only_fields = ["id", "offset", "status"]
+
+    def validate(self, attrs):
+        target = attrs["target"]
+        ext = os.path.splitext(attrs["filename"])[1].lower()
+        if ext not in get_allowed_extensions(target):
+            raise ValidationError({"filename": "Неподдерживаемый формат изображения"})
+        max_size = settings.CHUNKED_UPLOAD_MAX_SIZES[target]
+        if attrs["size"] > max_size:
+            raise ValidationError(
+                {"size": f"Файл слишком большой (макс. {max_size // (1024 * 1024)}MB)"}
+            )
+        if target == "avatar":
+            attrs["object_id"] = None
+        else:
+            upload = ChunkedUpload(user=self.context["request"].user, **attrs)
+            if attrs.get("object_id") is None or get_target_object(upload) is None:
+                raise ValidationError({"object_id": "Объект не найден"})
+        return attrs
+
+
+class RevenueReportQuerySerializer(serializers.Serializer):
+    period = serializers.ChoiceField(choices=list(REVENUE_PERIODS), default="day")
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        date_from, date_to = attrs.get("date_from"), attrs.get("date_to")
+        if date_from and date_to and date_from > date_to:
+            raise ValidationError({"date_to": ["Конец периода раньше начала"]})
+        return attrs
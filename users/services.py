@@ -1,13 +1,96 @@
+import threading
+import time
+from decimal import ROUND_HALF_UP, Decimal
+
+import httpx
+import requests
 import stripe
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def build_stripe_client():
+    """
+    Клиент Stripe с постоянным пулом соединений и ограниченными таймаутами.
+
+    Синхронные запросы идут через requests.Session с пулом на
+    STRIPE_POOL_SIZE соединений, асинхронные - через httpx.AsyncClient.
+    Сетевые ошибки и 409/429/5xx повторяются до STRIPE_MAX_NETWORK_RETRIES
+    раз с экспоненциальной задержкой и случайным разбросом (это делает сама
+    библиотека stripe, POST-запросы повторяются с одним Idempotency-Key).
+    STRIPE_API_BASE позволяет направить запросы на локальную заглушку,
+    например stripe-mock.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.STRIPE_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    async_client = stripe.HTTPXClient(
+        timeout=httpx.Timeout(
+            settings.STRIPE_READ_TIMEOUT, connect=settings.STRIPE_CONNECT_TIMEOUT
+        )
+    )
+    http_client = stripe.RequestsClient(
+        timeout=(settings.STRIPE_CONNECT_TIMEOUT, settings.STRIPE_READ_TIMEOUT),
+        session=session,
+        async_fallback_client=async_client,
+    )
+    return stripe.StripeClient(
+        settings.STRIPE_SECRET_KEY,
+        base_addresses={"api": settings.STRIPE_API_BASE},
+        max_network_retries=settings.STRIPE_MAX_NETWORK_RETRIES,
+        http_client=http_client,
+    )
 
-# Настройка Stripe
-stripe.api_key = settings.STRIPE_SECRET_KEY
+
+def get_stripe_client():
+    """Общий для процесса клиент Stripe, создается при первом обращении"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = build_stripe_client()
+    return _client
+
+
+@receiver(setting_changed)
+def reset_stripe_client(setting, **kwargs):
+    """Пересоздает клиент, если настройки Stripe изменились (override_settings)"""
+    global _client
+    if setting.startswith("STRIPE_"):
+        _client = None
+
+
+def to_minor_units(amount):
+    """Сумма в копейках без ошибок округления float"""
+    cents = Decimal(str(amount)) * 100
+    return int(cents.quantize(Decimal("1"), rounding=ROUND_HALF_UP))
 
 
 class StripeService:
-    """Сервис для работы с Stripe API"""
+    """
+    Сервис для работы с Stripe API через общий клиент get_stripe_client().
+    У каждого метода есть асинхронный вариант с префиксом "a" для ASGI.
+    """
+
+    @staticmethod
+    def _product_params(name, description=None):
+        return {"name": name, "description": description or f"Курс: {name}"}
+
+    @staticmethod
+    def _product_result(product):
+        return {
+            "id": product.id,
+            "name": product.name,
+            "description": product.description,
+        }
 
     @staticmethod
     def create_product(name, description=None):
@@ -22,92 +105,266 @@ class StripeService:
             dict: Данные созданного продукта
         """
         try:
-            product_data = {"name": name, "description": description or f"Курс: {name}"}
+            product = get_stripe_client().products.create(
+                params=StripeService._product_params(name, description)
+            )
+            return StripeService._product_result(product)
+        except stripe.StripeError as e:
+            raise ValidationError(f"Ошибка создания продукта в Stripe: {str(e)}")
 
-            product = stripe.Product.create(**product_data)
-            return {
-                "id": product.id,
-                "name": product.name,
-                "description": product.description,
-            }
-        except stripe.error.StripeError as e:
+    @staticmethod
+    async def acreate_product(name, description=None):
+        """Асинхронный вариант create_product"""
+        try:
+            product = await get_stripe_client().products.create_async(
+                params=StripeService._product_params(name, description)
+            )
+            return StripeService._product_result(product)
+        except stripe.StripeError as e:
             raise ValidationError(f"Ошибка создания продукта в Stripe: {str(e)}")
 
     @staticmethod
-    def create_price(product_id, amount, currency="rub"):
+    def update_product(product_id, name, description=None):
+        """
+        Обновить название и описание продукта в Stripe
+
+        Args:
+            product_id (str): ID продукта в Stripe
+            name (str): Новое название продукта
+            description (str, optional): Новое описание продукта
+
+        Returns:
+            dict: Данные обновленного продукта
+        """
+        try:
+            product = get_stripe_client().products.update(
+                product_id, params=StripeService._product_params(name, description)
+            )
+            return StripeService._product_result(product)
+        except stripe.StripeError as e:
+            raise ValidationError(f"Ошибка обновления продукта в Stripe: {str(e)}")
+
+    @staticmethod
+    async def aupdate_product(product_id, name, description=None):
+        """Асинхронный вариант update_product"""
+        try:
+            product = await get_stripe_client().products.update_async(
+                product_id, params=StripeService._product_params(name, description)
+            )
+            return StripeService._product_result(product)
+        except stripe.StripeError as e:
+            raise ValidationError(f"Ошибка обновления продукта в Stripe: {str(e)}")
+
+    @staticmethod
+    def _price_params(product_id, amount, currency):
+        # Stripe требует сумму в копейках; без recurring цена разовая
+        return {
+            "product": product_id,
+            "unit_amount": to_minor_units(amount),
+            "currency": currency,
+        }
+
+    @staticmethod
+    def _price_result(price):
+        return {
+            "id": price.id,
+            "product_id": price.product,
+            "amount": price.unit_amount,
+            "currency": price.currency,
+        }
+
+    @staticmethod
+    def create_price(product_id, amount, currency=settings.STRIPE_CURRENCY):
         """
         Создать цену для продукта в Stripe
 
         Args:
             product_id (str): ID продукта в Stripe
             amount (Decimal): Сумма в рублях
-            currency (str): Валюта (по умолчанию 'rub')
+            currency (str): Валюта (по умолчанию STRIPE_CURRENCY)
 
         Returns:
             dict: Данные созданной цены
         """
         try:
-            # Stripe требует сумму в копейках (умножаем на 100)
-            amount_cents = int(float(amount) * 100)
-
-            price_data = {
-                "product": product_id,
-                "unit_amount": amount_cents,
-                "currency": currency,
-                "recurring": None,  # Разовый платеж
-            }
+            price = get_stripe_client().prices.create(
+                params=StripeService._price_params(product_id, amount, currency)
+            )
+            return StripeService._price_result(price)
+        except stripe.StripeError as e:
+            raise ValidationError(f"Ошибка создания цены в Stripe: {str(e)}")
 
-            price = stripe.Price.create(**price_data)
-            return {
-                "id": price.id,
-                "product_id": price.product,
-                "amount": price.unit_amount,
-                "currency": price.currency,
-            }
-        except stripe.error.StripeError as e:
+    @staticmethod
+    async def acreate_price(product_id, amount, currency=settings.STRIPE_CURRENCY):
+        """Асинхронный вариант create_price"""
+        try:
+            price = await get_stripe_client().prices.create_async(
+                params=StripeService._price_params(product_id, amount, currency)
+            )
+            return StripeService._price_result(price)
+        except stripe.StripeError as e:
             raise ValidationError(f"Ошибка создания цены в Stripe: {str(e)}")
 
     @staticmethod
-    def create_checkout_session(price_id, success_url, cancel_url, metadata=None):
+    def _session_params(price_id, success_url, cancel_url, metadata, price_data):
+        line_item = {"price": price_id} if price_id else {"price_data": price_data}
+        # Брошенная сессия истекает сама, сверка переведет платеж в cancelled
+        expires_at = int(time.time()) + settings.STRIPE_CHECKOUT_EXPIRE_MINUTES * 60
+        params = {
+            "payment_method_types": ["card"],
+            "line_items": [{**line_item, "quantity": 1}],
+            "mode": "payment",
+            "success_url": success_url,
+            "cancel_url": cancel_url,
+            "expires_at": expires_at,
+        }
+        if metadata:
+            params["metadata"] = metadata
+        return params
+
+    @staticmethod
+    def _session_result(session):
+        return {
+            "id": session.id,
+            "url": session.url,
+            "payment_status": session.payment_status,
+            "amount_total": session.amount_total,
+            "currency": session.currency,
+        }
+
+    @staticmethod
+    def create_checkout_session(
+        price_id, success_url, cancel_url, metadata=None, price_data=None
+    ):
         """
         Создать сессию для оплаты
 
         Args:
-            price_id (str): ID цены в Stripe
+            price_id (str): ID цены в Stripe или None
             success_url (str): URL для перенаправления после успешной оплаты
             cancel_url (str): URL для перенаправления при отмене
             metadata (dict, optional): Дополнительные метаданные
+            price_data (dict, optional): Цена прямо в сессии, если price_id
+                еще не закеширован (см. build_price_data)
 
         Returns:
             dict: Данные сессии оплаты
         """
         try:
-            session_data = {
-                "payment_method_types": ["card"],
-                "line_items": [
-                    {
-                        "price": price_id,
-                        "quantity": 1,
-                    }
-                ],
-                "mode": "payment",
-                "success_url": success_url,
-                "cancel_url": cancel_url,
-            }
+            session = get_stripe_client().checkout.sessions.create(
+                params=StripeService._session_params(
+                    price_id, success_url, cancel_url, metadata, price_data
+                )
+            )
+            return StripeService._session_result(session)
+        except stripe.StripeError as e:
+            raise ValidationError(f"Ошибка создания сессии оплаты: {str(e)}")
+
+    @staticmethod
+    async def acreate_checkout_session(
+        price_id, success_url, cancel_url, metadata=None, price_data=None
+    ):
+        """Асинхронный вариант create_checkout_session"""
+        try:
+            session = await get_stripe_client().checkout.sessions.create_async(
+                params=StripeService._session_params(
+                    price_id, success_url, cancel_url, metadata, price_data
+                )
+            )
+            return StripeService._session_result(session)
+        except stripe.StripeError as e:
+            raise ValidationError(f"Ошибка создания сессии оплаты: {str(e)}")
+
+    @staticmethod
+    def _list_item(session):
+        return {
+            "id": session.id,
+            "status": session.status,
+            "payment_status": session.payment_status,
+            "payment_intent": session.payment_intent,
+            "created": session.created,
+        }
 
-            if metadata:
-                session_data["metadata"] = metadata
+    @staticmethod
+    def list_checkout_sessions(created_gte, starting_after=None):
+        """
+        Получить страницу сессий оплаты (до 100 штук, от новых к старым)
 
-            session = stripe.checkout.Session.create(**session_data)
+        Args:
+            created_gte (int): Unix-время, с которого созданы сессии
+            starting_after (str, optional): ID последней сессии прошлой страницы
+
+        Returns:
+            dict: {"data": [сессии], "has_more": bool}
+        """
+        params = {"created": {"gte": created_gte}, "limit": 100}
+        if starting_after:
+            params["starting_after"] = starting_after
+        try:
+            page = get_stripe_client().checkout.sessions.list(params=params)
             return {
-                "id": session.id,
-                "url": session.url,
-                "payment_status": session.payment_status,
-                "amount_total": session.amount_total,
-                "currency": session.currency,
+                "data": [StripeService._list_item(session) for session in page.data],
+                "has_more": page.has_more,
             }
-        except stripe.error.StripeError as e:
-            raise ValidationError(f"Ошибка создания сессии оплаты: {str(e)}")
+        except stripe.StripeError as e:
+            raise ValidationError(f"Ошибка получения списка сессий: {str(e)}")
+
+    @staticmethod
+    def expire_checkout_session(session_id):
+        """
+        Принудительно завершить брошенную сессию оплаты
+
+        Args:
+            session_id (str): ID сессии в Stripe
+
+        Returns:
+            dict: Данные сессии после завершения
+        """
+        try:
+            session = get_stripe_client().checkout.sessions.expire(session_id)
+            return StripeService._list_item(session)
+        except stripe.StripeError as e:
+            raise ValidationError(f"Ошибка завершения сессии оплаты: {str(e)}")
+
+    @staticmethod
+    def build_price_data(item, amount, currency=settings.STRIPE_CURRENCY):
+        """
+        Цена для line_items сессии: с продуктом курса или урока, а если он
+        еще не создан в фоне - с данными продукта, чтобы оплата не ждала
+        лишних запросов к Stripe.
+
+        Args:
+            item (Course | Lesson): Оплачиваемый курс или урок
+            amount (Decimal): Сумма в рублях
+            currency (str): Валюта
+
+        Returns:
+            dict: Значение price_data для create_checkout_session
+        """
+        price_data = {"unit_amount": to_minor_units(amount), "currency": currency}
+        if item.stripe_product_id:
+            price_data["product"] = item.stripe_product_id
+        else:
+            price_data["product_data"] = {
+                "name": item.name,
+                "description": item.description or f"Курс: {item.name}",
+            }
+        return price_data
+
+    @staticmethod
+    def _status_result(session):
+        return {
+            "id": session.id,
+            "payment_status": session.payment_status,
+            "status": session.status,
+            "amount_total": session.amount_total,
+            "currency": session.currency,
+            "customer_email": (
+                session.customer_details.get("email")
+                if session.customer_details
+                else None
+            ),
+        }
 
     @staticmethod
     def get_session_status(session_id):
@@ -121,18 +378,18 @@ class StripeService:
             dict: Статус сессии
         """
         try:
-            session = stripe.checkout.Session.retrieve(session_id)
-            return {
-                "id": session.id,
-                "payment_status": session.payment_status,
-                "status": session.status,
-                "amount_total": session.amount_total,
-                "currency": session.currency,
-                "customer_email": (
-                    session.customer_details.get("email")
-                    if session.customer_details
-                    else None
-                ),
-            }
-        except stripe.error.StripeError as e:
+            session = get_stripe_client().checkout.sessions.retrieve(session_id)
+            return StripeService._status_result(session)
+        except stripe.StripeError as e:
+            raise ValidationError(f"Ошибка получения статуса сессии: {str(e)}")
+
+    @staticmethod
+    async def aget_session_status(session_id):
+        """Асинхронный вариант get_session_status"""
+        try:
+            session = await get_stripe_client().checkout.sessions.retrieve_async(
+                session_id
+            )
+            return StripeService._status_result(session)
+        except stripe.StripeError as e:
             raise ValidationError(f"Ошибка получения статуса сессии: {str(e)}")
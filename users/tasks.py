@@ -1,9 +1,18 @@
 from datetime import timedelta
 
 from celery import shared_task
+from django.apps import apps
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError
 from django.utils import timezone
 
+from . import analytics, reconciliation, webhooks
+from .models import ChunkedUpload, StripePrice
+from .services import StripeService
+from .uploads import discard_upload
+
 
 @shared_task
 def deactivate_inactive_users():
@@ -12,3 +21,107 @@ def deactivate_inactive_users():
     User.objects.filter(last_login__lt=month_ago, is_active=True).update(
         is_active=False
     )
+
+
+@shared_task
+def purge_stale_uploads():
+    """Удаляет незавершенные загрузки, которые давно не продолжались"""
+    expired = timezone.now() - timedelta(hours=settings.CHUNKED_UPLOAD_EXPIRE_HOURS)
+    stale = ChunkedUpload.objects.filter(updated_at__lt=expired)
+    for upload in stale.iterator():
+        discard_upload(upload)
+
+
+@shared_task
+def refresh_revenue_daily():
+    """Пересчитывает агрегаты выручки за измененные дни"""
+    return f"Пересчитано дней: {analytics.refresh_revenue_daily()}"
+
+
+@shared_task
+def process_stripe_events():
+    """Применяет полученные вебхуком события Stripe к платежам"""
+    return f"Обработано событий: {webhooks.process_stripe_events()}"
+
+
+@shared_task
+def reconcile_stripe_payments():
+    """Сверяет ожидающие платежи со списком сессий Stripe"""
+    pages, changed = reconciliation.reconcile_pending_payments()
+    return f"Страниц Stripe: {pages}, обновлено платежей: {changed}"
+
+
+@shared_task
+def purge_stripe_events():
+    """Удаляет старые обработанные события Stripe"""
+    return webhooks.purge_stripe_events()
+
+
+@shared_task
+def provision_stripe_product(label, pk):
+    """
+    Создает продукт Stripe для нового курса или урока, а после изменения
+    названия или описания обновляет существующий. Цены других продуктов
+    этого курса или урока больше не подходят и удаляются из кеша.
+    """
+    if not settings.STRIPE_SECRET_KEY:
+        return "Stripe не настроен"
+    model = apps.get_model(label)
+    item = model.all_objects.filter(pk=pk).first()
+    if item is None:
+        return "Объект не найден"
+
+    if item.stripe_product_id:
+        StripeService.update_product(item.stripe_product_id, item.name, item.description)
+    else:
+        product = StripeService.create_product(item.name, item.description)
+        # Две задачи для одного объекта могли создать продукт одновременно:
+        # сохраняется только первый
+        updated = model.all_objects.filter(
+            pk=pk, stripe_product_id__isnull=True
+        ).update(stripe_product_id=product["id"])
+        if updated:
+            item.stripe_product_id = product["id"]
+        else:
+            item.refresh_from_db(fields=["stripe_product_id"])
+
+    StripePrice.objects.invalidate(item)
+    return item.stripe_product_id
+
+
+@shared_task
+def provision_stripe_price(label, pk, amount, currency):
+    """Создает цену Stripe для суммы, по которой уже оплачивали, и кеширует ее"""
+    if not settings.STRIPE_SECRET_KEY:
+        return None
+    model = apps.get_model(label)
+    item = model.all_objects.filter(pk=pk).first()
+    if item is None or not item.stripe_product_id:
+        return None
+    if StripePrice.objects.lookup(item, amount, currency):
+        return None
+
+    # Параллельные оплаты с промахом кеша ставят по задаче каждая: цену в
+    # Stripe создает только та, что взяла блокировку, остальные выходят
+    lock = f"stripe-price:{label}:{pk}:{item.stripe_product_id}:{amount}:{currency}"
+    if not cache.add(lock, 1, settings.STRIPE_PRICE_LOCK_SECONDS):
+        return None
+    try:
+        if StripePrice.objects.lookup(item, amount, currency):
+            return None
+        price = StripeService.create_price(item.stripe_product_id, amount, currency)
+        StripePrice.objects.invalidate(item)
+        try:
+            StripePrice.objects.create(
+                **{model._meta.model_name: item},
+                amount=amount,
+                currency=currency,
+                stripe_product_id=item.stripe_product_id,
+                stripe_price_id=price["id"],
+            )
+        except IntegrityError:
+            # Ту же цену уже закешировала параллельная задача
+            return None
+        return price["id"]
+    finally:
+        cache.delete(lock)
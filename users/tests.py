@@ -1,3 +1,440 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import shutil
+import tempfile
+import time
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group
+from django.http import UnreadablePostError
+from django.test import override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from materials.models import Course, Lesson
+
+from .analytics import refresh_revenue_daily
+from .models import (ChunkedUpload, Payment, PaymentRollup, RevenueDaily,
+                     RevenueDirtyDay, StripeEvent, User)
+from .reconciliation import reconcile_pending_payments
+from .roles import MODERATORS_GROUP, get_user_groups, is_moderator
+from .uploads import append_chunk
+from .webhooks import process_stripe_events
+
+
+class UserCourseTestCase(APITestCase):
+    """Аутентифицированный пользователь со своим курсом"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com", password="pass")
+        self.client.force_authenticate(self.user)
+        self.course = Course.objects.create(
+            name="Курс", description="Описание", owner=self.user
+        )
+
+    def create_payment(self, **fields):
+        fields.setdefault("user", self.user)
+        fields.setdefault("course", self.course)
+        fields.setdefault("amount", Decimal("100.00"))
+        return Payment.objects.create(**fields)
+
+
+class PaymentListQueriesTest(UserCourseTestCase):
+    """Число запросов на страницу списка платежей не зависит от ее размера"""
+
+    def setUp(self):
+        super().setUp()
+        self.lesson = Lesson.objects.create(
+            name="Урок",
+            description="Описание",
+            video_url="https://www.youtube.com/watch?v=1",
+            course=self.course,
+            owner=self.user,
+        )
+
+    def create_payments(self, count):
+        for index in range(count):
+            self.create_payment(
+                course=self.course if index % 2 else None,
+                lesson=None if index % 2 else self.lesson,
+                payment_method="transfer",
+                payment_status="paid",
+            )
+
+    def test_payment_list_query_count(self):
+        self.create_payments(3)
+        for name in ("payment-list", "user-payments"):
+            with self.subTest(view=name):
+                # COUNT для пагинации и одна выборка платежей с названиями
+                with self.assertNumQueries(2):
+                    response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+
+        self.create_payments(7)
+        for name in ("payment-list", "user-payments"):
+            with self.subTest(view=name, page_size=10):
+                with self.assertNumQueries(2):
+                    response = self.client.get(reverse(name))
+                results = response.data["results"]
+                self.assertEqual(len(results), 10)
+
+    def test_payment_list_titles_and_display(self):
+        self.create_payments(2)
+        response = self.client.get(reverse("payment-list"))
+        titles = {
+            (item["course_title"], item["lesson_title"])
+            for item in response.data["results"]
+        }
+        self.assertEqual(titles, {("Курс", None), (None, "Урок")})
+        item = response.data["results"][0]
+        self.assertEqual(item["payment_method_display"], "Перевод на счет")
+        self.assertEqual(item["payment_status_display"], "Оплачен")
+
+
+class OwnProfileRecentPaymentsTest(UserCourseTestCase):
+    def setUp(self):
+        super().setUp()
+        for _ in range(8):
+            self.create_payment()
+
+    def test_recent_payments_single_query(self):
+        # Пользователь уже аутентифицирован, платежи - один оконный запрос
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("own-profile"))
+        self.assertEqual(response.status_code, 200)
+        payments = response.data["payments"]
+        self.assertEqual(len(payments), 5)
+        self.assertEqual({item["course_title"] for item in payments}, {"Курс"})
+        dates = [item["payment_date"] for item in payments]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+
+
+class PaymentRollupTest(UserCourseTestCase):
+    """Сводки платежей меняются вместе с созданием, изменением и удалением"""
+
+    def get_rollups(self):
+        return {
+            (rollup.payment_method, rollup.payment_status): (
+                rollup.count,
+                rollup.amount,
+            )
+            for rollup in PaymentRollup.objects.filter(user=self.user, count__gt=0)
+        }
+
+    def test_rollup_deltas(self):
+        self.create_payment(payment_status="paid")
+        payment = self.create_payment(payment_method="stripe")
+        self.assertEqual(
+            self.get_rollups(),
+            {
+                ("cash", "paid"): (1, Decimal("100.00")),
+                ("stripe", "pending"): (1, Decimal("100.00")),
+            },
+        )
+
+        # Смена статуса и суммы переносит платеж в другую корзину
+        payment.payment_status = "paid"
+        payment.amount = Decimal("50.00")
+        payment.save()
+        self.create_payment(payment_status="paid").delete()
+        self.assertEqual(
+            self.get_rollups(),
+            {
+                ("cash", "paid"): (1, Decimal("100.00")),
+                ("stripe", "paid"): (1, Decimal("50.00")),
+            },
+        )
+
+        response = self.client.get(reverse("payment-stats"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["total_amount"], Decimal("150.00"))
+        by_method = [
+            (item["payment_method"], item["count"])
+            for item in response.data["by_method"]
+        ]
+        self.assertEqual(by_method, [("cash", 1), ("stripe", 1)])
+        response = self.client.get(
+            reverse("payment-stats"), {"payment_status": "pending"}
+        )
+        self.assertEqual(response.data["total_amount"], 0)
+
+
+@override_settings(REVENUE_REFRESH_OVERLAP_SECONDS=0)
+class RevenueDailyRefreshTest(UserCourseTestCase):
+    """Пересчет выручки затрагивает только измененные и помеченные дни"""
+
+    def get_daily(self):
+        return list(
+            RevenueDaily.objects.values_list("payment_status", "count", "amount")
+        )
+
+    def test_refresh_changed_days(self):
+        self.create_payment(payment_status="paid")
+        payment = self.create_payment(payment_status="paid")
+        self.assertEqual(refresh_revenue_daily(), 1)
+        self.assertEqual(self.get_daily(), [("paid", 2, Decimal("200.00"))])
+        self.assertEqual(refresh_revenue_daily(), 0)
+
+        # Удаление не оставляет updated_at: день помечает post_delete
+        payment.delete()
+        self.assertTrue(RevenueDirtyDay.objects.exists())
+        self.assertEqual(refresh_revenue_daily(), 1)
+        self.assertEqual(self.get_daily(), [("paid", 1, Decimal("100.00"))])
+        self.assertFalse(RevenueDirtyDay.objects.exists())
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET="whsec_test")
+class StripeWebhookTest(UserCourseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.payment = self.create_payment(
+            payment_method="stripe", stripe_session_id="cs_test_1"
+        )
+
+    def post_event(self, event_id, event_type, signature=None, **session):
+        payload = json.dumps(
+            {
+                "id": event_id,
+                "object": "event",
+                "type": event_type,
+                "created": int(time.time()),
+                "data": {"object": {"id": "cs_test_1", **session}},
+            }
+        )
+        if signature is None:
+            timestamp = int(time.time())
+            digest = hmac.new(
+                b"whsec_test", f"{timestamp}.{payload}".encode(), hashlib.sha256
+            ).hexdigest()
+            signature = f"t={timestamp},v1={digest}"
+        return self.client.post(
+            reverse("stripe-webhook"),
+            payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=signature,
+        )
+
+    def test_invalid_signature_rejected(self):
+        response = self.post_event(
+            "evt_1", "checkout.session.completed", signature="t=1,v1=bad"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_events_deduplicated_and_applied(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            for _ in range(2):
+                response = self.post_event(
+                    "evt_1",
+                    "checkout.session.completed",
+                    payment_status="paid",
+                    payment_intent="pi_1",
+                )
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+        # Поздно пришедшее истечение сессии не отменяет оплату
+        self.post_event("evt_2", "checkout.session.expired")
+
+        self.assertEqual(process_stripe_events(), 2)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.payment_status, "paid")
+        self.assertEqual(self.payment.stripe_payment_intent_id, "pi_1")
+        self.assertEqual(
+            PaymentRollup.objects.get(payment_status="paid").amount, Decimal("100.00")
+        )
+        self.assertEqual(PaymentRollup.objects.get(payment_status="pending").count, 0)
+        self.assertFalse(StripeEvent.objects.pending().exists())
+
+
+class ReconcilePaymentsTest(UserCourseTestCase):
+    """Сверка проходит все страницы списка сессий Stripe"""
+
+    def setUp(self):
+        super().setUp()
+        for session_id in ("cs_paid", "cs_expired", "cs_abandoned", "cs_open"):
+            self.create_payment(payment_method="stripe", stripe_session_id=session_id)
+
+    def session(self, session_id, status="open", payment_status="unpaid", age=0):
+        return {
+            "id": session_id,
+            "status": status,
+            "payment_status": payment_status,
+            "payment_intent": "pi_1" if payment_status == "paid" else None,
+            "created": int(time.time()) - age,
+        }
+
+    @mock.patch("users.services.StripeService.expire_checkout_session")
+    @mock.patch("users.services.StripeService.list_checkout_sessions")
+    def test_page_loop(self, list_sessions, expire_session):
+        list_sessions.side_effect = [
+            {
+                "data": [
+                    self.session("cs_paid", "complete", "paid"),
+                    self.session("cs_other", "complete", "paid"),
+                ],
+                "has_more": True,
+            },
+            {
+                "data": [
+                    self.session("cs_expired", "expired"),
+                    self.session("cs_abandoned", age=2 * 60 * 60),
+                    self.session("cs_open"),
+                ],
+                "has_more": False,
+            },
+        ]
+        expire_session.return_value = self.session("cs_abandoned", "expired")
+
+        self.assertEqual(reconcile_pending_payments(), (2, 3))
+        self.assertIsNone(list_sessions.call_args_list[0].args[1])
+        self.assertEqual(list_sessions.call_args_list[1].args[1], "cs_other")
+        expire_session.assert_called_once_with("cs_abandoned")
+
+        statuses = dict(
+            Payment.objects.values_list("stripe_session_id", "payment_status")
+        )
+        self.assertEqual(
+            statuses,
+            {
+                "cs_paid": "paid",
+                "cs_expired": "cancelled",
+                "cs_abandoned": "cancelled",
+                "cs_open": "pending",
+            },
+        )
+
+    @mock.patch("users.services.StripeService.list_checkout_sessions")
+    def test_no_pending_payments(self, list_sessions):
+        Payment.objects.update(payment_status="paid")
+        self.assertEqual(reconcile_pending_payments(), (0, 0))
+        list_sessions.assert_not_called()
+
+
+class DisconnectingStream:
+    """Тело запроса, клиент которого отключается после первых байт"""
+
+    def __init__(self, data):
+        self.chunks = [data]
+
+    def read(self, size):
+        if self.chunks:
+            return self.chunks.pop()
+        raise UnreadablePostError("Клиент отключился")
+
+
+class ChunkedUploadTest(UserCourseTestCase):
+    """Смещение, блокировка и размер при загрузке аватара по частям"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        storage = override_settings(
+            CHUNKED_UPLOAD_DIR=f"{directory}/parts", MEDIA_ROOT=f"{directory}/media"
+        )
+        storage.enable()
+        self.addCleanup(storage.disable)
+
+        image = BytesIO()
+        Image.new("RGB", (8, 8), "red").save(image, format="PNG")
+        self.data = image.getvalue()
+        self.upload = self.create_upload(self.data)
+
+    def create_upload(self, data, filename="avatar.png"):
+        response = self.client.post(
+            reverse("upload-create"),
+            {"target": "avatar", "filename": filename, "size": len(data)},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        return ChunkedUpload.objects.get(pk=response.data["id"])
+
+    def put(self, data, offset, upload=None):
+        upload = upload or self.upload
+        return self.client.put(
+            reverse("upload-detail", args=[upload.pk]),
+            data,
+            content_type="application/offset+octet-stream",
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_offset_mismatch_conflict(self):
+        response = self.put(self.data[:20], 0)
+        self.assertEqual(response.data["offset"], 20)
+        response = self.put(self.data[10:], 10)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["offset"], 20)
+
+        response = self.put(self.data[20:], 20)
+        self.assertEqual(response.data["status"], "complete")
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.avatar.name.endswith(".png"))
+
+    def test_oversize_rejected(self):
+        response = self.put(self.data + b"lorem", 0)
+        self.assertEqual(response.status_code, 400)
+        self.upload.refresh_from_db()
+        self.assertEqual((self.upload.offset, self.upload.status), (0, "uploading"))
+
+    def test_bad_signature_discards_upload(self):
+        upload = self.create_upload(b"0" * 32)
+        response = self.put(b"0" * 32, 0, upload)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ChunkedUpload.objects.filter(pk=upload.pk).exists())
+
+    def test_resume_after_short_body(self):
+        append_chunk(self.upload, DisconnectingStream(self.data[:30]), 0)
+        self.upload.refresh_from_db()
+        self.assertEqual(self.upload.offset, 30)
+
+        response = self.put(self.data[30:], 30)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["status"], "complete")
+
+    def test_attach_retried_after_storage_error(self):
+        with mock.patch(
+            "django.core.files.storage.FileSystemStorage.save",
+            side_effect=OSError("Диск недоступен"),
+        ):
+            with self.assertRaises(OSError):
+                self.put(self.data, 0)
+        self.upload.refresh_from_db()
+        self.assertEqual(self.upload.offset, len(self.data))
+        self.assertEqual(self.upload.status, "uploading")
+
+        # Пустая часть с offset == size повторяет прикрепление
+        response = self.put(b"", len(self.data))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["status"], "complete")
+        self.assertEqual(self.put(b"", len(self.data)).status_code, 409)
+
+
+class GroupCacheTest(UserCourseTestCase):
+    """Кеш групп сбрасывается при переименовании и удалении группы"""
+
+    def setUp(self):
+        super().setUp()
+        self.group = Group.objects.create(name=MODERATORS_GROUP)
+        self.group.user_set.add(self.user)
+
+    def cached_groups(self):
+        # Свежий объект пользователя: группы читаются из кеша, а не из request
+        return get_user_groups(User.objects.get(pk=self.user.pk))
+
+    def test_rename_resets_cache(self):
+        self.assertEqual(self.cached_groups(), {MODERATORS_GROUP})
+        self.group.name = "editors"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.save()
+        self.assertEqual(self.cached_groups(), {"editors"})
+
+    def test_delete_resets_cache(self):
+        self.assertTrue(is_moderator(User.objects.get(pk=self.user.pk)))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.delete()
+        self.assertFalse(is_moderator(User.objects.get(pk=self.user.pk)))
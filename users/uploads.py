@@ -0,0 +1,256 @@
+import os
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.http import UnreadablePostError
+from PIL import Image
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Размер буфера чтения тела запроса: память на загрузку не зависит от размера
+# части и файла
+READ_SIZE = 64 * 1024
+SIGNATURE_LENGTH = 12
+
+IMAGE_EXTENSIONS = {
+    "jpeg": (".jpg", ".jpeg"),
+    "png": (".png",),
+    "gif": (".gif",),
+    "webp": (".webp",),
+}
+
+# Назначение -> (модель, поле файла, поля для save(update_fields), форматы)
+UPLOAD_TARGETS = {
+    "avatar": ("users.User", "avatar", ("avatar",), ("jpeg", "png", "gif")),
+    "course_preview": (
+        "materials.Course",
+        "preview",
+        ("preview", "updated_at"),
+        ("jpeg", "png", "gif", "webp"),
+    ),
+    "lesson_preview": (
+        "materials.Lesson",
+        "preview",
+        ("preview", "updated_at"),
+        ("jpeg", "png", "gif", "webp"),
+    ),
+}
+
+
+class UploadConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Смещение части не совпадает с принятым количеством байт."
+    default_code = "upload_conflict"
+
+    def __init__(self, offset, detail=None):
+        super().__init__(detail)
+        self.offset = offset
+
+
+class InvalidUpload(ValidationError):
+    """Файл загрузки не может быть принят: загрузка удаляется"""
+
+
+class UnsupportedImage(InvalidUpload):
+    default_detail = "Неподдерживаемый формат изображения"
+
+
+def get_upload_path(upload):
+    return os.path.join(settings.CHUNKED_UPLOAD_DIR, f"{upload.pk}.part")
+
+
+def get_allowed_extensions(target):
+    formats = UPLOAD_TARGETS[target][3]
+    return [extension for name in formats for extension in IMAGE_EXTENSIONS[name]]
+
+
+def detect_image_format(header):
+    if header.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def get_target_object(upload):
+    """Объект, к которому прикрепляется файл; превью - только своих материалов"""
+    if upload.target == "avatar":
+        return upload.user
+    model = apps.get_model(UPLOAD_TARGETS[upload.target][0])
+    return model.objects.filter(pk=upload.object_id, owner=upload.user).first()
+
+
+def discard_upload(upload):
+    try:
+        os.remove(get_upload_path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+def try_lock(part):
+    """
+    Неблокирующая эксклюзивная блокировка файла загрузки: flock на POSIX,
+    msvcrt.locking первого байта на Windows. False, если файл уже занят.
+    """
+    try:
+        if fcntl is not None:
+            fcntl.flock(part.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            part.seek(0)
+            msvcrt.locking(part.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def unlock(part):
+    # flock снимается при закрытии файла, блокировку msvcrt снимаем явно
+    if fcntl is None:
+        part.seek(0)
+        msvcrt.locking(part.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def read_chunk(stream):
+    """Очередной буфер тела запроса или b"", если клиент отключился"""
+    try:
+        return stream.read(READ_SIZE)
+    except (UnreadablePostError, OSError):
+        return b""
+
+
+def check_signature(upload, header):
+    image_format = detect_image_format(header)
+    extension = os.path.splitext(upload.filename)[1].lower()
+    if image_format not in UPLOAD_TARGETS[upload.target][3] or (
+        extension not in IMAGE_EXTENSIONS[image_format]
+    ):
+        raise UnsupportedImage()
+
+
+def append_chunk(upload, stream, offset):
+    """
+    Дописывает тело запроса в файл загрузки, читая его буфером READ_SIZE.
+
+    Файл блокируется (try_lock), поэтому две части одной загрузки не
+    пишутся одновременно. Хвост от оборванной ранее части отрезается по offset.
+    Формат проверяется по сигнатуре сразу после первых байт, размер - на
+    каждом буфере. Если клиент отключился посреди части, принятые байты
+    сохраняются и загрузку можно продолжить с нового offset. Последняя часть
+    прикрепляет файл к объекту; если прикрепить не удалось, его повторяет
+    пустая часть с offset, равным размеру файла.
+    """
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    path = get_upload_path(upload)
+    try:
+        with open(path, "a+b") as part:
+            if not try_lock(part):
+                raise UploadConflict(upload.offset, "Часть этого файла уже загружается")
+            try:
+                upload.offset = write_chunks(upload, part, stream, offset)
+                upload.save(update_fields=["offset", "updated_at"])
+            finally:
+                unlock(part)
+    except UnsupportedImage:
+        # Удаляем после закрытия: на Windows открытый файл не удалить
+        discard_upload(upload)
+        raise
+
+    if upload.offset == upload.size:
+        attach_upload(upload)
+    return upload
+
+
+def write_chunks(upload, part, stream, offset):
+    """
+    Пишет тело запроса в заблокированный файл с offset и возвращает число
+    принятых байт. Обрыв соединения завершает запись без ошибки, принятое
+    сохраняется; ошибки записи на диск пробрасываются.
+    """
+    upload.refresh_from_db()
+    # Часть с offset == size может быть только пустой: она повторяет
+    # прикрепление, если прошлая попытка упала (лишние байты отсечет
+    # проверка размера ниже)
+    if upload.status != "uploading" or offset != upload.offset:
+        raise UploadConflict(upload.offset)
+
+    # Файл открыт на дозапись: после truncate запись идет ровно с offset
+    part.truncate(offset)
+    received = offset
+    signature_checked = offset >= SIGNATURE_LENGTH
+    while chunk := read_chunk(stream):
+        if received + len(chunk) > upload.size:
+            part.truncate(offset)
+            raise ValidationError("Получено больше данных, чем заявлено")
+        part.write(chunk)
+        received += len(chunk)
+        if not signature_checked and (
+            received >= SIGNATURE_LENGTH or received == upload.size
+        ):
+            part.flush()
+            part.seek(0)
+            check_signature(upload, part.read(SIGNATURE_LENGTH))
+            signature_checked = True
+    part.flush()
+    return received
+
+
+def get_attach_target(upload, path):
+    """Проверяет собранный файл Pillow и возвращает объект для прикрепления"""
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except Exception:
+        raise InvalidUpload("Файл не является корректным изображением")
+    instance = get_target_object(upload)
+    if instance is None:
+        raise InvalidUpload("Объект для загрузки не найден")
+    return instance
+
+
+def attach_upload(upload):
+    """
+    Проверяет собранный файл и прикрепляет его к целевому объекту.
+    Хранилище копирует файл с диска частями, целиком в память он не читается.
+
+    Прикрепление идет под блокировкой строки загрузки: параллельные повторы
+    не прикрепят файл дважды. Если сохранение упало, загрузка остается в
+    uploading с offset == size и прикрепление можно повторить.
+    """
+    path = get_upload_path(upload)
+    _, field_name, update_fields, _ = UPLOAD_TARGETS[upload.target]
+    try:
+        with transaction.atomic():
+            claimed = (
+                type(upload)
+                .objects.select_for_update()
+                .filter(pk=upload.pk, status="uploading")
+                .exists()
+            )
+            if not claimed:
+                raise UploadConflict(upload.offset, "Загрузка уже завершена")
+            instance = get_attach_target(upload, path)
+            with open(path, "rb") as content:
+                getattr(instance, field_name).save(
+                    os.path.basename(upload.filename), File(content), save=False
+                )
+            instance.save(update_fields=update_fields)
+            upload.status = "complete"
+            upload.save(update_fields=["status", "updated_at"])
+    except InvalidUpload:
+        discard_upload(upload)
+        raise
+    os.remove(path)
+    return getattr(instance, field_name)
@@ -3,16 +3,19 @@ from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import (TokenObtainPairView,
                                             TokenRefreshView)
 
-from .views import (OwnProfileUpdateView, PaymentCancelView,
+from .views import (ChunkedUploadCreateView, ChunkedUploadDetailView,
+                    OwnProfileUpdateView, PaymentCancelView,
                     PaymentHistoryView, PaymentListView, PaymentStatsView,
-                    PaymentSuccessView, StripePaymentCreateView,
-                    StripePaymentStatusView, UserProfileDetailView,
-                    UserViewSet)
+                    PaymentSuccessView, RevenueAnalyticsView,
+                    StripePaymentCreateView, StripePaymentStatusView,
+                    StripeWebhookView, UserProfileDetailView, UserViewSet)
 
 router = DefaultRouter()
 router.register(r"users", UserViewSet)
 
 urlpatterns = [
+    # До маршрутов роутера: иначе users/{pk}/ перехватывает "me" как pk
+    path("users/me/", OwnProfileUpdateView.as_view(), name="own-profile"),
     path("", include(router.urls)),
     path("payments/", PaymentListView.as_view(), name="payment-list"),
     path("token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
@@ -20,9 +23,11 @@ urlpatterns = [
     path(
         "users/<int:pk>/", UserProfileDetailView.as_view(), name="user-profile-detail"
     ),
-    path("users/me/", OwnProfileUpdateView.as_view(), name="own-profile"),
     path("users/me/payments/", PaymentHistoryView.as_view(), name="user-payments"),
     path("users/me/payments/stats/", PaymentStatsView.as_view(), name="payment-stats"),
+    path(
+        "analytics/revenue/", RevenueAnalyticsView.as_view(), name="revenue-analytics"
+    ),
     # Stripe payment endpoints
     path(
         "payments/stripe/create/",
@@ -34,6 +39,16 @@ urlpatterns = [
         StripePaymentStatusView.as_view(),
         name="stripe-payment-status",
     ),
+    path(
+        "payments/stripe/webhook/",
+        StripeWebhookView.as_view(),
+        name="stripe-webhook",
+    ),
     path("payments/success/", PaymentSuccessView.as_view(), name="payment-success"),
     path("payments/cancel/", PaymentCancelView.as_view(), name="payment-cancel"),
+    # Загрузка файлов по частям
+    path("uploads/", ChunkedUploadCreateView.as_view(), name="upload-create"),
+    path(
+        "uploads/<uuid:pk>/", ChunkedUploadDetailView.as_view(), name="upload-detail"
+    ),
 ]
@@ -1,24 +1,41 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+
+import stripe
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Count, Sum
+from django.db import transaction
+from django.db.models import Sum, prefetch_related_objects
+from django.db.models.functions import TruncMonth
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import (OpenApiExample, OpenApiParameter,
                                    extend_schema, extend_schema_view)
 from rest_framework import generics, permissions, status, viewsets
+from rest_framework.exceptions import ValidationError
 from rest_framework.filters import OrderingFilter
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .filters import PaymentFilter
-from .models import Payment
+from .analytics import build_revenue_report
+from .filters import PaymentFilter, PaymentRollupFilter
+from .models import (ChunkedUpload, Payment, PaymentRollup, StripeEvent,
+                     StripePrice, prefetch_recent_payments)
+from .paginators import PaymentHybridPagination
 from .permissions import IsProfileOwner
-from .serializers import (PaymentSerializer, PrivateProfileSerializer,
-                          PublicProfileSerializer,
+from .serializers import (ChunkedUploadSerializer, PaymentSerializer,
+                          PrivateProfileSerializer, PublicProfileSerializer,
+                          RevenueReportQuerySerializer,
                           UserProfileWithPaymentsSerializer, UserSerializer)
-from .services import StripeService
+from .services import StripeService, to_minor_units
+from .tasks import process_stripe_events, provision_stripe_price
+from .uploads import UploadConflict, append_chunk, discard_upload
+from .webhooks import SESSION_STATUSES, construct_events
 
 User = get_user_model()
 
@@ -65,10 +82,11 @@ class PaymentListView(generics.ListCreateAPIView):
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_class = PaymentFilter
     ordering_fields = ["payment_date"]
-    ordering = ["-payment_date"]
+    ordering = ["-payment_date", "id"]
+    pagination_class = PaymentHybridPagination
 
     def get_queryset(self):
-        return Payment.objects.filter(user=self.request.user)
+        return Payment.objects.filter(user=self.request.user).with_titles()
 
 
 @extend_schema_view(
@@ -126,12 +144,17 @@ class OwnProfileUpdateView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated, IsProfileOwner]
 
     def get_object(self):
-        return self.request.user
+        # Пользователь уже загружен аутентификацией, догружаются только
+        # последние платежи - одним запросом
+        user = self.request.user
+        prefetch_related_objects([user], prefetch_recent_payments())
+        self.check_object_permissions(self.request, user)
+        return user
 
     def get_queryset(self):
-        return User.objects.prefetch_related(
-            "payments", "payments__course", "payments__lesson"
-        ).filter(pk=self.request.user.pk)
+        return User.objects.filter(pk=self.request.user.pk).prefetch_related(
+            prefetch_recent_payments()
+        )
 
 
 class PaymentHistoryView(generics.ListAPIView):
@@ -140,30 +163,93 @@ class PaymentHistoryView(generics.ListAPIView):
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_class = PaymentFilter
     ordering_fields = ["payment_date"]
-    ordering = ["-payment_date"]
+    ordering = ["-payment_date", "id"]
+    pagination_class = PaymentHybridPagination
 
     def get_queryset(self):
-        return Payment.objects.filter(user=self.request.user)
+        return Payment.objects.filter(user=self.request.user).with_titles()
 
 
+@extend_schema(
+    summary="Статистика платежей",
+    description=(
+        "Сумма и количество платежей пользователя: всего, по способам оплаты, "
+        "по дням и по месяцам. Считается по сводкам PaymentRollup"
+    ),
+    tags=["Платежи"],
+    parameters=[
+        OpenApiParameter(
+            name="payment_status",
+            type=OpenApiTypes.STR,
+            enum=[value for value, _ in Payment.PAYMENT_STATUSES],
+            description="Только платежи с этим статусом",
+        ),
+        OpenApiParameter(
+            name="date_from",
+            type=OpenApiTypes.DATE,
+            description="Начало периода (включительно)",
+        ),
+        OpenApiParameter(
+            name="date_to",
+            type=OpenApiTypes.DATE,
+            description="Конец периода (включительно)",
+        ),
+    ],
+)
 class PaymentStatsView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        total = (
-            Payment.objects.filter(user=request.user).aggregate(
-                total_amount=Sum("amount")
-            )["total_amount"]
-            or 0
+        filterset = PaymentRollupFilter(
+            request.query_params,
+            queryset=PaymentRollup.objects.filter(user=request.user, count__gt=0),
         )
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        rollups = filterset.qs.order_by()
+        totals = {"total": Sum("amount"), "count": Sum("count")}
 
+        total = rollups.aggregate(total_amount=Sum("amount"))["total_amount"] or 0
         by_method = (
-            Payment.objects.filter(user=request.user)
-            .values("payment_method")
-            .annotate(total=Sum("amount"), count=Count("id"))
+            rollups.values("payment_method")
+            .annotate(**totals)
+            .order_by("payment_method")
+        )
+        daily = rollups.values("day").annotate(**totals).order_by("day")
+        monthly = (
+            rollups.annotate(month=TruncMonth("day"))
+            .values("month")
+            .annotate(**totals)
+            .order_by("month")
+        )
+
+        return Response(
+            {
+                "total_amount": total,
+                "by_method": by_method,
+                "daily": daily,
+                "monthly": monthly,
+            }
         )
 
-        return Response({"total_amount": total, "by_method": by_method})
+
+@extend_schema(
+    summary="Аналитика выручки",
+    description=(
+        "Выручка платформы по дням, неделям или месяцам с воронкой статусов, "
+        "по курсам и способам оплаты. Только для персонала; данные берутся из "
+        "агрегатов RevenueDaily, которые обновляются каждые 10 минут"
+    ),
+    tags=["Аналитика"],
+    parameters=[RevenueReportQuerySerializer],
+)
+class RevenueAnalyticsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        query = RevenueReportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        return Response(build_revenue_report(**query.validated_data))
 
 
 @extend_schema(
@@ -249,6 +335,9 @@ class StripePaymentCreateView(APIView):
                 item = get_object_or_404(Lesson, id=lesson_id)
                 item_type = "lesson"
 
+            amount = Decimal(str(amount)).quantize(Decimal("0.01"))
+            currency = settings.STRIPE_CURRENCY
+
             # Создаем платеж в нашей системе
             payment = Payment.objects.create(
                 user=request.user,
@@ -259,22 +348,25 @@ class StripePaymentCreateView(APIView):
                 payment_status="pending",
             )
 
-            # Создаем продукт в Stripe
-            product_data = StripeService.create_product(
-                name=item.name, description=item.description
-            )
-
-            # Создаем цену в Stripe
-            price_data = StripeService.create_price(
-                product_id=product_data["id"], amount=amount
-            )
+            # Продукт создается в фоне при сохранении курса или урока, цена
+            # берется из кеша: к Stripe уходит только запрос создания сессии
+            price_id = StripePrice.objects.lookup(item, amount, currency)
+            price_data = None
+            if not price_id:
+                price_data = StripeService.build_price_data(item, amount, currency)
+                transaction.on_commit(
+                    lambda: provision_stripe_price.delay(
+                        item._meta.label, item.pk, str(amount), currency
+                    )
+                )
 
             # Создаем сессию оплаты
             success_url = request.build_absolute_uri(reverse("payment-success"))
             cancel_url = request.build_absolute_uri(reverse("payment-cancel"))
 
             session_data = StripeService.create_checkout_session(
-                price_id=price_data["id"],
+                price_id=price_id,
+                price_data=price_data,
                 success_url=success_url,
                 cancel_url=cancel_url,
                 metadata={
@@ -286,8 +378,8 @@ class StripePaymentCreateView(APIView):
             )
 
             # Обновляем платеж с данными Stripe
-            payment.stripe_product_id = product_data["id"]
-            payment.stripe_price_id = price_data["id"]
+            payment.stripe_product_id = item.stripe_product_id
+            payment.stripe_price_id = price_id
             payment.stripe_session_id = session_data["id"]
             payment.save()
 
@@ -335,6 +427,7 @@ class StripePaymentCreateView(APIView):
             "type": "object",
             "properties": {"error": {"type": "string"}},
         },
+        404: {"description": "Платеж с такой сессией не найден"},
     },
 )
 class StripePaymentStatusView(APIView):
@@ -348,27 +441,48 @@ class StripePaymentStatusView(APIView):
                 {"error": "session_id обязателен"}, status=status.HTTP_400_BAD_REQUEST
             )
 
+        payment = get_object_or_404(
+            Payment, stripe_session_id=session_id, user=request.user
+        )
+        # Статус приходит вебхуком; к Stripe обращаемся, только если
+        # ожидающий платеж давно не обновлялся (вебхук мог потеряться)
+        stale = timezone.now() - timedelta(
+            seconds=settings.STRIPE_STATUS_FALLBACK_SECONDS
+        )
+        if payment.payment_status != "pending" or payment.updated_at > stale:
+            return Response(
+                {
+                    "id": session_id,
+                    "payment_status": (
+                        "paid" if payment.payment_status == "paid" else "unpaid"
+                    ),
+                    "status": SESSION_STATUSES[payment.payment_status],
+                    "amount_total": to_minor_units(payment.amount),
+                    "currency": settings.STRIPE_CURRENCY,
+                    "customer_email": request.user.email,
+                }
+            )
+
         try:
-            # Получаем статус сессии из Stripe
             session_status = StripeService.get_session_status(session_id)
-
-            # Обновляем статус платежа в нашей системе
-            payment = Payment.objects.filter(
-                stripe_session_id=session_id, user=request.user
-            ).first()
-
-            if payment:
-                if session_status["payment_status"] == "paid":
-                    payment.payment_status = "paid"
-                elif session_status["payment_status"] == "unpaid":
-                    payment.payment_status = "failed"
-                payment.save()
-
-            return Response(session_status)
-
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+        if session_status["payment_status"] in ("paid", "no_payment_required"):
+            new_status = "paid"
+        elif session_status["status"] == "expired":
+            new_status = "cancelled"
+        else:
+            new_status = None
+        with transaction.atomic():
+            changed = new_status and Payment.objects.apply_stripe_statuses(
+                {session_id: (new_status, None)}
+            )
+            if not changed:
+                # Следующая прямая проверка - не раньше чем через интервал
+                Payment.objects.filter(pk=payment.pk).update(updated_at=timezone.now())
+        return Response(session_status)
+
 
 @extend_schema(
     summary="Успешная оплата",
@@ -391,23 +505,17 @@ class PaymentSuccessView(APIView):
     def get(self, request, *args, **kwargs):
         session_id = request.query_params.get("session_id")
 
+        # Статус платежа меняет только подписанный вебхук Stripe
+        payment = None
         if session_id:
-            try:
-                # Обновляем статус платежа
-                payment = Payment.objects.filter(
-                    stripe_session_id=session_id, user=request.user
-                ).first()
-
-                if payment:
-                    payment.payment_status = "paid"
-                    payment.save()
-
-                    return Response(
-                        {"message": "Оплата прошла успешно!", "payment_id": payment.id}
-                    )
-            except Exception:
-                pass
+            payment = Payment.objects.filter(
+                stripe_session_id=session_id, user=request.user
+            ).first()
 
+        if payment:
+            return Response(
+                {"message": "Оплата прошла успешно!", "payment_id": payment.id}
+            )
         return Response({"message": "Оплата прошла успешно!"})
 
 
@@ -427,19 +535,115 @@ class PaymentCancelView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        session_id = request.query_params.get("session_id")
+        # Сессия остается открытой до истечения срока: платеж станет
+        # cancelled по событию checkout.session.expired
+        return Response({"message": "Оплата была отменена"})
 
-        if session_id:
-            try:
-                # Обновляем статус платежа
-                payment = Payment.objects.filter(
-                    stripe_session_id=session_id, user=request.user
-                ).first()
-
-                if payment:
-                    payment.payment_status = "cancelled"
-                    payment.save()
-            except Exception:
-                pass
 
-        return Response({"message": "Оплата была отменена"})
+@extend_schema(
+    summary="Вебхук Stripe",
+    description=(
+        "Принимает события checkout.session.* с подписью Stripe-Signature, "
+        "сохраняет их без дубликатов и сразу отвечает; статусы платежей "
+        "обновляются в фоне"
+    ),
+    tags=["Stripe Платежи"],
+    request=None,
+    responses={200: None, 400: None},
+)
+class StripeWebhookView(APIView):
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request, *args, **kwargs):
+        try:
+            events = construct_events(
+                request.body, request.headers.get("Stripe-Signature", "")
+            )
+        except (ValueError, stripe.SignatureVerificationError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if events:
+            StripeEvent.objects.record(events)
+            transaction.on_commit(process_stripe_events.delay)
+        return Response(status=status.HTTP_200_OK)
+
+
+@extend_schema(
+    summary="Начать загрузку по частям",
+    description=(
+        "Создает загрузку аватара или превью курса/урока. Дальше файл "
+        "передается частями через PUT /api/uploads/{id}/"
+    ),
+    tags=["Загрузки"],
+)
+class ChunkedUploadCreateView(generics.CreateAPIView):
+    serializer_class = ChunkedUploadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+
+@extend_schema_view(
+    get=extend_schema(
+        summary="Состояние загрузки",
+        description="Сколько байт уже принято: с этого смещения продолжается загрузка",
+        tags=["Загрузки"],
+    ),
+    put=extend_schema(
+        summary="Передать часть файла",
+        description=(
+            "Тело запроса - байты файла начиная со смещения из заголовка "
+            "Upload-Offset. Последняя часть прикрепляет файл к объекту"
+        ),
+        tags=["Загрузки"],
+        request={"application/offset+octet-stream": OpenApiTypes.BINARY},
+        parameters=[
+            OpenApiParameter(
+                name="Upload-Offset",
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.HEADER,
+                required=True,
+                description="Смещение первого байта части",
+            )
+        ],
+    ),
+    delete=extend_schema(
+        summary="Отменить загрузку", description="Удалить загрузку", tags=["Загрузки"]
+    ),
+)
+class ChunkedUploadDetailView(generics.GenericAPIView):
+    serializer_class = ChunkedUploadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    queryset = ChunkedUpload.objects.none()
+
+    def get_queryset(self):
+        return ChunkedUpload.objects.filter(user=self.request.user)
+
+    def get(self, request, *args, **kwargs):
+        return Response(self.get_serializer(self.get_object()).data)
+
+    def put(self, request, *args, **kwargs):
+        upload = self.get_object()
+        try:
+            offset = int(request.headers["Upload-Offset"])
+        except (KeyError, ValueError):
+            return Response(
+                {"error": "Заголовок Upload-Offset обязателен"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        # Тело читается потоком, request.data не трогаем: иначе DRF
+        # разобрал бы весь запрос в память
+        try:
+            upload = append_chunk(upload, request.stream or BytesIO(), offset)
+        except UploadConflict as conflict:
+            return Response(
+                {"detail": conflict.detail, "offset": conflict.offset},
+                status=conflict.status_code,
+            )
+        return Response(self.get_serializer(upload).data)
+
+    def delete(self, request, *args, **kwargs):
+        discard_upload(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
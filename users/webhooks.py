@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Payment, StripeEvent
+
+# Тип события -> статус платежа; для checkout.session.completed статус
+# зависит от payment_status сессии (см. get_event_status)
+EVENT_STATUSES = {
+    "checkout.session.completed": None,
+    "checkout.session.async_payment_succeeded": "paid",
+    "checkout.session.async_payment_failed": "failed",
+    "checkout.session.expired": "cancelled",
+}
+
+# Статус платежа -> статус сессии Checkout для ответа без запроса к Stripe
+SESSION_STATUSES = {
+    "pending": "open",
+    "paid": "complete",
+    "failed": "complete",
+    "cancelled": "expired",
+}
+
+
+def construct_events(payload, signature):
+    """
+    Проверяет подпись вебхука (STRIPE_WEBHOOK_SECRET) и возвращает
+    несохраненные StripeEvent. События других типов пропускаются.
+    Ошибки подписи и формата - ValueError / stripe.SignatureVerificationError.
+    """
+    if not settings.STRIPE_WEBHOOK_SECRET:
+        raise ValueError("STRIPE_WEBHOOK_SECRET не настроен")
+    event = stripe.Webhook.construct_event(
+        payload, signature, settings.STRIPE_WEBHOOK_SECRET
+    )
+    if event["type"] not in EVENT_STATUSES:
+        return []
+    session = event["data"]["object"]
+    return [
+        StripeEvent(
+            event_id=event["id"],
+            type=event["type"],
+            session_id=session["id"],
+            session_payment_status=session.get("payment_status") or "",
+            payment_intent=session.get("payment_intent") or "",
+            created=datetime.fromtimestamp(event["created"], tz=dt_timezone.utc),
+        )
+    ]
+
+
+def get_event_status(event):
+    """Статус платежа по событию или None, если событие его не меняет"""
+    if event.type == "checkout.session.completed":
+        # Для отложенных способов оплаты сессия завершается неоплаченной,
+        # итог придет отдельным async_payment_* событием
+        if event.session_payment_status in ("paid", "no_payment_required"):
+            return "paid"
+        return None
+    return EVENT_STATUSES.get(event.type)
+
+
+def process_stripe_events(batch_size=None):
+    """
+    Применяет необработанные события к платежам пачками по
+    STRIPE_EVENT_BATCH_SIZE. Пачка блокируется SKIP LOCKED, поэтому
+    параллельные задачи берут разные события. Возвращает число событий.
+    """
+    batch_size = batch_size or settings.STRIPE_EVENT_BATCH_SIZE
+    total = 0
+    while True:
+        with transaction.atomic():
+            events = list(
+                StripeEvent.objects.pending()
+                .select_for_update(skip_locked=True)
+                .order_by("created", "id")[:batch_size]
+            )
+            if not events:
+                return total
+            changes = {}
+            for event in events:
+                new_status = get_event_status(event)
+                if new_status is None:
+                    continue
+                # Оплата сессии окончательна: поздние события ее не отменяют
+                if changes.get(event.session_id, ("",))[0] == "paid":
+                    continue
+                changes[event.session_id] = (new_status, event.payment_intent)
+            if changes:
+                Payment.objects.apply_stripe_statuses(changes)
+            StripeEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+                processed_at=timezone.now()
+            )
+        total += len(events)
+
+
+def purge_stripe_events():
+    """Удаляет обработанные события старше STRIPE_EVENT_RETENTION_DAYS"""
+    horizon = timezone.now() - timedelta(days=settings.STRIPE_EVENT_RETENTION_DAYS)
+    deleted, _ = StripeEvent.objects.filter(processed_at__lt=horizon).delete()
+    return deleted